@@ -0,0 +1,96 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class AsyncDatabase:
+    """Awaitable facade over DatabaseManager.
+
+    Writes go through one dedicated writer thread fed by a queue, so they keep
+    their order and never fight over the SQLite write lock. Reads run on a
+    small executor backed by the pool's reader connections. Every public
+    DatabaseManager method is available as ``await async_db.<method>(...)``.
+    """
+
+    WRITE_METHODS = frozenset({
+        'add_user_mapping',
+        'add_gitlab_event',
+        'save_daily_report',
+        'save_message',
+        'mark_daily_submitted',
+        'add_loom_reminder',
+        'claim_webhook_inbox',
+        'finish_webhook_inbox',
+    })
+
+    def __init__(self, db_manager, readers: int = 4):
+        self.db_manager = db_manager
+        self._readers = readers
+        self._write_queue = queue.Queue()
+        self._writer_thread = None
+        self._read_executor = None
+
+    def start(self):
+        if self._writer_thread is not None:
+            return
+        self._read_executor = ThreadPoolExecutor(max_workers=self._readers, thread_name_prefix='db-reader')
+        self._writer_thread = threading.Thread(target=self._writer_loop, name='db-writer', daemon=True)
+        self._writer_thread.start()
+
+    def stop(self):
+        """Drain pending writes, then stop the threads"""
+        if self._writer_thread is None:
+            return
+        self._write_queue.put(None)
+        self._writer_thread.join()
+        self._writer_thread = None
+        self._read_executor.shutdown(wait=True)
+        self._read_executor = None
+
+    def _writer_loop(self):
+        while True:
+            job = self._write_queue.get()
+            if job is None:
+                return
+            func, args, kwargs, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit_write(self, func, *args, **kwargs) -> Future:
+        future = Future()
+        self._write_queue.put((func, args, kwargs, future))
+        return future
+
+    async def write(self, func, *args, **kwargs):
+        if self._writer_thread is None:
+            self.start()
+        return await asyncio.wrap_future(self.submit_write(func, *args, **kwargs))
+
+    async def read(self, func, *args, **kwargs):
+        if self._read_executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, lambda: func(*args, **kwargs))
+
+    @property
+    def write_queue_depth(self) -> int:
+        return self._write_queue.qsize()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        func = getattr(self.db_manager, name)
+        if not callable(func):
+            return func
+        runner = self.write if name in self.WRITE_METHODS else self.read
+
+        async def method(*args, **kwargs):
+            return await runner(func, *args, **kwargs)
+
+        method.__name__ = name
+        return method
@@ -0,0 +1,84 @@
+# bench_db_pool.py
+# Compares gitlab_events inserts/sec: connect-per-call (old behaviour) vs ConnectionPool.
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from db_pool import ConnectionPool
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS gitlab_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dev TEXT NOT NULL,
+        ts TIMESTAMP NOT NULL,
+        type TEXT NOT NULL,
+        payload_json TEXT NOT NULL
+    )
+'''
+INSERT = "INSERT INTO gitlab_events (dev, ts, type, payload_json) VALUES (?, ?, ?, ?)"
+SELECT = "SELECT * FROM gitlab_events WHERE dev = ? AND ts >= ?"
+
+payload = {
+    "object_kind": "push",
+    "user_username": "jsmith",
+    "project": {"id": 123, "name": "test-project"},
+    "ref": "refs/heads/main",
+    "commits": [{"id": "abc123", "message": "Test commit", "timestamp": "2023-01-01T12:00:00Z"}] * 5
+}
+
+
+def row(i):
+    return (f"dev{i % 10}", datetime.utcnow().isoformat(), "push", json.dumps(payload))
+
+
+def bench_connect_per_call(path):
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+
+    start = time.perf_counter()
+    for i in range(EVENTS):
+        conn = sqlite3.connect(path)
+        conn.execute(INSERT, row(i))
+        conn.commit()
+        conn.close()
+        if i % 10 == 0:
+            conn = sqlite3.connect(path)
+            conn.execute(SELECT, ("dev1", "2000-01-01")).fetchall()
+            conn.close()
+    return EVENTS / (time.perf_counter() - start)
+
+
+def bench_pool(path):
+    pool = ConnectionPool(path)
+    with pool.writer() as conn:
+        conn.execute(SCHEMA)
+
+    start = time.perf_counter()
+    for i in range(EVENTS):
+        with pool.writer() as conn:
+            conn.execute(INSERT, row(i))
+        if i % 10 == 0:
+            with pool.reader() as conn:
+                conn.execute(SELECT, ("dev1", "2000-01-01")).fetchall()
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return EVENTS / elapsed
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        old = bench_connect_per_call(os.path.join(tmp, "old.db"))
+        new = bench_pool(os.path.join(tmp, "pool.db"))
+
+    print(f"Events: {EVENTS} (one read query every 10 inserts)")
+    print(f"connect-per-call: {old:10.0f} events/sec")
+    print(f"connection pool:  {new:10.0f} events/sec")
+    print(f"speedup:          {new / old:10.1f}x")
@@ -0,0 +1,43 @@
+# bench_encryption.py
+# Stored size and throughput of encrypted fields: the old text format (Fernet token, base64'd again,
+# encrypt_text/decrypt_text) vs the binary AES-GCM field (encrypt_field/decrypt_field), for chat-sized texts.
+# Usage: python bench_encryption.py [operations]
+import sys
+import time
+
+from cryptography.fernet import Fernet
+
+from encryption import DatabaseEncryption, field_aad
+
+OPERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+SAMPLES = {
+    "short (20 B)": "/daily fixed the bug",
+    "message (200 B)": "/daily Yesterday: reviewed the parser MR and fixed two edge cases. " * 3,
+    "report (2 KiB)": "Worked on the webhook worker, the retention job and the search index. " * 29,
+}
+
+
+def ops_per_second(func, value):
+    start = time.perf_counter()
+    for _ in range(OPERATIONS):
+        func(value)
+    return OPERATIONS / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    encryption = DatabaseEncryption(direct_key=Fernet.generate_key())
+    aad = field_aad('messages', 'content', 12345)
+    print(f"Operations per measurement: {OPERATIONS}")
+    for name, text in SAMPLES.items():
+        plain = len(text.encode())
+        token = encryption.encrypt_text(text)
+        sealed = encryption.encrypt_field(text, aad)
+        assert encryption.decrypt_text(token) == text and encryption.decrypt_field(sealed, aad) == text
+        fernet_enc = ops_per_second(encryption.encrypt_text, text)
+        fernet_dec = ops_per_second(encryption.decrypt_text, token)
+        aead_enc = ops_per_second(lambda value: encryption.encrypt_field(value, aad), text)
+        aead_dec = ops_per_second(lambda value: encryption.decrypt_field(value, aad), sealed)
+        print(f"{name:16} size: fernet text {len(token):5} B (+{len(token) - plain}), "
+              f"aead blob {len(sealed):5} B (+{len(sealed) - plain}), {len(sealed) / len(token):.0%} of fernet")
+        print(f"{'':16} encrypt/s: fernet {fernet_enc:9.0f}, aead {aead_enc:9.0f} ({aead_enc / fernet_enc:.1f}x)   "
+              f"decrypt/s: fernet {fernet_dec:9.0f}, aead {aead_dec:9.0f} ({aead_dec / fernet_dec:.1f}x)")
@@ -0,0 +1,79 @@
+# bench_gitlab_client.py
+# Merged-MR changed-files lookups against the local GitLab stub:
+# old way (new ClientSession per MR, full /changes payload) vs the pooled, cached GitLabClient.
+# Usage: python bench_gitlab_client.py [lookups] [distinct_mrs] [concurrency] [latency_ms] [fail_rate]
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+
+from gitlab_client import GitLabClient
+from gitlab_stub import changed_files, start_stub
+
+LOOKUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+DISTINCT_MRS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+LATENCY_MS = float(sys.argv[4]) if len(sys.argv) > 4 else 20
+FAIL_RATE = float(sys.argv[5]) if len(sys.argv) > 5 else 0.05
+
+
+async def session_per_call(base_url, project_id, mr_iid):
+    """What server.get_changed_files_count used to do"""
+    async with aiohttp.ClientSession() as session:
+        url = f"{base_url}/projects/{project_id}/merge_requests/{mr_iid}/changes"
+        async with session.get(url, headers={"Private-Token": "bench"}) as resp:
+            if resp.status == 200:
+                data = await resp.json()
+                return len(data.get('changes', []))
+            return 0
+
+
+async def run(lookup, keys):
+    queue = asyncio.Queue()
+    for key in keys:
+        queue.put_nowait(key)
+    wrong = 0
+
+    async def worker():
+        nonlocal wrong
+        while not queue.empty():
+            project_id, mr_iid = queue.get_nowait()
+            wrong += await lookup(project_id, mr_iid) != changed_files(project_id, mr_iid)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return time.perf_counter() - start, wrong
+
+
+async def main():
+    random.seed(1)
+    keys = [(1 + i % 3, random.randrange(DISTINCT_MRS)) for i in range(LOOKUPS)]
+    runner, base_url = await start_stub(latency_ms=LATENCY_MS, fail_rate=FAIL_RATE)
+    counter = runner.app['stats']
+    try:
+        counter['requests'] = 0
+        old_s, old_wrong = await run(lambda p, m: session_per_call(base_url, p, m), keys)
+        old_requests = counter['requests']
+
+        counter['requests'] = 0
+        client = GitLabClient(base_url, "bench", backoff=0.05)
+        new_s, new_wrong = await run(client.merge_request_changes_count, keys)
+        new_requests = counter['requests']
+        stats = client.stats()
+        await client.close()
+    finally:
+        await runner.cleanup()
+
+    print(f"Lookups: {LOOKUPS} over {DISTINCT_MRS * 3} MRs, concurrency {CONCURRENCY}, "
+          f"stub latency {LATENCY_MS:.0f} ms, failure rate {FAIL_RATE:.0%}")
+    print(f"session per call + /changes: {old_s:.2f}s  {LOOKUPS / old_s:.0f} lookups/s  "
+          f"stub requests {old_requests}  wrong counts {old_wrong}")
+    print(f"GitLabClient:                {new_s:.2f}s  {LOOKUPS / new_s:.0f} lookups/s  "
+          f"stub requests {new_requests}  wrong counts {new_wrong}")
+    print(f"client: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+# bench_http_responses.py
+# GET /facts/{user} for a busy developer: bytes on the wire and latency for
+# stdlib json vs orjson, identity vs gzip/brotli, and a 304 revalidation with If-None-Match.
+# Runs in-process against a throwaway database (httpx ASGI transport, no sockets).
+# Needs httpx (in requirments.txt).
+# Usage: python bench_http_responses.py [events] [requests]
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+BATCH = 500
+
+tmp = tempfile.mkdtemp()
+os.environ["DATABASE_FILE"] = os.path.join(tmp, "bench.db")
+os.environ["ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import httpx  # noqa: E402
+    import http_cache  # noqa: E402
+    import server  # noqa: E402
+
+
+def payload(i):
+    if i % 2:
+        return {"object_kind": "merge_request", "user": {"username": "dev0"}, "project": {"name": f"service-{i % 5}"},
+                "object_attributes": {"iid": i, "title": f"Refactor module {i} and update its tests", "state": "opened",
+                                      "action": "update", "source_branch": f"feature/{i}", "target_branch": "main"}}
+    return {"object_kind": "push", "user": {"username": "dev0"}, "project": {"name": f"service-{i % 5}"},
+            "ref": f"refs/heads/feature/{i % 40}",
+            "commits": [{"id": "%040x" % (i * 10 + n), "message": f"Fix edge case {n} in the parser",
+                         "timestamp": "2024-05-01T12:00:00+00:00"} for n in range(4)]}
+
+
+def seed():
+    manager = server.db_manager
+    for offset in range(0, EVENTS, BATCH):
+        manager.insert_gitlab_event_rows([
+            manager.gitlab_event_row("dev0", payload(i), f"2024-05-{1 + i % 28:02d}T{i % 24:02d}:00:00")
+            for i in range(offset, min(offset + BATCH, EVENTS))])
+
+
+async def measure(client, headers):
+    wire, start = 0, time.perf_counter()
+    for _ in range(REQUESTS):
+        response = await client.get("/facts/dev0", params={"since": "2024-05-01", "until": "2024-05-31"},
+                                    headers=headers)
+        await response.aread()
+        wire += response.num_bytes_downloaded
+    return (time.perf_counter() - start) / REQUESTS * 1000, wire / REQUESTS, response
+
+
+async def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed()
+        server.async_db.start()
+    orjson = http_cache.orjson
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            await measure(client, {})  # warm the facts cache
+            results = []
+            http_cache.orjson = None
+            results.append(("json, identity", await measure(client, {"Accept-Encoding": "identity"})))
+            http_cache.orjson = orjson
+            results.append((f"{'orjson' if orjson else 'json'}, identity",
+                            await measure(client, {"Accept-Encoding": "identity"})))
+            results.append((f"{'orjson' if orjson else 'json'}, gzip", await measure(client, {"Accept-Encoding": "gzip"})))
+            results.append((f"{'orjson' if orjson else 'json'}, br/gzip",
+                            await measure(client, {"Accept-Encoding": "br, gzip"})))
+            etag = results[-1][1][2].headers["etag"]
+            results.append(("304 If-None-Match", await measure(client, {"If-None-Match": etag})))
+    server.async_db.stop()
+    server.gitlab_event_writer.close()
+
+    baseline_ms, baseline_bytes = results[0][1][:2]
+    print(f"Events: {EVENTS}, requests per mode: {REQUESTS}, orjson {'on' if orjson else 'not installed'}")
+    for name, (ms, size, response) in results:
+        encoding = response.headers.get("content-encoding", "identity")
+        print(f"{name:22} {response.status_code}  {ms:7.2f} ms  {size / 1024:8.1f} KiB ({size / baseline_bytes:6.1%})  "
+              f"{encoding}  latency saved {baseline_ms - ms:6.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+# bench_inbox_replay.py
+# Durable webhook inbox: fsync-batched append rate, and how fast a restart replays
+# a backlog of acked-but-unprocessed hooks into gitlab_events.
+# Runs against a throwaway database; the GitLab API is stubbed out (no network).
+# Usage: python bench_inbox_replay.py [hooks] [append_batch]
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+HOOKS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+APPEND_BATCH = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+tmp = tempfile.mkdtemp()
+os.environ["DATABASE_FILE"] = os.path.join(tmp, "bench.db")
+os.environ["ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+
+import server  # noqa: E402
+
+
+async def no_changed_files(project_id, mr_iid):
+    return 0
+
+
+def payload(i):
+    if i % 10 == 0:
+        return {
+            "object_kind": "merge_request", "user": {"username": f"dev{i % 5}"},
+            "project": {"id": 1, "name": "service", "path_with_namespace": "team/service"},
+            "object_attributes": {"iid": i, "title": f"MR {i}", "state": "merged", "action": "merge"},
+            "merge_request": {"iid": i, "title": f"MR {i}", "url": f"https://gitlab.example.com/mr/{i}"},
+            "labels": [],
+        }
+    return {
+        "object_kind": "push", "user_username": f"dev{i % 5}", "user": {"username": f"dev{i % 5}"},
+        "project": {"id": 1, "name": "service"}, "ref": "refs/heads/main",
+        "commits": [{"id": "%040x" % i, "message": f"commit {i}", "timestamp": "2024-05-01T12:00:00+00:00"}],
+        "total_commits_count": 1,
+    }
+
+
+def fill_inbox():
+    """Append hooks the way the endpoint does (one durable commit per batch), returns seconds"""
+    bodies = [json.dumps(payload(i)).encode() for i in range(HOOKS)]
+    received_at = "2024-05-01T12:00:00"
+    start = time.perf_counter()
+    for offset in range(0, HOOKS, APPEND_BATCH):
+        server.db_manager.append_webhook_inbox([(received_at, body, None) for body in bodies[offset:offset + APPEND_BATCH]])
+    return time.perf_counter() - start
+
+
+async def replay():
+    server.get_changed_files_count = no_changed_files
+    server.async_db.start()
+    server.webhook_worker.start()
+    start = time.perf_counter()
+    replayed = await server.replay_webhook_inbox(await server.async_db.webhook_inbox_high_water())
+    await server.webhook_worker.stop()
+    server.gitlab_event_writer.close()
+    return replayed, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with contextlib.redirect_stdout(io.StringIO()):
+        append_s = fill_inbox()
+        replayed, replay_s = asyncio.run(replay())
+        with server.db_manager.pool.reader() as conn:
+            left = conn.execute("SELECT COUNT(*) FROM webhook_inbox").fetchone()[0]
+        stored = len(server.db_manager.get_gitlab_events())
+    server.webhook_inbox_writer.close()
+    server.async_db.stop()
+    server.db_manager.close()
+
+    print(f"Hooks: {HOOKS}, append batch {APPEND_BATCH}")
+    print(f"append (fsync per batch): {append_s:.2f}s  {HOOKS / append_s:.0f} hooks/s")
+    print(f"replay into gitlab_events: {replay_s:.2f}s  {replayed / replay_s:.0f} hooks/s")
+    print(f"events stored: {stored} of {HOOKS}; inbox rows left: {left}")
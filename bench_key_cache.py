@@ -0,0 +1,64 @@
+# bench_key_cache.py
+# Start-up cost of password-derived encryption: PBKDF2 every time vs the KeyCache file.
+# The result is the key derivation figure (PBKDF2 vs a verified cache hit); a whole "import server"
+# (what the bot, tools and tests pay) is timed too, but its run-to-run noise is larger than the saving.
+# Usage: python bench_key_cache.py [process_starts]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from encryption import DatabaseEncryption
+from key_cache import KeyCache
+
+STARTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+PASSWORD = "bench-password"
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def process_starts(env):
+    return [timed(lambda: subprocess.run([sys.executable, "-c", "import server; server.gitlab_event_writer.close()"],
+                                         env=env, check=True, stdout=subprocess.DEVNULL)) for _ in range(STARTS)]
+
+
+if __name__ == "__main__":
+    tmp = tempfile.mkdtemp()
+    cache_path = os.path.join(tmp, "keys", "keys.json")
+    os.environ["DB_SALT"] = "bench-salt"
+
+    # The verifier the server keeps in its database: a cached key is used only if it opens it
+    token = DatabaseEncryption(password=PASSWORD).make_verifier()
+
+    def verify(key):
+        return DatabaseEncryption(direct_key=key).check_verifier(token) is not None
+
+    pbkdf2_s = timed(lambda: DatabaseEncryption(password=PASSWORD), 3)
+    miss_s = timed(lambda: DatabaseEncryption(password=PASSWORD, key_cache=KeyCache(cache_path), verify_key=verify))
+    # A fresh KeyCache per call: what a new process sees with the file already written
+    hit_s = timed(lambda: DatabaseEncryption(password=PASSWORD, key_cache=KeyCache(cache_path), verify_key=verify), 20)
+    mode = oct(os.stat(cache_path).st_mode & 0o777)
+
+    env = dict(os.environ, DB_ENCRYPTION_PASSWORD=PASSWORD, DATABASE_FILE=os.path.join(tmp, "bench.db"),
+               ARCHIVE_DIR=os.path.join(tmp, "archive"), PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", "import server; server.gitlab_event_writer.close()"],
+                   env=dict(env, KEY_CACHE_FILE=cache_path), check=True,
+                   stdout=subprocess.DEVNULL)  # creates the database and its key verifier
+    cold = process_starts(dict(env, KEY_CACHE_FILE=""))
+    warm = process_starts(dict(env, KEY_CACHE_FILE=cache_path))
+    spread = max(statistics.pstdev(cold), statistics.pstdev(warm))
+
+    print(f"key derivation: PBKDF2 {pbkdf2_s * 1000:.1f} ms, cache miss {miss_s * 1000:.1f} ms, "
+          f"cache hit {hit_s * 1000:.2f} ms  (cache file mode {mode})")
+    print(f"saved per process start on key derivation: {(pbkdf2_s - hit_s) * 1000:.1f} ms")
+    print(f"import server ({STARTS} starts each): no cache {statistics.mean(cold):.2f}s, "
+          f"cached key {statistics.mean(warm):.2f}s, run-to-run stdev {spread * 1000:.0f} ms")
+    print("  inconclusive: the whole-import difference is within start-up noise; "
+          "the key derivation figure above is the measured saving")
@@ -0,0 +1,125 @@
+# bench_payload_codec.py
+# Size and read/write cost of gitlab_events payloads: plain JSON text vs zlib vs zlib + dictionary.
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from payload_codec import PayloadCodec, build_dictionary, FORMAT_JSON
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+random.seed(42)
+
+
+def project(pid):
+    name = f"service-{pid}"
+    return {
+        "id": pid, "name": name, "description": "Backend service", "web_url": f"https://gitlab.example.com/team/{name}",
+        "avatar_url": None, "git_ssh_url": f"git@gitlab.example.com:team/{name}.git",
+        "git_http_url": f"https://gitlab.example.com/team/{name}.git", "namespace": "team", "visibility_level": 0,
+        "path_with_namespace": f"team/{name}", "default_branch": "main", "ci_config_path": None,
+        "homepage": f"https://gitlab.example.com/team/{name}", "url": f"git@gitlab.example.com:team/{name}.git",
+        "ssh_url": f"git@gitlab.example.com:team/{name}.git", "http_url": f"https://gitlab.example.com/team/{name}.git"
+    }
+
+
+def user(i):
+    return {"id": i, "name": f"Developer {i}", "username": f"dev{i}", "avatar_url": None, "email": f"dev{i}@example.com"}
+
+
+def push_payload(i):
+    p = project(i % 7)
+    commits = [{
+        "id": "%040x" % random.getrandbits(160), "message": f"Fix issue #{random.randint(1, 999)} in handler\n\nDetails",
+        "title": f"Fix issue #{random.randint(1, 999)} in handler", "timestamp": "2024-05-01T12:00:00+00:00",
+        "url": f"{p['web_url']}/-/commit/{random.getrandbits(64):x}",
+        "author": {"name": f"Developer {i % 5}", "email": f"dev{i % 5}@example.com"},
+        "added": [], "modified": [f"src/module_{random.randint(1, 50)}.py"], "removed": []
+    } for _ in range(random.randint(1, 8))]
+    u = user(i % 5)
+    return {
+        "object_kind": "push", "event_name": "push", "before": "%040x" % random.getrandbits(160),
+        "after": "%040x" % random.getrandbits(160), "ref": "refs/heads/feature-%d" % (i % 13),
+        "checkout_sha": "%040x" % random.getrandbits(160), "user_id": u["id"], "user_name": u["name"],
+        "user_username": u["username"], "user_email": u["email"], "user_avatar": None, "project_id": p["id"],
+        "project": p, "commits": commits, "total_commits_count": len(commits),
+        "repository": {"name": p["name"], "url": p["url"], "description": p["description"], "homepage": p["homepage"],
+                       "git_http_url": p["git_http_url"], "git_ssh_url": p["git_ssh_url"], "visibility_level": 0}
+    }
+
+
+def merge_request_payload(i):
+    p = project(i % 7)
+    u = user(i % 5)
+    return {
+        "object_kind": "merge_request", "event_type": "merge_request", "user": u, "project": p,
+        "object_attributes": {
+            "id": 1000 + i, "iid": i, "title": f"Feature {i}: improve reporting", "description": "Long description " * 5,
+            "state": "opened", "action": random.choice(["open", "update", "merge"]), "source_branch": f"feature-{i % 13}",
+            "target_branch": "main", "source_project_id": p["id"], "target_project_id": p["id"], "author_id": u["id"],
+            "assignee_id": u["id"], "assignee_ids": [u["id"]], "reviewer_ids": [], "merge_status": "can_be_merged",
+            "created_at": "2024-05-01 12:00:00 UTC", "updated_at": "2024-05-01 13:00:00 UTC", "draft": False,
+            "work_in_progress": False, "url": f"{p['web_url']}/-/merge_requests/{i}",
+            "last_commit": {"id": "%040x" % random.getrandbits(160), "message": "Update", "timestamp": "2024-05-01T12:00:00+00:00",
+                            "author": {"name": u["name"], "email": u["email"]}}
+        },
+        "labels": [{"id": 1, "title": "feature", "color": "#428BCA", "project_id": p["id"], "type": "ProjectLabel"}],
+        "changes": {"updated_at": {"previous": "2024-05-01 12:00:00 UTC", "current": "2024-05-01 13:00:00 UTC"}},
+        "assignees": [u], "reviewers": []
+    }
+
+
+def sample_payloads(n):
+    return [json.dumps(push_payload(i) if i % 3 else merge_request_payload(i)) for i in range(n)]
+
+
+def measure(codec, payloads, plain=False):
+    start = time.perf_counter()
+    encoded = [(p, FORMAT_JSON) if plain else codec.encode(p) for p in payloads]
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for blob, payload_format in encoded:
+        codec.decode(blob, payload_format)
+    decode_s = time.perf_counter() - start
+    size = sum(len(blob.encode() if isinstance(blob, str) else blob) for blob, _ in encoded)
+    return encoded, size, encode_s, decode_s
+
+
+def db_cost(encoded):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE gitlab_events (id INTEGER PRIMARY KEY, payload_json TEXT NOT NULL, payload_format INTEGER)")
+        start = time.perf_counter()
+        for i in range(0, len(encoded), 100):
+            conn.executemany("INSERT INTO gitlab_events (payload_json, payload_format) VALUES (?, ?)", encoded[i:i + 100])
+            conn.commit()
+        insert_s = time.perf_counter() - start
+        conn.execute("VACUUM")
+        conn.close()
+        return os.path.getsize(path), insert_s
+
+
+if __name__ == "__main__":
+    payloads = sample_payloads(EVENTS)
+    training = sample_payloads(500)
+
+    variants = [
+        ("plain JSON text", PayloadCodec(), True),
+        ("zlib", PayloadCodec(), False),
+        ("zlib + seed dictionary", PayloadCodec({1: build_dictionary()}), False),
+        ("zlib + trained dictionary", PayloadCodec({1: build_dictionary(training)}), False),
+    ]
+
+    print(f"Payloads: {EVENTS}, avg JSON size {sum(map(len, payloads)) / EVENTS:.0f} bytes")
+    print(f"{'variant':28} {'bytes/row':>10} {'ratio':>7} {'enc us':>8} {'dec us':>8} {'db KB':>8} {'ins rows/s':>11}")
+    baseline = None
+    for name, codec, plain in variants:
+        encoded, size, encode_s, decode_s = measure(codec, payloads, plain)
+        db_size, insert_s = db_cost(encoded)
+        baseline = baseline or size
+        print(f"{name:28} {size / EVENTS:10.0f} {baseline / size:6.1f}x {encode_s / EVENTS * 1e6:8.1f} "
+              f"{decode_s / EVENTS * 1e6:8.1f} {db_size / 1024:8.0f} {EVENTS / insert_s:11.0f}")
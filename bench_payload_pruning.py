@@ -0,0 +1,126 @@
+# bench_payload_pruning.py
+# DB size and insert throughput for realistic push/MR/pipeline hooks:
+# stored verbatim vs pruned by payload_profiles.py (and pruned + raw archive).
+# Each mode writes to its own throwaway database.
+# Usage: python bench_payload_pruning.py [events]
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+BATCH = 200
+
+tmp = tempfile.mkdtemp()
+os.environ["DATABASE_FILE"] = os.path.join(tmp, "bench.db")
+os.environ["ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import server  # noqa: E402
+
+
+def project(i):
+    return {
+        "id": 1 + i % 3, "name": f"service-{i % 3}", "description": "Backend service " * 8,
+        "web_url": f"https://gitlab.example.com/team/service-{i % 3}", "avatar_url": None,
+        "git_ssh_url": f"git@gitlab.example.com:team/service-{i % 3}.git",
+        "git_http_url": f"https://gitlab.example.com/team/service-{i % 3}.git",
+        "namespace": "team", "visibility_level": 0, "path_with_namespace": f"team/service-{i % 3}",
+        "default_branch": "main", "ci_config_path": "", "homepage": "", "url": "", "ssh_url": "", "http_url": "",
+    }
+
+
+def user(i):
+    return {"id": i % 7, "name": f"Dev {i % 7}", "username": f"dev{i % 7}",
+            "avatar_url": f"https://gitlab.example.com/uploads/-/system/user/avatar/{i % 7}/avatar.png",
+            "email": f"dev{i % 7}@example.com"}
+
+
+def commit(i, n):
+    return {
+        "id": "%040x" % (i * 100 + n), "message": f"Fix thing {n}\n\nLonger explanation of the change. " * 3,
+        "title": f"Fix thing {n}", "timestamp": "2024-05-01T12:00:00+00:00",
+        "url": f"https://gitlab.example.com/team/service/-/commit/{i * 100 + n:040x}",
+        "author": {"name": f"Dev {i % 7}", "email": f"dev{i % 7}@example.com"},
+        "added": [f"src/new_{k}.py" for k in range(3)],
+        "modified": [f"src/module_{k}/file_{k}.py" for k in range(12)],
+        "removed": [],
+    }
+
+
+def payload(i):
+    kind = i % 3
+    if kind == 0:
+        return {
+            "object_kind": "push", "event_name": "push", "before": "0" * 40, "after": "%040x" % i,
+            "ref": "refs/heads/main", "checkout_sha": "%040x" % i, "user_id": i % 7,
+            "user_name": f"Dev {i % 7}", "user_username": f"dev{i % 7}", "user_email": "",
+            "user_avatar": "https://gitlab.example.com/avatar.png", "project_id": 1 + i % 3,
+            "project": project(i), "repository": {"name": "service", "url": "", "description": "x" * 200,
+                                                  "homepage": "", "git_http_url": "", "git_ssh_url": ""},
+            "commits": [commit(i, n) for n in range(8)], "total_commits_count": 8,
+        }
+    if kind == 1:
+        return {
+            "object_kind": "merge_request", "event_type": "merge_request", "user": user(i), "project": project(i),
+            "object_attributes": {
+                "id": i, "iid": i, "title": f"MR {i}", "description": "Change description. " * 40,
+                "state": "opened", "action": "update", "source_branch": f"feature/{i}", "target_branch": "main",
+                "url": f"https://gitlab.example.com/team/service/-/merge_requests/{i}", "author_id": i % 7,
+                "created_at": "2024-05-01 12:00:00 UTC", "updated_at": "2024-05-01 13:00:00 UTC",
+                "merge_status": "can_be_merged", "source": project(i), "target": project(i),
+                "last_commit": commit(i, 0),
+            },
+            "labels": [{"id": 1, "title": "backend", "color": "#428BCA", "description": "Backend work " * 5}],
+            "changes": {"updated_at": {"previous": "2024-05-01 12:00:00 UTC", "current": "2024-05-01 13:00:00 UTC"},
+                        "description": {"previous": "Old text. " * 40, "current": "Change description. " * 40}},
+            "repository": {"name": "service", "url": "", "description": "x" * 200, "homepage": ""},
+        }
+    return {
+        "object_kind": "pipeline", "user": user(i), "project": project(i),
+        "object_attributes": {"id": i, "ref": "main", "tag": False, "sha": "%040x" % i, "status": "success",
+                              "source": "push", "created_at": "2024-05-01 12:00:00 UTC",
+                              "finished_at": "2024-05-01 12:10:00 UTC", "duration": 600,
+                              "stages": ["build", "test", "deploy"], "variables": []},
+        "commit": commit(i, 0),
+        "builds": [{"id": i * 10 + b, "stage": "test", "name": f"job {b}", "status": "success",
+                    "created_at": "2024-05-01 12:00:00 UTC", "started_at": "2024-05-01 12:01:00 UTC",
+                    "finished_at": "2024-05-01 12:05:00 UTC", "duration": 240.5, "when": "on_success",
+                    "manual": False, "allow_failure": False, "user": user(i),
+                    "runner": {"id": 5, "description": "shared runner", "active": True, "is_shared": True,
+                               "tags": ["docker", "linux"]},
+                    "artifacts_file": {"filename": None, "size": None}, "environment": None}
+                   for b in range(10)],
+    }
+
+
+def run(prune, raw_archive):
+    path = os.path.join(tmp, f"prune_{int(prune)}_{int(raw_archive)}.db")
+    server.DATABASE_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = server.DatabaseManager()
+    manager.prune_payloads = prune
+    manager.raw_payload_archive = raw_archive
+    payloads = [payload(i) for i in range(EVENTS)]
+    start = time.perf_counter()
+    for offset in range(0, EVENTS, BATCH):
+        manager.insert_gitlab_event_rows([
+            manager.gitlab_event_row(f"dev{i % 7}", payloads[i], "2024-05-01T12:00:00")
+            for i in range(offset, min(offset + BATCH, EVENTS))])
+    elapsed = time.perf_counter() - start
+    manager.checkpoint()
+    manager.close()
+    return elapsed, os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    print(f"Events: {EVENTS} (push / merge_request / pipeline, one third each)")
+    baseline = None
+    for name, prune, raw_archive in (("verbatim", False, False), ("pruned", True, False),
+                                     ("pruned + raw archive", True, True)):
+        elapsed, size = run(prune, raw_archive)
+        baseline = baseline or size
+        print(f"{name:22} {size / 1024 / 1024:7.2f} MiB ({size / baseline:6.1%})  "
+              f"{EVENTS / elapsed:8.0f} inserts/s")
@@ -0,0 +1,118 @@
+# bench_webhook_ingest.py
+# Webhook ack latency (p50/p95/p99) with a slow GitLab API behind merged MRs.
+# Runs the app in-process over ASGI against a throwaway database.
+# Needs httpx (in requirments.txt).
+# Usage: python bench_webhook_ingest.py [hooks] [concurrency] [gitlab_delay_ms]
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+HOOKS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+GITLAB_DELAY_MS = float(sys.argv[3]) if len(sys.argv) > 3 else 300
+
+tmp = tempfile.mkdtemp()
+os.environ["DATABASE_FILE"] = os.path.join(tmp, "bench.db")
+os.environ["ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+
+import httpx  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import server  # noqa: E402
+
+
+async def slow_changed_files_count(project_id, mr_iid):
+    """Stands in for the GitLab /changes call"""
+    await asyncio.sleep(GITLAB_DELAY_MS / 1000)
+    return 100
+
+
+def payload(i):
+    if i % 4 == 0:
+        return {
+            "object_kind": "merge_request", "user": {"username": f"dev{i % 5}"},
+            "project": {"id": 1, "name": "service", "path_with_namespace": "team/service"},
+            "object_attributes": {"iid": i, "title": f"MR {i}", "state": "merged", "action": "merge"},
+            "merge_request": {"iid": i, "title": f"MR {i}", "url": f"https://gitlab.example.com/mr/{i}"},
+            "labels": [],
+        }
+    return {
+        "object_kind": "push", "user_username": f"dev{i % 5}", "user": {"username": f"dev{i % 5}"},
+        "project": {"id": 1, "name": "service"}, "ref": "refs/heads/main",
+        "commits": [{"id": "%040x" % i, "message": f"commit {i}", "timestamp": "2024-05-01T12:00:00+00:00"}],
+        "total_commits_count": 1,
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def handler_latencies(count):
+    """Endpoint coroutine alone, without HTTP client and middleware overhead"""
+    latencies = []
+    for i in range(count):
+        body = json.dumps(payload(HOOKS + i)).encode()
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+        start = time.perf_counter()
+        await server.gitlab_webhook(request)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0)
+    return latencies
+
+
+async def run():
+    server.get_changed_files_count = slow_changed_files_count
+    server.async_db.start()
+    server.webhook_worker.start()
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(HOOKS):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench") as client:
+        async def sender():
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post("/gitlab/webhook", json=payload(i))
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 202, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(CONCURRENCY)))
+        ack_s = time.perf_counter() - start
+        await server.webhook_worker.stop(timeout=120)
+        drain_s = time.perf_counter() - start
+    server.webhook_worker.start()
+    handler = await handler_latencies(HOOKS)
+    await server.webhook_worker.stop(timeout=120)
+    server.webhook_inbox_writer.close()
+    server.gitlab_event_writer.close()
+    return latencies, handler, ack_s, drain_s
+
+
+if __name__ == "__main__":
+    with contextlib.redirect_stdout(io.StringIO()):
+        latencies, handler, ack_s, drain_s = asyncio.run(run())
+        worker_stats = server.webhook_worker.stats()
+        stored = len(server.db_manager.get_gitlab_events())
+    server.db_manager.close()
+
+    print(f"Hooks: {HOOKS}, concurrency {CONCURRENCY}, simulated GitLab API delay {GITLAB_DELAY_MS:.0f} ms on merged MRs")
+    for name, values in (("ack over HTTP", latencies), ("endpoint only", handler)):
+        print(f"{name:14} ms  p50 {percentile(values, 50):.3f}  p95 {percentile(values, 95):.3f}  "
+              f"p99 {percentile(values, 99):.3f}  max {max(values):.3f}  mean {statistics.mean(values):.3f}")
+    print(f"acked {HOOKS / ack_s:.0f} hooks/s; worker drained in {drain_s:.2f}s; events stored: {stored} of {2 * HOOKS}")
+    print(f"worker: {worker_stats}")
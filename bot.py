@@ -11,7 +11,6 @@ from config import SERVER_URL, BOT_TOKEN, DATABASE_FILE
 from telegram.ext import ChatMemberHandler
 from typing import Dict, List, Optional, Tuple, Any
 from server import db_manager, bot_manager
-import sqlite3
 
 init(autoreset=True)
 
@@ -392,6 +391,41 @@ class TelegramBotMonitor:
             print(f"{Fore.RED}❌ Error in get_facts_command: {e}")
             await update.message.reply_text("❌ Error retrieving facts")
 
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Full-text search over chat and /daily reports: /search [@user] words"""
+        args = list(context.args)
+        user = args.pop(0)[1:] if args and args[0].startswith('@') else None
+        if not args:
+            await update.message.reply_text("❌ Usage: /search [@username] words")
+            return
+
+        params = {"q": " ".join(args), "limit": 10}
+        if user:
+            params["user"] = user
+        try:
+            async with self.session.get(
+                    f"{SERVER_URL}/search",
+                    params=params,
+                    timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                if response.status != 200:
+                    await update.message.reply_text(f"❌ Search failed: {response.status}")
+                    return
+                results = (await response.json())["results"]
+        except Exception as e:
+            print(f"{Fore.RED}❌ Error in search_command: {e}")
+            await update.message.reply_text("❌ Error while searching")
+            return
+
+        if not results:
+            await update.message.reply_text(f"🔎 Nothing found for: {params['q']}")
+            return
+        lines = [f"🔎 Results for: {params['q']}\n"]
+        for result in results:
+            icon = "📝" if result["source"] == "daily_report" else "💬"
+            lines.append(f"{icon} {result['user'] or '?'} · {result['date'][:10]}\n   {result['snippet']}")
+        await update.message.reply_text("\n".join(lines))
+
     def format_facts_response(self, facts: dict) -> str:
         response = f"📊 Активность в гитлабе для разработчика {facts['username']}\n"
         response += f"⏰ За последние {facts['period_hours']} часов\n\n"
@@ -567,25 +601,22 @@ class TelegramBotMonitor:
 
 
     async def get_gitlab_summary_for_date(self, username: str, date: str):
-        """Get GitLab activity for a specific date"""
+        """Get GitLab activity for a specific date (a local day in the developer's timezone)"""
         try:
-            # We'll get 48 hours of data to ensure we capture the specific date
+            # The server reads exactly that local day
             async with self.session.get(
-                    f"{SERVER_URL}/facts/{username}?hours=48",
+                    f"{SERVER_URL}/facts/{username}",
+                    params={'date': date},
                     timeout=aiohttp.ClientTimeout(total=30)
             ) as response:
                 if response.status == 200:
                     data = await response.json()
                     if data.get('status') == 'success':
-                        # Filter activities for the specific date
-                        daily_activities = [
-                            activity for activity in data['facts']['activities']
-                            if activity['timestamp'].startswith(date)
-                        ]
+                        facts = data['facts']
                         return {
-                            'total_events': len(daily_activities),
-                            'activities': daily_activities,
-                            'event_summary': self._summarize_events(daily_activities)
+                            'total_events': facts['total_events'],
+                            'activities': facts['activities'],
+                            'event_summary': facts['event_summary']
                         }
             return None
         except Exception as e:
@@ -638,20 +669,9 @@ class TelegramBotMonitor:
 
             if not telegram_id:
                 # Fallback: try to find user ID from messages table
-                conn = sqlite3.connect(DATABASE_FILE)
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT DISTINCT user_id FROM messages 
-                    WHERE (username = ? OR first_name LIKE ?) 
-                    ORDER BY timestamp DESC 
-                    LIMIT 1
-                """, (dev, f"%{dev}%"))
-                result = cursor.fetchone()
-                conn.close()
-
-                if result:
-                    telegram_id = result[0]
-                else:
+                telegram_id = db_manager.find_telegram_id_in_messages(dev)
+
+                if not telegram_id:
                     print(f"{Fore.YELLOW}⚠️ Could not find Telegram ID for {dev}")
                     return
 
@@ -675,14 +695,6 @@ class TelegramBotMonitor:
         except Exception as e:
             print(f"{Fore.RED}❌ Error sending reminder to {dev}: {e}")
 
-    def _summarize_events(self, activities):
-        """Summarize events by type"""
-        summary = {}
-        for activity in activities:
-            event_type = activity['type']
-            summary[event_type] = summary.get(event_type, 0) + 1
-        return summary
-
     def format_morning_digest(self, username: str, date: str, gitlab_data: dict, timesheet_data: dict) -> str:
         """Format the morning digest message"""
         try:
@@ -740,6 +752,7 @@ class TelegramBotMonitor:
         application.add_handler(CommandHandler("configure_digest", self.configure_digest_command))
         application.add_handler(CommandHandler("list_digests", self.list_digests_command))
         application.add_handler(CommandHandler("morning_digest", self.morning_digest_command))
+        application.add_handler(CommandHandler("search", self.search_command))
         application.add_handler(ChatMemberHandler(self.chat_member_handler, ChatMemberHandler.CHAT_MEMBER))
         application.add_handler(CommandHandler("daily", self.daily_command))
         db_manager.add_user_mapping("root", 444086551)
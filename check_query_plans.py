@@ -0,0 +1,97 @@
+# check_query_plans.py
+# Asserts that hot-path queries are served by their index (EXPLAIN QUERY PLAN).
+# Usage: python check_query_plans.py   (uses a throwaway database, exits 1 on failure)
+import os
+import sys
+import tempfile
+
+# (name, query, params, index the plan must use; "INTEGER PRIMARY KEY" for a rowid search)
+PLAN_CHECKS = [
+    ("daily message by telegram id",
+     "SELECT message_id, content, timestamp, message_row_id FROM daily_messages "
+     "WHERE user_id = ? AND local_date = ? ORDER BY timestamp DESC LIMIT 1",
+     (1, "2024-01-01"), "idx_daily_messages_user_date"),
+    ("daily message by chat username",
+     "SELECT message_id, content, timestamp, message_row_id FROM daily_messages "
+     "WHERE username = ? AND local_date = ? ORDER BY timestamp DESC LIMIT 1",
+     ("dev", "2024-01-01"), "idx_daily_messages_username_date"),
+    ("daily message by chat username (encrypted, blind index)",
+     "SELECT message_id, content, timestamp, message_row_id FROM daily_messages "
+     "WHERE username_bidx = ? AND local_date = ? ORDER BY timestamp DESC LIMIT 1",
+     ("0" * 32, "2024-01-01"), "idx_daily_messages_username_bidx_date"),
+    ("telegram id of a developer (encrypted, blind index)",
+     "SELECT telegram_id FROM user_mapping WHERE gitlab_username_bidx = ?",
+     ("0" * 32,), "idx_user_mapping_gitlab_bidx"),
+    ("telegram id from chat messages by username",
+     "SELECT user_id FROM messages WHERE username = ? ORDER BY timestamp DESC LIMIT 1",
+     ("dev",), "idx_messages_username"),
+    ("telegram id from chat messages by username (encrypted, blind index)",
+     "SELECT user_id FROM messages WHERE username_bidx = ? ORDER BY timestamp DESC LIMIT 1",
+     ("0" * 32,), "idx_messages_username_bidx"),
+    ("gitlab events of a developer in a range",
+     "SELECT id FROM gitlab_events WHERE dev = ? AND ts_epoch >= ? AND ts_epoch < ?",
+     ("dev", 1700000000, 1700086400), "idx_gitlab_dev_epoch"),
+    ("facts page after a keyset cursor",
+     "SELECT id FROM gitlab_events WHERE dev = ? AND ts_epoch >= ? "
+     "AND (ts_epoch < ? OR (ts_epoch = ? AND id < ?)) ORDER BY ts_epoch DESC, id DESC LIMIT ?",
+     ("dev", 1700000000, 1700086400, 1700086400, 10, 200), "idx_gitlab_dev_epoch"),
+    ("one local day of a developer (digest highlights)",
+     "SELECT ts, type, description FROM gitlab_events WHERE dev = ? AND local_date = ? ORDER BY ts_epoch DESC LIMIT ?",
+     ("dev", "2024-01-01", 3), "idx_gitlab_dev_local_date"),
+    ("gitlab events of everyone in a range",
+     "SELECT id FROM gitlab_events WHERE ts_epoch >= ? AND ts_epoch < ?",
+     (1700000000, 1700086400), "idx_gitlab_epoch"),
+    ("facts cache refresh above a watermark",
+     "SELECT id FROM gitlab_events WHERE id > ? AND +dev = ? AND +ts_epoch >= ?",
+     (1000, "dev", 1700000000), "INTEGER PRIMARY KEY"),
+    ("webhook redelivery lookup",
+     "SELECT id FROM gitlab_events WHERE delivery_key = ?",
+     ("uuid:00000000-0000-0000-0000-000000000000",), "idx_gitlab_delivery_key"),
+]
+
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def idle_facts_check(db_manager):
+    """A cached repeat query for a user with no new events must start its rowid range at MAX(id),
+    not at the user's last event (otherwise it scans everything written since)"""
+    if not db_manager.facts_cache.enabled:
+        return True
+    push = {"object_kind": "push", "user": {"username": "busy"}, "project": {"name": "p"},
+            "ref": "refs/heads/main", "commits": []}
+    db_manager.insert_gitlab_event_rows([db_manager.gitlab_event_row("busy", push) for _ in range(3)])
+    db_manager.get_facts_for_user("idle")
+    db_manager.get_facts_for_user("idle")
+    watermark = db_manager.facts_cache.peek(("idle", "hours", 24)).watermark
+    max_id = db_manager._max_event_id()
+    ok = watermark == max_id
+    print(f"{'OK  ' if ok else 'FAIL'} idle user's cached facts refresh above MAX(id): watermark {watermark}, MAX(id) {max_id}")
+    return ok
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_FILE"] = os.path.join(tmp, "plans.db")
+    os.environ["ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+
+    from server import db_manager, gitlab_event_writer
+
+    failed = 0
+    try:
+        with db_manager.pool.reader() as conn:
+            for name, sql, params, index in PLAN_CHECKS:
+                plan = query_plan(conn, sql, params)
+                ok = any(f"USING {kind}{index}" in step for step in plan for kind in ("INDEX ", "COVERING INDEX ", ""))
+                failed += not ok
+                print(f"{'OK  ' if ok else 'FAIL'} {name}: {' | '.join(plan)}")
+        failed += not idle_facts_check(db_manager)
+    finally:
+        gitlab_event_writer.close()
+        db_manager.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,17 @@
 # check_database.py
 import sqlite3
-import json
+from payload_codec import PayloadCodec
 
 # Connect to the database
 conn = sqlite3.connect('messages.db')  # Replace with your actual DB file
 cursor = conn.cursor()
 
+# Payloads may be compressed; load the dictionaries needed to decode them
+cursor.execute("SELECT id, dictionary FROM payload_dictionaries")
+codec = PayloadCodec(dict(cursor.fetchall()))
+
 # Query the gitlab_events table
-cursor.execute("SELECT * FROM gitlab_events ORDER BY id DESC LIMIT 5")
+cursor.execute("SELECT id, dev, ts, type, payload_json, payload_format FROM gitlab_events ORDER BY id DESC LIMIT 5")
 rows = cursor.fetchall()
 
 for row in rows:
@@ -15,7 +19,10 @@ for row in rows:
     print(f"Dev: {row[1]}")
     print(f"Timestamp: {row[2]}")
     print(f"Type: {row[3]}")
-    print(f"Payload: {json.loads(row[4])}")
+    try:
+        print(f"Payload: {codec.decode_json(row[4], row[5])}")
+    except ValueError as e:
+        print(f"Payload: <not decodable: {e}>")
     print("-" * 50)
 
-conn.close()
\ No newline at end of file
+conn.close()
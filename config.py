@@ -21,6 +21,47 @@ EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
 DB_ENCRYPTION_KEY = os.getenv('DB_ENCRYPTION_KEY')
 DB_ENCRYPTION_PASSWORD = os.getenv('DB_ENCRYPTION_PASSWORD')
 DB_SALT = os.getenv('DB_SALT')
+# The key being rotated away from: still accepted for reads until `manage_db.py rotate-key` re-encrypts its data
+DB_PREVIOUS_ENCRYPTION_KEY = os.getenv('DB_PREVIOUS_ENCRYPTION_KEY')
+DB_PREVIOUS_ENCRYPTION_PASSWORD = os.getenv('DB_PREVIOUS_ENCRYPTION_PASSWORD')
+DB_PREVIOUS_SALT = os.getenv('DB_PREVIOUS_SALT')  # defaults to DB_SALT
+# Private (0600) file caching password-derived keys between process starts; empty disables.
+# Entries are keyed by salt, not password: change the password via DB_PREVIOUS_ENCRYPTION_PASSWORD (or delete the file)
+KEY_CACHE_FILE = os.getenv("KEY_CACHE_FILE", os.path.join(os.path.expanduser("~"), ".cache", "jarency", "keys.json"))
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", 4))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16384))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 256 * 1024 * 1024))
+GITLAB_EVENT_BATCH_SIZE = int(os.getenv("GITLAB_EVENT_BATCH_SIZE", 200))
+GITLAB_EVENT_FLUSH_MS = float(os.getenv("GITLAB_EVENT_FLUSH_MS", 20))
+# A failed batch write is retried with exponential backoff before rows are written one by one
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", 3))
+WRITE_BEHIND_RETRY_MS = float(os.getenv("WRITE_BEHIND_RETRY_MS", 100))
+# Strip webhook payloads to their per-kind profile (payload_profiles.py) before storage;
+# the raw archive keeps the untouched original next to the pruned copy
+GITLAB_PAYLOAD_PRUNING = os.getenv("GITLAB_PAYLOAD_PRUNING", "true").lower() == "true"
+GITLAB_RAW_PAYLOAD_ARCHIVE = os.getenv("GITLAB_RAW_PAYLOAD_ARCHIVE", "false").lower() == "true"
+# Webhooks are acked immediately and processed by this many async workers
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 16))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 10000))
+# Durable inbox: hooks are fsynced in small batches before the 202 ack
+WEBHOOK_INBOX_FLUSH_MS = float(os.getenv("WEBHOOK_INBOX_FLUSH_MS", 2))
+WEBHOOK_INBOX_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_INBOX_MAX_ATTEMPTS", 5))
+# Inbox entries left behind while running (failed attempt, full queue) are resubmitted this often
+WEBHOOK_INBOX_SWEEP_SECONDS = float(os.getenv("WEBHOOK_INBOX_SWEEP_SECONDS", 60))
+# Recently seen delivery keys kept in memory in front of the unique index
+WEBHOOK_DEDUP_CACHE_SIZE = int(os.getenv("WEBHOOK_DEDUP_CACHE_SIZE", 50000))
+# (user, window) facts kept in memory and refreshed from new events only; 0 disables
+FACTS_CACHE_SIZE = int(os.getenv("FACTS_CACHE_SIZE", 256))
+# gzip (brotli with brotli-asgi installed) for responses of at least HTTP_COMPRESSION_MIN_SIZE bytes;
+# HTTP_GZIP_LEVEL trades ratio for CPU (try levels with bench_http_responses.py)
+HTTP_COMPRESSION = os.getenv("HTTP_COMPRESSION", "true").lower() == "true"
+HTTP_COMPRESSION_MIN_SIZE = int(os.getenv("HTTP_COMPRESSION_MIN_SIZE", 1024))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", 5))
+# Rows older than RETENTION_DAYS move to per-month files in ARCHIVE_DIR
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 180))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+RETENTION_TIME = os.getenv("RETENTION_TIME", "03:30")
+INCREMENTAL_VACUUM_PAGES = int(os.getenv("INCREMENTAL_VACUUM_PAGES", 2000))
 # Logging configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FILE = os.getenv("LOG_FILE", "logs/bot.log")
@@ -51,4 +92,9 @@ USER_MORNING_DIGEST = {
 
 GITLAB_URL = os.getenv("GITLAB_URL")
 GITLAB_TOKEN = os.getenv("GITLAB_TOKEN")
-N_CHANGED_FILES =os.getenv("N_CHANGED_FILES")
+N_CHANGED_FILES = int(os.getenv("N_CHANGED_FILES", 20))
+# Shared GitLab API client: connections per host, retries, request timeout (s), MR lookup cache TTL (s)
+GITLAB_MAX_CONNECTIONS_PER_HOST = int(os.getenv("GITLAB_MAX_CONNECTIONS_PER_HOST", 8))
+GITLAB_API_RETRIES = int(os.getenv("GITLAB_API_RETRIES", 3))
+GITLAB_API_TIMEOUT = float(os.getenv("GITLAB_API_TIMEOUT", 15))
+GITLAB_MR_CACHE_TTL = float(os.getenv("GITLAB_MR_CACHE_TTL", 600))
@@ -0,0 +1,121 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections: one writer plus a small pool of readers.
+
+    SQLite allows a single writer at a time anyway, so writes are serialized on
+    one connection behind a lock. Readers never block the writer in WAL mode.
+    """
+
+    def __init__(self, database_file: str, readers: int = 4, cache_size_kb: int = 16384,
+                 mmap_size: int = 256 * 1024 * 1024, busy_timeout_ms: int = 5000):
+        self.database_file = database_file
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._write_lock = threading.RLock()
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode=WAL")
+
+        self._readers = queue.Queue()
+        for _ in range(max(1, readers)):
+            self._readers.put(self._connect())
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database_file, check_same_thread=False, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    @contextmanager
+    def writer(self, attach: Dict[str, str] = None, durable: bool = False):
+        """Exclusive write connection wrapped in a single transaction.
+
+        ``attach`` maps schema aliases to database files that are ATTACHed for
+        the duration of the block (SQLite only allows ATTACH outside a transaction).
+        ``durable`` fsyncs the WAL on this commit (synchronous=FULL) instead of
+        at the next checkpoint, so the transaction also survives a power loss.
+        """
+        with self._write_lock:
+            conn = self._writer
+            if conn.in_transaction:
+                if attach or durable:
+                    raise RuntimeError("Cannot ATTACH or change durability inside an open write transaction")
+                # Nested use from the same thread joins the outer transaction
+                yield conn
+                return
+            with self._attached(conn, attach):
+                if durable:
+                    conn.execute("PRAGMA synchronous=FULL")
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        yield conn
+                    except BaseException:
+                        conn.execute("ROLLBACK")
+                        raise
+                    else:
+                        conn.execute("COMMIT")
+                finally:
+                    if durable:
+                        conn.execute("PRAGMA synchronous=NORMAL")
+
+    @contextmanager
+    def reader(self, attach: Dict[str, str] = None):
+        """Borrow a read connection; blocks until one is free."""
+        conn = self._readers.get()
+        try:
+            with self._attached(conn, attach):
+                try:
+                    yield conn
+                finally:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+        finally:
+            self._readers.put(conn)
+
+    @staticmethod
+    @contextmanager
+    def _attached(conn: sqlite3.Connection, attach: Optional[Dict[str, str]]):
+        attach = attach or {}
+        done = []
+        try:
+            for alias, path in attach.items():
+                conn.execute("ATTACH DATABASE ? AS " + alias, (path,))
+                done.append(alias)
+            yield conn
+        finally:
+            for alias in done:
+                conn.execute("DETACH DATABASE " + alias)
+
+    @contextmanager
+    def maintenance(self):
+        """Writer connection outside any transaction, for VACUUM / checkpoint style statements"""
+        with self._write_lock:
+            if self._writer.in_transaction:
+                raise RuntimeError("Maintenance statements cannot run inside a write transaction")
+            yield self._writer
+
+    def checkpoint(self, mode: str = 'TRUNCATE'):
+        """Copy the WAL into the database file; the checkpoint fsyncs both"""
+        with self.maintenance() as conn:
+            return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._write_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
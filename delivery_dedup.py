@@ -0,0 +1,61 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Mapping, Optional
+
+# Headers GitLab repeats on every redelivery of the same event, most specific first
+DELIVERY_HEADERS = ('idempotency-key', 'x-gitlab-event-uuid')
+
+
+def delivery_key(headers: Mapping[str, str], body: bytes) -> str:
+    """Idempotency key of a webhook delivery: the GitLab event UUID, or a hash of the raw body"""
+    for header in DELIVERY_HEADERS:
+        value = headers.get(header)
+        if value:
+            return f"uuid:{value.strip()}"
+    return f"sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+class RecentKeys:
+    """Bounded set of recently seen delivery keys (least recently seen are dropped first).
+
+    Sits in front of the unique index on gitlab_events.delivery_key: a hit here
+    skips the hook without touching the database, a miss is settled by the index.
+    """
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = max(1, maxsize)
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def seen(self, key: Optional[str]) -> bool:
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key: Optional[str]):
+        if key is None:
+            return
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def discard(self, key: Optional[str]):
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def stats(self) -> dict:
+        return {'size': len(self._keys), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
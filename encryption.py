@@ -1,27 +1,162 @@
 import os
 import base64
-from cryptography.fernet import Fernet
+import hashlib
+import hmac
+import struct
+from typing import Optional, Union
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 
+PBKDF2_ITERATIONS = 100000
+
+# Binary field format: version (1 byte) | key id (4) | nonce (12) | AES-GCM ciphertext + tag (16)
+FIELD_VERSION = 1
+FIELD_HEADER = struct.Struct('>B4s12s')
+
+# Known plaintext sealed under the current key and kept in the database: a cached key is trusted only if it opens it
+KEY_VERIFIER_TEXT = b'jarency-key-verifier'
+
+
+def field_aad(table: str, column: str, row_key) -> bytes:
+    """Associated data binding a sealed value to its row and column, so it can't be moved to another"""
+    return f"{table}.{column}|{row_key}".encode()
+
+
+def derive_key(password: str, salt: bytes, iterations: int = PBKDF2_ITERATIONS) -> bytes:
+    """32 raw key bytes from a password (PBKDF2-HMAC-SHA256; deliberately slow)"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=iterations,
+    )
+    return kdf.derive(password.encode())
+
+
+def password_salt() -> bytes:
+    return os.environ.get('DB_SALT', 'default_salt_change_this').encode()
+
+
+def password_key(password: str, salt: bytes, key_cache=None, verify_key=None, refresh_cache: bool = False) -> bytes:
+    """Fernet key (urlsafe base64) for a password. With key_cache (key_cache.KeyCache) a cached key
+    that verify_key(fernet_key) accepts skips PBKDF2; without verify_key the cache isn't used."""
+    if key_cache is not None and verify_key is not None:
+        raw_key = key_cache.get(salt, PBKDF2_ITERATIONS, lambda: derive_key(password, salt),
+                                verify=lambda raw: verify_key(base64.urlsafe_b64encode(raw)), refresh=refresh_cache)
+    else:
+        raw_key = derive_key(password, salt)
+    return base64.urlsafe_b64encode(raw_key)
+
+
 class DatabaseEncryption:
-    def __init__(self, password: str = None, direct_key: str = None):
-        """Initialize encryption with either password or direct key"""
+    def __init__(self, password: str = None, direct_key: str = None, key_cache=None, verify_key=None,
+                 refresh_cache: bool = False):
+        """Initialize encryption with either password or direct key.
+
+        key_cache (key_cache.KeyCache) skips PBKDF2 when a cached key passes verify_key
+        (see password_key()); refresh_cache derives afresh and replaces the cached one.
+        """
         if direct_key:
-            self.cipher = Fernet(direct_key.encode() if isinstance(direct_key, str) else direct_key)
+            key = direct_key.encode() if isinstance(direct_key, str) else direct_key
         elif password:
-            salt = os.environ.get('DB_SALT', 'default_salt_change_this').encode()
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-            )
-            key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-            self.cipher = Fernet(key)
+            key = password_key(password, password_salt(), key_cache, verify_key, refresh_cache)
         else:
             raise ValueError("Either password or direct_key must be provided")
+        self.cipher = Fernet(key)
+        # Separate key for search tokens, so the index never reveals the cipher key
+        self.index_key = hmac.new(key, b'search-index', hashlib.sha256).digest()
+        self._aeads = {}
+        self._fernets = []
+        self.key_id = self.add_key(key)
+
+    def add_key(self, key) -> bytes:
+        """Register a key that reads accept (the previous one during a rotation); returns its 4-byte id.
+        Writes always use the key given to __init__."""
+        key = key.encode() if isinstance(key, str) else key
+        aead_key = hmac.new(key, b'aead-v1', hashlib.sha256).digest()
+        key_id = hashlib.sha256(aead_key).digest()[:4]
+        if key_id not in self._aeads:
+            self._aeads[key_id] = AESGCM(aead_key)
+            self._fernets.append(Fernet(key))
+            self._legacy_cipher = MultiFernet(self._fernets)
+        return key_id
+
+    def add_password(self, password: str, salt: bytes) -> bytes:
+        """add_key() for a previous password / salt (always derived: it may share the current salt's cache entry)"""
+        return self.add_key(password_key(password, salt))
+
+    def make_verifier(self) -> bytes:
+        """KEY_VERIFIER_TEXT sealed under the current key"""
+        return self.encrypt_field(KEY_VERIFIER_TEXT.decode(), field_aad('key_verifier', 'token', 1))
+
+    def check_verifier(self, token: bytes) -> Optional[bytes]:
+        """Id of the registered key that sealed token, or None (quietly: a mismatch is an answer here)"""
+        try:
+            version, key_id, nonce = FIELD_HEADER.unpack_from(token)
+            aead = self._aeads.get(key_id)
+            if version != FIELD_VERSION or aead is None:
+                return None
+            header = token[:FIELD_HEADER.size]
+            aad = header + field_aad('key_verifier', 'token', 1)
+            return key_id if aead.decrypt(nonce, token[FIELD_HEADER.size:], aad) == KEY_VERIFIER_TEXT else None
+        except (InvalidTag, struct.error):
+            return None
+
+    def needs_reseal(self, value) -> bool:
+        """Encrypted, but not in the binary format under the current key"""
+        if isinstance(value, bytes):
+            return value[1:1 + len(self.key_id)] != self.key_id
+        return self.is_encrypted(value)
+
+    def blind_token(self, term: str) -> str:
+        """Keyed hash of a search term: equal terms match, plaintext stays out of the index"""
+        return 't' + hmac.new(self.index_key, term.encode(), hashlib.sha256).hexdigest()[:20]
+
+    def blind_index(self, value: str) -> str:
+        """Keyed hash of a whole field value for equality lookups on a sealed column
+        (domain-separated from search tokens, so the two can't be matched against each other)"""
+        return hmac.new(self.index_key, b'lookup|' + value.encode(), hashlib.sha256).hexdigest()[:32]
+
+    @property
+    def index_key_id(self) -> str:
+        """Short id of the index key: blind indexes are rebuilt when it changes"""
+        return hashlib.sha256(self.index_key).hexdigest()[:8]
+
+    @staticmethod
+    def is_encrypted(value: Union[str, bytes, None]) -> bool:
+        """A sealed field (bytes), or encrypt_text output: base64 of a Fernet token, which always starts with 'gAAAAA'"""
+        if isinstance(value, bytes):
+            return True
+        return bool(value) and value.startswith('Z0FBQUFB')
+
+    def encrypt_field(self, text: Optional[str], aad: bytes) -> Optional[bytes]:
+        """Seal text into the binary field format (stored as a BLOB); empty values stay as they are"""
+        if not text:
+            return text
+        nonce = os.urandom(12)
+        header = FIELD_HEADER.pack(FIELD_VERSION, self.key_id, nonce)
+        # The header is authenticated too, so the version and key id can't be swapped
+        return header + self._aeads[self.key_id].encrypt(nonce, text.encode(), header + aad)
+
+    def decrypt_field(self, value: Union[str, bytes, None], aad: bytes) -> Optional[str]:
+        """Plaintext of a stored field: binary AEAD, legacy Fernet text, or plaintext as is.
+        A binary value that fails authentication (wrong row, column or key) gives None."""
+        if not isinstance(value, bytes):
+            return self.decrypt_text(value) if self.is_encrypted(value) else value
+        try:
+            version, key_id, nonce = FIELD_HEADER.unpack_from(value)
+            aead = self._aeads.get(key_id)
+            if version != FIELD_VERSION or aead is None:
+                raise InvalidTag()
+            header = value[:FIELD_HEADER.size]
+            return aead.decrypt(nonce, value[FIELD_HEADER.size:], header + aad).decode()
+        except (InvalidTag, struct.error, UnicodeDecodeError):
+            print(f"Decryption failed for a {len(value)}-byte field - wrong key or moved value")
+            return None
 
     def encrypt_text(self, text: str) -> str:
         """Encrypt text and return base64 encoded string"""
@@ -41,7 +176,7 @@ class DatabaseEncryption:
 
         try:
             encrypted_bytes = base64.urlsafe_b64decode(encrypted_text.encode())
-            decrypted = self.cipher.decrypt(encrypted_bytes)
+            decrypted = self._legacy_cipher.decrypt(encrypted_bytes)
             return decrypted.decode()
         except Exception:
             print(f"Decryption failed for: {encrypted_text[:50]}... - assuming plaintext")
@@ -0,0 +1,225 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+# Keys every normalized record has; all but noteable_type are gitlab_events columns
+RECORD_FIELDS = [
+    'project', 'branch', 'commit_count', 'object_iid', 'object_title', 'object_state',
+    'object_action', 'source_branch', 'target_branch', 'noteable_type',
+]
+
+
+def default_user(payload: dict) -> dict:
+    """Acting user of a webhook, wherever this kind of payload keeps it"""
+    if 'user' in payload:
+        return payload['user']
+    if 'user' in payload.get('object_attributes', {}):
+        return payload['object_attributes']['user']
+    if 'user' in payload.get('commit', {}):
+        return payload['commit']['user']
+    if 'author' in payload.get('commit', {}):
+        return payload['commit']['author']
+    return {}
+
+
+@dataclass(frozen=True)
+class EventKind:
+    """Everything the app knows about one GitLab object_kind.
+
+    extract:        (payload, object_attributes) -> record fields, run once at ingest
+    describe:       record -> activity description (None: "<Kind> activity")
+    find_user:      payload -> user dict the event is attributed to
+    facts_list:     facts key (commits / merge_requests / issues) this kind adds entries to
+    fact_entries:   (stored event, its commits, repository) -> entries for facts_list
+    tracks_branch:  the event's branch counts towards facts['branches']
+    needs_follow_up: record -> whether the webhook worker has more to do after storing it
+    """
+    name: str
+    extract: Callable[[dict, dict], dict] = lambda payload, attrs: {}
+    describe: Optional[Callable[[dict], str]] = None
+    find_user: Callable[[dict], dict] = default_user
+    facts_list: Optional[str] = None
+    fact_entries: Callable[[dict, List[dict], str], List[dict]] = lambda event, commits, repo: []
+    tracks_branch: bool = False
+    needs_follow_up: Callable[[dict], bool] = lambda record: False
+
+
+EVENT_KINDS: Dict[str, EventKind] = {}
+
+
+def register(kind: EventKind) -> EventKind:
+    EVENT_KINDS[kind.name] = kind
+    return kind
+
+
+def get_kind(name: str) -> EventKind:
+    """Registered kind, or a generic one for kinds nobody registered"""
+    return EVENT_KINDS.get(name) or EventKind(name)
+
+
+def describe_event(event_type: str, record: dict) -> str:
+    """Human-readable description of an event from its record"""
+    kind = get_kind(event_type)
+    try:
+        if kind.describe is not None:
+            return kind.describe(record)
+        return f"{event_type.replace('_', ' ').title()} activity"
+    except Exception:
+        return f"{event_type} activity"
+
+
+def normalize_event(payload: dict) -> dict:
+    """Walk a webhook payload once and return its compact normalized record"""
+    event_type = payload.get('object_kind') or 'unknown'
+    kind = get_kind(event_type)
+    attrs = payload.get('object_attributes') or {}
+
+    record = dict.fromkeys(RECORD_FIELDS)
+    record['project'] = (payload.get('project') or {}).get('name') if 'project' in payload else None
+    record['commits'] = []
+    record.update(kind.extract(payload, attrs))
+
+    user = kind.find_user(payload) or {}
+    record['type'] = event_type
+    record['user'] = user
+    record['username'] = user.get('username', 'unknown')
+    record['description'] = describe_event(event_type, record)
+    record['follow_up'] = kind.needs_follow_up(record)
+    return record
+
+
+# --- push ---
+
+def _push_fields(payload: dict, attrs: dict) -> dict:
+    commits = payload.get('commits') or []
+    return {
+        'commit_count': len(commits),
+        'branch': (payload.get('ref') or '').replace('refs/heads/', '') if 'ref' in payload else None,
+        'commits': [{
+            'sha': commit.get('id', ''),
+            'message': (commit.get('message') or '').split('\n')[0],
+            'ts': commit.get('timestamp'),
+        } for commit in commits],
+    }
+
+
+def _push_description(record: dict) -> str:
+    return (f"Pushed {record.get('commit_count') or 0} commit(s) to {record.get('branch') or ''} "
+            f"in {record.get('project') or 'repository'}")
+
+
+def _push_facts(event: dict, commits: List[dict], repo: str) -> List[dict]:
+    return [{
+        'id': (commit['sha'] or '')[:8],
+        'message': (commit['message'] or '')[:100],
+        'timestamp': commit['ts'] or event['ts'],
+        'repository': repo
+    } for commit in commits]
+
+
+register(EventKind(
+    'push',
+    extract=_push_fields,
+    describe=_push_description,
+    facts_list='commits',
+    fact_entries=_push_facts,
+    tracks_branch=True,
+))
+
+
+# --- merge_request ---
+
+def _object_fields(attrs: dict) -> dict:
+    return {
+        'object_iid': attrs.get('iid'),
+        'object_title': attrs.get('title'),
+        'object_state': attrs.get('state'),
+        'object_action': attrs.get('action'),
+    }
+
+
+def _merge_request_fields(payload: dict, attrs: dict) -> dict:
+    mr = payload.get('merge_request') or {}
+    project = payload.get('project') or {}
+    fields = _object_fields(attrs)
+    fields.update({
+        'source_branch': attrs.get('source_branch'),
+        'target_branch': attrs.get('target_branch'),
+        # Used by the merged-MR follow-up (Loom reminder)
+        'object_iid': fields['object_iid'] if fields['object_iid'] is not None else mr.get('iid'),
+        'object_title': fields['object_title'] or mr.get('title'),
+        'url': attrs.get('url') or mr.get('url'),
+        'project_id': project.get('id'),
+        'project_path': project.get('path_with_namespace'),
+        'labels': [label.get('title', '') for label in payload.get('labels') or []],
+    })
+    return fields
+
+
+def _merge_request_user(payload: dict) -> dict:
+    # Use MR author for reminders, not the merger.
+    if 'merge_request' in payload:
+        return payload['merge_request'].get('author', {})
+    return default_user(payload)
+
+
+def _merge_request_facts(event: dict, commits: List[dict], repo: str) -> List[dict]:
+    return [{
+        'iid': event['object_iid'],
+        'title': (event['object_title'] or '')[:100],
+        'state': event['object_state'],
+        'action': event['object_action'],
+        'source_branch': event['source_branch'],
+        'target_branch': event['target_branch'],
+        'repository': repo
+    }]
+
+
+register(EventKind(
+    'merge_request',
+    extract=_merge_request_fields,
+    describe=lambda record: f"Merge request {record.get('object_action') or 'updated'}: "
+                            f"{(record.get('object_title') or 'MR')[:50]}",
+    find_user=_merge_request_user,
+    facts_list='merge_requests',
+    fact_entries=_merge_request_facts,
+    needs_follow_up=lambda record: record.get('object_action') == 'merge',
+))
+
+
+# --- issue ---
+
+def _issue_facts(event: dict, commits: List[dict], repo: str) -> List[dict]:
+    return [{
+        'iid': event['object_iid'],
+        'title': (event['object_title'] or '')[:100],
+        'state': event['object_state'],
+        'action': event['object_action'],
+        'repository': repo
+    }]
+
+
+register(EventKind(
+    'issue',
+    extract=lambda payload, attrs: _object_fields(attrs),
+    describe=lambda record: f"Issue {record.get('object_action') or 'updated'}: "
+                            f"{(record.get('object_title') or 'Issue')[:50]}",
+    facts_list='issues',
+    fact_entries=_issue_facts,
+))
+
+
+# --- note ---
+
+register(EventKind(
+    'note',
+    extract=lambda payload, attrs: {'noteable_type': attrs.get('noteable_type')},
+    describe=lambda record: f"Commented on {(record.get('noteable_type') or 'object').lower()}",
+))
+
+
+# --- pipeline ---
+
+register(EventKind(
+    'pipeline',
+    extract=lambda payload, attrs: {'branch': attrs.get('ref'), 'object_state': attrs.get('status')},
+))
@@ -0,0 +1,134 @@
+import threading
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from typing import Hashable, Optional
+
+FACT_LISTS = ('activities', 'commits', 'merge_requests', 'issues')
+
+
+class FactsEntry:
+    """Facts of one (user, window), kept per event so the window can move.
+
+    events holds (ts_epoch, id, contribution) oldest first; watermark is the highest
+    gitlab_events id already read (anyone's), so a refresh only reads rows above it. Counts, repositories
+    and branches are running totals; the lists are rebuilt only after something changed.
+    """
+
+    def __init__(self, since: int):
+        self.since = since
+        self.watermark = 0
+        self.loaded = False
+        self.events = []
+        self.event_summary = Counter()
+        self.repositories = Counter()
+        self.branches = Counter()
+        self.lock = threading.Lock()
+        self._lists = None
+
+    def add(self, event: dict, items: dict, branch: Optional[str]):
+        """Fold in one gitlab_events row and the fact items it contributes"""
+        contribution = {'type': event['type'], 'ts': event['ts'], 'project': event['project'],
+                        'branch': branch, 'items': items}
+        entry = (event['ts_epoch'] or 0, event['id'], contribution)
+        if not self.events or entry[:2] > self.events[-1][:2]:
+            self.events.append(entry)
+        else:
+            insort(self.events, entry)
+        self.watermark = max(self.watermark, event['id'])
+        self._count(contribution, 1)
+        self._lists = None
+
+    def expire(self, since: int) -> int:
+        """Drop events older than the window's new start; returns how many went"""
+        self.since = max(self.since, since)
+        cut = bisect_left(self.events, (self.since,))
+        for _, _, contribution in self.events[:cut]:
+            self._count(contribution, -1)
+        del self.events[:cut]
+        if cut:
+            self._lists = None
+        return cut
+
+    def _count(self, contribution: dict, delta: int):
+        for counter, value in ((self.event_summary, contribution['type']),
+                               (self.repositories, contribution['project']),
+                               (self.branches, contribution['branch'])):
+            if value is None:
+                continue
+            counter[value] += delta
+            if counter[value] <= 0:
+                del counter[value]
+
+    def fill(self, facts: dict) -> dict:
+        """Copy the entry into a fresh facts dict (lists newest first, like a full query)"""
+        if self._lists is None:
+            lists = {key: [] for key in FACT_LISTS}
+            for _, _, contribution in reversed(self.events):
+                for key, entries in contribution['items'].items():
+                    lists[key].extend(entries)
+            self._lists = lists
+        facts['total_events'] = len(self.events)
+        facts['event_summary'] = dict(self.event_summary)
+        facts['repositories'] = set(self.repositories)
+        facts['branches'] = set(self.branches)
+        facts['last_activity'] = self.events[-1][2]['ts'] if self.events else None
+        for key in FACT_LISTS:
+            facts[key] = list(self._lists[key])
+        return facts
+
+
+class FactsCache:
+    """LRU of FactsEntry by (user, window); least recently used entries are dropped first"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.folded = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def entry(self, key: Hashable, since: int) -> FactsEntry:
+        """Cached entry for key, or a new empty one (registered, so concurrent callers share it)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            # A window that moved backwards can't be served from what the entry kept
+            if entry is not None and since >= entry.since:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            entry = self._entries[key] = FactsEntry(since)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return entry
+
+    def peek(self, key: Hashable) -> Optional[FactsEntry]:
+        """Entry for key if cached, without counting a hit or refreshing its LRU position"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def record(self, folded: int, expired: int):
+        with self._lock:
+            self.folded += folded
+            self.expired += expired
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'folded_events': self.folded, 'expired_events': self.expired, 'evictions': self.evictions}
+
@@ -0,0 +1,213 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import aiohttp
+from colorama import Fore
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire ``ttl`` seconds after they were stored"""
+
+    def __init__(self, ttl: float = 600, maxsize: int = 5000):
+        self.ttl = ttl
+        self.maxsize = max(1, maxsize)
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._items.pop(key, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Seconds to wait according to Retry-After (delta or HTTP date) or GitLab's RateLimit-Reset"""
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get('RateLimit-Reset')
+    if reset:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+def parse_changes_count(value) -> Optional[int]:
+    """GitLab reports changes_count as a string, capped as e.g. "1000+" """
+    if value is None:
+        return None
+    try:
+        return int(str(value).rstrip('+'))
+    except ValueError:
+        return None
+
+
+class GitLabClient:
+    """Shared GitLab REST client: one pooled session, per-host connection limit,
+    retries with jittered backoff that honour rate-limit headers, and a TTL cache
+    for merge request lookups.
+    """
+
+    def __init__(self, base_url: str, token: str, per_host: int = 8, retries: int = 3,
+                 timeout: float = 15, backoff: float = 0.5, max_backoff: float = 30,
+                 cache_ttl: float = 600, cache_size: int = 5000):
+        self.base_url = (base_url or '').rstrip('/')
+        self.token = token
+        self.per_host = max(1, per_host)
+        self.retries = max(0, retries)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = TTLCache(cache_ttl, cache_size)
+
+        # Monitoring counters
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.coalesced = 0
+
+        self._session = None
+        self._in_flight = {}
+        self._paused_until = 0.0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.per_host, ttl_dns_cache=300)
+            headers = {"Private-Token": self.token} if self.token else {}
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def _delay(self, attempt: int, headers=None) -> float:
+        wait = retry_after_seconds(headers) if headers is not None else None
+        if wait is None:
+            # Full jitter: spreads retries of many workers over the backoff window
+            wait = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return min(wait, self.max_backoff)
+
+    async def get(self, path: str, params: dict = None):
+        """GET base_url + path; returns (json, headers) or raises the last error"""
+        if not self.base_url:
+            raise RuntimeError("GITLAB_URL is not configured")
+        url = f"{self.base_url}{path}"
+        last_error = None
+        for attempt in range(self.retries + 1):
+            # Everyone waits out a rate limit window another request ran into
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self.requests += 1
+            try:
+                async with self._get_session().get(url, params=params) as resp:
+                    if resp.headers.get('RateLimit-Remaining') == '0':
+                        self._paused_until = time.monotonic() + (retry_after_seconds(resp.headers) or 0)
+                    if resp.status == 200:
+                        return await resp.json(), resp.headers
+                    if resp.status not in RETRY_STATUSES:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status, message=resp.reason)
+                    last_error = aiohttp.ClientResponseError(
+                        resp.request_info, resp.history, status=resp.status, message=resp.reason)
+                    delay = self._delay(attempt, resp.headers)
+                    if resp.status == 429:
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+                delay = self._delay(attempt)
+            if attempt < self.retries:
+                self.retried += 1
+                await asyncio.sleep(delay)
+        raise last_error
+
+    async def merge_request_changes_count(self, project_id: int, mr_iid: int) -> Optional[int]:
+        """Number of files changed by a merge request, without downloading any diffs.
+
+        Cached per (project_id, mr_iid); concurrent lookups of the same MR share one request.
+        Returns None when GitLab can't tell us.
+        """
+        key = (project_id, mr_iid)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            count = await self._fetch_changes_count(project_id, mr_iid)
+            if count is not None:
+                self.cache.set(key, count)
+            future.set_result(count)
+            return count
+        except Exception as e:
+            self.failures += 1
+            future.set_result(None)
+            print(f"{Fore.RED}❌ GitLab MR lookup {project_id}!{mr_iid} failed: {e}")
+            return None
+        finally:
+            # Cancelled (e.g. a worker stop timeout): coalesced waiters get "unknown" instead of hanging
+            if not future.done():
+                future.set_result(None)
+            del self._in_flight[key]
+
+    async def _fetch_changes_count(self, project_id: int, mr_iid: int) -> Optional[int]:
+        mr_path = f"/projects/{project_id}/merge_requests/{mr_iid}"
+        data, _ = await self.get(mr_path)
+        count = parse_changes_count(data.get('changes_count'))
+        if count is not None:
+            return count
+        # changes_count is null until GitLab has computed the diff; the diffs list carries a total
+        _, headers = await self.get(f"{mr_path}/diffs", params={'per_page': 1})
+        return parse_changes_count(headers.get('X-Total'))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'retried': self.retried,
+            'failures': self.failures,
+            'coalesced': self.coalesced,
+            'cache_size': len(self.cache),
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+        }
@@ -0,0 +1,99 @@
+# gitlab_stub.py
+# Local stand-in for the GitLab REST API merge request endpoints, for offline runs and benchmarks.
+# Usage: python gitlab_stub.py [--port 8929] [--latency-ms 50] [--fail-rate 0.0] [--rate-limit 0]
+#        then GITLAB_URL=http://127.0.0.1:8929/api/v4
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+DIFF_BYTES = 4000  # size of one fake diff in the /changes payload
+
+
+def changed_files(project_id: int, mr_iid: int) -> int:
+    """Deterministic number of changed files per MR"""
+    return (project_id * 7 + mr_iid * 13) % 60
+
+
+def make_app(latency_ms: float = 50, fail_rate: float = 0.0, rate_limit: int = 0) -> web.Application:
+    """latency_ms per response, fail_rate of 503s, and at most rate_limit requests per second (0 = unlimited)"""
+    app = web.Application()
+    app['stats'] = {'requests': 0}
+    app['window'] = [int(time.time()), 0]
+
+    async def throttle(request):
+        app['stats']['requests'] += 1
+        await asyncio.sleep(latency_ms / 1000)
+        if rate_limit:
+            now = int(time.time())
+            window = app['window']
+            if window[0] != now:
+                window[:] = [now, 0]
+            window[1] += 1
+            headers = {'RateLimit-Limit': str(rate_limit),
+                       'RateLimit-Remaining': str(max(0, rate_limit - window[1])),
+                       'RateLimit-Reset': str(now + 1)}
+            if window[1] > rate_limit:
+                headers['Retry-After'] = '1'
+                raise web.HTTPTooManyRequests(headers=headers)
+        if fail_rate and random.random() < fail_rate:
+            raise web.HTTPServiceUnavailable()
+        if request.headers.get('Private-Token') is None:
+            raise web.HTTPUnauthorized()
+
+    def ids(request):
+        return int(request.match_info['project_id']), int(request.match_info['mr_iid'])
+
+    async def merge_request(request):
+        await throttle(request)
+        project_id, mr_iid = ids(request)
+        return web.json_response({
+            'id': project_id * 100000 + mr_iid, 'iid': mr_iid, 'project_id': project_id,
+            'title': f'MR {mr_iid}', 'state': 'merged',
+            'changes_count': str(changed_files(project_id, mr_iid)),
+        })
+
+    async def merge_request_changes(request):
+        await throttle(request)
+        project_id, mr_iid = ids(request)
+        changes = [{'old_path': f'src/file_{i}.py', 'new_path': f'src/file_{i}.py', 'diff': '+' * DIFF_BYTES}
+                   for i in range(changed_files(project_id, mr_iid))]
+        return web.json_response({'iid': mr_iid, 'project_id': project_id, 'changes': changes})
+
+    async def merge_request_diffs(request):
+        await throttle(request)
+        project_id, mr_iid = ids(request)
+        total = changed_files(project_id, mr_iid)
+        per_page = int(request.query.get('per_page', 20))
+        diffs = [{'new_path': f'src/file_{i}.py', 'diff': '+' * DIFF_BYTES} for i in range(min(per_page, total))]
+        return web.json_response(diffs, headers={'X-Total': str(total)})
+
+    prefix = '/api/v4/projects/{project_id}/merge_requests/{mr_iid}'
+    app.router.add_get(prefix, merge_request)
+    app.router.add_get(prefix + '/changes', merge_request_changes)
+    app.router.add_get(prefix + '/diffs', merge_request_diffs)
+    return app
+
+
+async def start_stub(port: int = 0, **options):
+    """Run the stub on 127.0.0.1 inside the current loop; returns (runner, base_url)"""
+    app = make_app(**options)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/v4"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local GitLab API stub")
+    parser.add_argument('--port', type=int, default=8929)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, default=0)
+    args = parser.parse_args()
+    print(f"GitLab stub on http://127.0.0.1:{args.port}/api/v4")
+    web.run_app(make_app(args.latency_ms, args.fail_rate, args.rate_limit), host='127.0.0.1', port=args.port)
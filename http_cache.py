@@ -0,0 +1,77 @@
+import hashlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+except ImportError:  # optional: plain json is used without it
+    orjson = None
+    ORJSONResponse = None
+
+# Rolling windows ("last N hours") are revalidated once per step
+ROLLING_WINDOW_STEP = 60
+
+
+def json_response(content, status_code: int = 200, headers: dict = None) -> Response:
+    """JSON response through orjson when it is installed (facts payloads serialize several times faster)"""
+    response_class = ORJSONResponse if orjson is not None else JSONResponse
+    return response_class(content, status_code=status_code, headers=headers)
+
+
+def make_etag(*parts) -> str:
+    """Weak validator from whatever identifies the data behind a response (weak: compression changes the bytes)"""
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def body_etag(body: bytes) -> str:
+    return f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def http_date(epoch: float) -> str:
+    return formatdate(epoch, usegmt=True)
+
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """Whether the client's cached copy is current (If-None-Match wins over If-Modified-Since)"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or etag.removeprefix('W/') in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[float] = None) -> dict:
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag: str, last_modified: Optional[float] = None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def conditional_json(request: Request, content, etag: str = None, last_modified: Optional[float] = None) -> Response:
+    """JSON response with validators; 304 if the client already has it.
+
+    Without an etag the body itself is hashed: that saves the transfer but not the work,
+    for endpoints whose data doesn't all live in the database (Google Sheets, the scheduler).
+    """
+    response = json_response(content)
+    etag = etag or body_etag(response.body)
+    if is_fresh(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+    response.headers.update(validator_headers(etag, last_modified))
+    return response
@@ -0,0 +1,253 @@
+# import_events.py
+# Offline bulk import of GitLab history into gitlab_events (new team member, new project).
+# Usage: python import_events.py export.jsonl [more.jsonl ...] [--workers N] [--chunk-mb 4] [--keep-indexes]
+#
+# Each line is one of:
+#   - a webhook payload (has "object_kind")
+#   - {"payload": {...}, "received_at": "...", "headers": {...}} as recorded from webhooks
+#   - a GitLab Events API record (has "action_name"; pushes carry only their last commit)
+# Worker processes read, parse, normalize and compress byte ranges of the file; the main process
+# writes each range in one transaction with relaxed pragmas and secondary indexes dropped until
+# the end. Progress is committed with every batch, and lines are deduplicated by delivery key, so
+# an interrupted import can simply be run again. Stop the server while importing.
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from colorama import Fore, init
+
+from delivery_dedup import delivery_key
+from event_kinds import normalize_event
+from payload_codec import PayloadCodec
+from payload_profiles import encode_stored_payload
+
+# Rebuilt by init_database() once the import is done
+DEFERRED_INDEXES = ['idx_gitlab_dev_ts', 'idx_gitlab_dev_epoch', 'idx_gitlab_epoch', 'idx_gitlab_dev_local_date']
+
+EVENTS_API_ACTIONS = {'opened': 'open', 'closed': 'close', 'reopened': 'reopen',
+                      'accepted': 'merge', 'merged': 'merge', 'updated': 'update'}
+EVENTS_API_KINDS = {'MergeRequest': 'merge_request', 'Issue': 'issue',
+                    'Note': 'note', 'DiffNote': 'note', 'DiscussionNote': 'note'}
+
+
+def parse_gitlab_time(value) -> str:
+    """GitLab timestamp in any of its formats -> naive UTC ISO string"""
+    text = str(value).strip().replace(' UTC', '+00:00').replace('Z', '+00:00')
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat()
+
+
+def payload_time(payload: dict):
+    """When a bare webhook payload happened, from the fields GitLab fills in"""
+    attrs = payload.get('object_attributes') or {}
+    for value in (attrs.get('updated_at'), attrs.get('finished_at'), attrs.get('created_at')):
+        if value:
+            return value
+    commits = payload.get('commits') or []
+    return commits[-1].get('timestamp') if commits else None
+
+
+def from_events_api(event: dict) -> dict:
+    """Webhook-shaped payload for a GitLab Events API record"""
+    author = event.get('author') or {}
+    user = {'username': event.get('author_username') or author.get('username'), 'name': author.get('name')}
+    payload = {'user': user, 'project': {'id': event.get('project_id')}}
+    push = event.get('push_data')
+    if push:
+        payload.update({
+            'object_kind': 'push',
+            'ref': f"refs/heads/{push.get('ref') or ''}",
+            'total_commits_count': push.get('commit_count'),
+            'commits': [{'id': push.get('commit_to'), 'message': push.get('commit_title') or '',
+                         'timestamp': event.get('created_at')}] if push.get('commit_to') else [],
+        })
+        return payload
+    target_type = event.get('target_type') or ''
+    action = event.get('action_name') or ''
+    payload['object_kind'] = EVENTS_API_KINDS.get(target_type, target_type.lower() or 'event')
+    payload['object_attributes'] = {
+        'iid': event.get('target_iid'),
+        'title': event.get('target_title'),
+        'action': EVENTS_API_ACTIONS.get(action, action),
+        'noteable_type': (event.get('note') or {}).get('noteable_type'),
+    }
+    return payload
+
+
+def prepare_line(line: bytes, codec: PayloadCodec, prune: bool, keep_raw: bool):
+    """One export line -> (ts, dev, delivery key, record, encoded payload)"""
+    data = json.loads(line)
+    headers = {}
+    if isinstance(data.get('payload'), dict):
+        headers = {name.lower(): value for name, value in (data.get('headers') or {}).items()}
+        payload, ts = data['payload'], data.get('received_at') or payload_time(data['payload'])
+    elif 'action_name' in data:
+        payload, ts = from_events_api(data), data.get('created_at')
+    else:
+        payload, ts = data, payload_time(data)
+    if not payload.get('object_kind') or not ts:
+        raise ValueError("no object_kind or timestamp")
+    record = normalize_event(payload)
+    encoded = encode_stored_payload(payload, codec, prune, keep_raw)
+    return parse_gitlab_time(ts), record['username'], delivery_key(headers, line.strip()), record, encoded
+
+
+# --- worker processes ---
+
+_worker = {}
+
+
+def _init_worker(dictionaries, prune, keep_raw):
+    _worker.update(codec=PayloadCodec(dictionaries), prune=prune, keep_raw=keep_raw)
+
+
+def _prepare_range(chunk):
+    """(prepared rows, bad line count, end offset) for the lines in a (path, start, end) byte range"""
+    path, start, end = chunk
+    with open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines()
+    prepared, bad = [], 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            prepared.append(prepare_line(line, _worker['codec'], _worker['prune'], _worker['keep_raw']))
+        except (ValueError, TypeError, AttributeError):
+            bad += 1
+    return prepared, bad, end
+
+
+def line_ranges(path: str, offset: int, chunk_bytes: int):
+    """(path, start, end) byte ranges of about chunk_bytes that end on line boundaries"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while offset < size:
+            f.seek(min(offset + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield path, offset, end
+            offset = end
+
+
+# --- main process ---
+
+def load_progress(db_manager, source: str) -> int:
+    with db_manager.pool.reader() as conn:
+        row = conn.execute("SELECT byte_offset FROM import_progress WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else 0
+
+
+def write_batch(db_manager, source: str, prepared, end_offset: int):
+    """Insert a batch and advance the file's checkpoint in the same transaction"""
+    rows = [db_manager.gitlab_event_row(dev, None, ts, delivery_key=key, record=record, encoded=encoded)
+            for ts, dev, key, record, encoded in prepared]
+    with db_manager.pool.writer() as conn:
+        inserted = db_manager.insert_gitlab_event_rows(rows)
+        conn.execute(
+            "INSERT INTO import_progress (source, byte_offset, rows, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET byte_offset = excluded.byte_offset, "
+            "rows = rows + excluded.rows, updated_at = excluded.updated_at",
+            (source, end_offset, inserted.count(True), datetime.utcnow().isoformat()))
+    return inserted.count(True), inserted.count(False)
+
+
+def import_file(db_manager, pool, path: str, chunk_bytes: int, workers: int) -> dict:
+    source = os.path.abspath(path)
+    offset = load_progress(db_manager, source)
+    size = os.path.getsize(path)
+    totals = {'inserted': 0, 'duplicates': 0, 'bad': 0}
+    if offset >= size:
+        print(f"{Fore.YELLOW}⏭️ {path}: already imported")
+        return totals
+    if offset:
+        print(f"{Fore.CYAN}↩️ {path}: resuming at byte {offset} of {size}")
+
+    start = last_report = time.perf_counter()
+    in_flight = deque()
+
+    def drain_one():
+        prepared, bad, end_offset = in_flight.popleft().get()
+        inserted, duplicates = write_batch(db_manager, source, prepared, end_offset)
+        totals['inserted'] += inserted
+        totals['duplicates'] += duplicates
+        totals['bad'] += bad
+
+    # Keep a couple of ranges per worker in flight: extraction overlaps the writes, memory stays bounded
+    for chunk in line_ranges(path, offset, chunk_bytes):
+        in_flight.append(pool.apply_async(_prepare_range, (chunk,)))
+        if len(in_flight) >= workers * 2:
+            drain_one()
+        if time.perf_counter() - last_report > 5:
+            last_report = time.perf_counter()
+            print(f"{Fore.CYAN}📥 {path}: {totals['inserted']} rows, "
+                  f"{totals['inserted'] / (last_report - start):.0f} rows/s")
+    while in_flight:
+        drain_one()
+
+    elapsed = time.perf_counter() - start
+    print(f"{Fore.GREEN}✅ {path}: {totals['inserted']} rows in {elapsed:.2f}s "
+          f"({totals['inserted'] / max(elapsed, 1e-6):.0f} rows/s), "
+          f"{totals['duplicates']} already present, {totals['bad']} unreadable lines")
+    return totals
+
+
+def main():
+    init(autoreset=True)
+    parser = argparse.ArgumentParser(description="Bulk import GitLab event JSONL exports into gitlab_events")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument('--chunk-mb', type=float, default=4, help="size of the file range written per transaction")
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help="don't drop secondary indexes (better for small imports into a big table)")
+    args = parser.parse_args()
+
+    from server import db_manager, gitlab_event_writer
+
+    codec = db_manager.payload_codec
+    pool = multiprocessing.get_context('spawn').Pool(
+        args.workers, initializer=_init_worker,
+        initargs=(codec.dictionaries, db_manager.prune_payloads, db_manager.raw_payload_archive))
+
+    # Relaxed durability for the bulk load: a crash loses at most the last batches,
+    # which the progress table and the delivery keys let a re-run redo safely
+    with db_manager.pool.maintenance() as conn:
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-262144")
+        if not args.keep_indexes:
+            for index in DEFERRED_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+    start = time.perf_counter()
+    totals = {'inserted': 0, 'duplicates': 0, 'bad': 0}
+    try:
+        for path in args.files:
+            for key, value in import_file(db_manager, pool, path, int(args.chunk_mb * 1024 * 1024),
+                                          args.workers).items():
+                totals[key] += value
+    finally:
+        pool.close()
+        pool.join()
+        index_start = time.perf_counter()
+        with db_manager.pool.maintenance() as conn:
+            conn.execute("PRAGMA synchronous=NORMAL")
+        db_manager.init_database()
+        index_s = time.perf_counter() - index_start
+        db_manager.checkpoint()
+        gitlab_event_writer.close()
+        db_manager.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{Fore.GREEN}✅ Imported {totals['inserted']} rows in {elapsed:.2f}s "
+          f"({totals['inserted'] / max(elapsed, 1e-6):.0f} rows/s, index rebuild {index_s:.2f}s); "
+          f"{totals['duplicates']} already present, {totals['bad']} unreadable lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+# 2: entries keyed by the non-secret KDF parameters only (version 1 files are ignored and rewritten)
+KEY_CACHE_VERSION = 2
+
+
+def key_fingerprint(salt: bytes, iterations: int) -> str:
+    """Which derivation an entry belongs to: KDF, iterations and salt, never the password.
+    Anything computed from the password here would let whoever reads the file test
+    password guesses at the cost of one hash instead of a full PBKDF2 run."""
+    return hashlib.sha256(b'pbkdf2-sha256|%d|' % iterations + salt).hexdigest()
+
+
+class KeyCache:
+    """Derived key material cached per process and in a private file (owner-only, 0600).
+
+    The first process to need a password-derived key pays for PBKDF2 and writes the
+    result; later starts of the server, the bot (which imports the server), tools and
+    tests read it back. Since entries don't say which password they came from, every
+    cached key goes through the caller's verify() (does it open the database's key
+    verifier?) and is re-derived when it doesn't. A new password under the same salt
+    can't be told from the old one, so password changes go through refresh (a rotation)
+    or clear(). A file with looser permissions or another owner is ignored and
+    rewritten. Writing after a miss keeps only the derivations this process uses;
+    retain() drops everything but the current one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._memory = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.derive_seconds = 0.0
+
+    def get(self, salt: bytes, iterations: int, derive: Callable[[], bytes],
+            verify: Callable[[bytes], bool], refresh: bool = False) -> bytes:
+        """Cached key for (salt, iterations) if verify() accepts it, else derive() and store the result.
+        refresh skips the cached entry (a password change with the same salt can't be told apart)."""
+        fingerprint = key_fingerprint(salt, iterations)
+        with self._lock:
+            key = None if refresh else self._memory.get(fingerprint) or self._load(fingerprint)
+            if key is not None and not verify(key):
+                self.rejected += 1
+                key = None
+            if key is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                key = self._derive(derive)
+                try:
+                    self._store(fingerprint, key, keep=set(self._memory))
+                except OSError:
+                    pass  # only an optimization: an unwritable location means deriving again next start
+            self._memory[fingerprint] = key
+            return key
+
+    def retain(self, salt: bytes, iterations: int):
+        """Keep only the entry for this derivation (once a rotation has moved the data off the old key)"""
+        fingerprint = key_fingerprint(salt, iterations)
+        with self._lock:
+            key = self._memory.get(fingerprint) or self._load(fingerprint)
+            self._memory = {fingerprint: key} if key is not None else {}
+            if key is not None:
+                self._store(fingerprint, key, keep=set())
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _derive(self, derive: Callable[[], bytes]) -> bytes:
+        start = time.perf_counter()
+        key = derive()
+        self.derive_seconds += time.perf_counter() - start
+        return key
+
+    def _private(self) -> bool:
+        """The file is ours and nobody else can read it (POSIX only; elsewhere the location is trusted)"""
+        if os.name != 'posix':
+            return True
+        stat = os.stat(self.path)
+        return stat.st_uid == os.getuid() and stat.st_mode & 0o077 == 0
+
+    def _read(self) -> dict:
+        try:
+            if not self._private():
+                return {}
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if data.get('version') == KEY_CACHE_VERSION else {}
+
+    def _load(self, fingerprint: str) -> Optional[bytes]:
+        entry = self._read().get('keys', {}).get(fingerprint)
+        return base64.b64decode(entry['key']) if entry else None
+
+    def _store(self, fingerprint: str, key: bytes, keep: set):
+        """Write key, keeping only the existing entries whose fingerprints are in keep"""
+        keys = {name: entry for name, entry in self._read().get('keys', {}).items() if name in keep}
+        keys[fingerprint] = {'key': base64.b64encode(key).decode(), 'created_at': int(time.time())}
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        # Created 0600 from the start, then swapped in atomically
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            if os.name == 'posix':
+                os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': KEY_CACHE_VERSION, 'keys': keys}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stats(self) -> dict:
+        return {'path': self.path, 'hits': self.hits, 'misses': self.misses, 'rejected': self.rejected,
+                'derive_seconds': round(self.derive_seconds, 3)}
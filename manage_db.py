@@ -0,0 +1,96 @@
+# manage_db.py
+# Maintenance commands for messages.db. Usage: python manage_db.py <command>
+import argparse
+import time
+
+from colorama import Fore, init
+
+
+def rebuild_rollup(db_manager, args):
+    start = time.perf_counter()
+    count = db_manager.rebuild_daily_activity()
+    print(f"{Fore.GREEN}✅ Rebuilt gitlab_daily_activity: {count} rows in {time.perf_counter() - start:.2f}s")
+
+
+def train_payload_dict(db_manager, args):
+    dictionary_id, size = db_manager.train_payload_dictionary()
+    print(f"{Fore.GREEN}✅ Trained payload dictionary #{dictionary_id} ({size} bytes)")
+
+
+def compress_payloads(db_manager, args):
+    start = time.perf_counter()
+    count = db_manager.compress_stored_payloads()
+    print(f"{Fore.GREEN}✅ Compressed {count} stored payloads in {time.perf_counter() - start:.2f}s")
+
+
+def prune_payloads(db_manager, args):
+    start = time.perf_counter()
+    count, saved = db_manager.prune_stored_payloads()
+    print(f"{Fore.GREEN}✅ Pruned {count} stored payloads ({saved / 1024:.0f} KiB saved) in {time.perf_counter() - start:.2f}s")
+
+
+def archive(db_manager, args):
+    moved = db_manager.retention.archive_old_rows()
+    print(f"{Fore.GREEN}✅ Archived rows older than {db_manager.retention.retention_days} days: {moved}")
+
+
+def vacuum(db_manager, args):
+    freed = db_manager.retention.incremental_vacuum()
+    print(f"{Fore.GREEN}✅ Vacuum: {'full VACUUM (switched to incremental)' if freed < 0 else f'{freed} pages freed'}")
+
+
+def rebuild_search(db_manager, args):
+    start = time.perf_counter()
+    count = db_manager.rebuild_search_index()
+    print(f"{Fore.GREEN}✅ Rebuilt search index: {count} rows in {time.perf_counter() - start:.2f}s")
+
+
+def rotate_key(db_manager, args):
+    """Finish a key rotation: re-encrypt data still under DB_PREVIOUS_* with the current key,
+    then drop every other derivation from the key cache. Blind and search indexes were already
+    rebuilt for the new key when the server started with it."""
+    from config import DB_ENCRYPTION_PASSWORD
+    from encryption import PBKDF2_ITERATIONS, password_salt
+    from server import key_cache
+    if not db_manager.encryption:
+        print(f"{Fore.YELLOW}⚠️ Nothing to rotate: encryption is not configured")
+        return
+    start = time.perf_counter()
+    count = db_manager.reseal_encrypted_fields()
+    print(f"{Fore.GREEN}✅ Re-encrypted {count} fields with the current key in {time.perf_counter() - start:.2f}s")
+    if DB_ENCRYPTION_PASSWORD and key_cache is not None:
+        key_cache.retain(password_salt(), PBKDF2_ITERATIONS)
+        print(f"{Fore.GREEN}✅ Key cache now holds only the current key ({key_cache.path})")
+    print(f"{Fore.CYAN}🔑 DB_PREVIOUS_ENCRYPTION_* can be removed from the environment")
+
+
+COMMANDS = {
+    'rebuild-rollup': (rebuild_rollup, "Recompute the per-day activity rollup from gitlab_events"),
+    'train-payload-dict': (train_payload_dict, "Train a new zlib dictionary on recent GitLab payloads"),
+    'compress-payloads': (compress_payloads, "Re-encode plain JSON payloads as compressed BLOBs"),
+    'prune-payloads': (prune_payloads, "Strip stored GitLab payloads to their payload_profiles.py profile"),
+    'archive': (archive, "Move rows past RETENTION_DAYS into monthly archive files"),
+    'vacuum': (vacuum, "Run an incremental VACUUM step"),
+    'rebuild-search': (rebuild_search, "Rebuild the full-text index over messages and daily reports"),
+    'rotate-key': (rotate_key, "Re-encrypt data under DB_PREVIOUS_* keys with the current key"),
+}
+
+
+def main():
+    init(autoreset=True)
+    parser = argparse.ArgumentParser(description="JarencyMonitoring database maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text)
+    args = parser.parse_args()
+
+    from server import db_manager, gitlab_event_writer
+    try:
+        COMMANDS[args.command][0](db_manager, args)
+    finally:
+        gitlab_event_writer.close()
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import json
+import re
+import struct
+import threading
+import zlib
+from collections import Counter
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# gitlab_events.payload_format values
+FORMAT_JSON = 0       # plain JSON text (rows written before compression)
+FORMAT_ZLIB = 1       # zlib-compressed JSON
+FORMAT_ZLIB_DICT = 2  # 2-byte dictionary id + zlib stream primed with that dictionary
+
+MAX_DICTIONARY_SIZE = 32 * 1024  # zlib only looks back 32 KB
+
+# Seed for the built-in dictionary: keys and values that show up in almost every GitLab hook
+GITLAB_PAYLOAD_SEED = [
+    '"object_kind": "push"', '"object_kind": "merge_request"', '"object_kind": "issue"',
+    '"object_kind": "note"', '"object_kind": "pipeline"', '"event_name": ', '"event_type": ',
+    '"before": ', '"after": ', '"ref": "refs/heads/', '"checkout_sha": ', '"user_id": ',
+    '"user_name": ', '"user_username": ', '"user_email": ', '"user_avatar": ', '"project_id": ',
+    '"project": {', '"id": ', '"name": ', '"description": ', '"web_url": ', '"avatar_url": null',
+    '"git_ssh_url": ', '"git_http_url": ', '"namespace": ', '"visibility_level": ',
+    '"path_with_namespace": ', '"default_branch": "main"', '"ci_config_path": ', '"homepage": ',
+    '"url": ', '"ssh_url": ', '"http_url": ', '"repository": {', '"commits": [', '"message": ',
+    '"title": ', '"timestamp": ', '"author": {', '"email": ', '"added": [', '"modified": [',
+    '"removed": [', '"total_commits_count": ', '"user": {', '"username": ', '"avatar_url": ',
+    '"object_attributes": {', '"iid": ', '"state": "opened"', '"state": "merged"',
+    '"state": "closed"', '"action": "open"', '"action": "update"', '"action": "merge"',
+    '"source_branch": ', '"target_branch": ', '"source_project_id": ', '"target_project_id": ',
+    '"author_id": ', '"assignee_id": ', '"assignee_ids": [', '"reviewer_ids": [',
+    '"merge_status": "can_be_merged"', '"merge_commit_sha": ', '"created_at": ', '"updated_at": ',
+    '"last_commit": {', '"work_in_progress": false', '"draft": false', '"labels": [',
+    '"changes": {', '"previous": ', '"current": ', '"assignees": [', '"reviewers": [',
+    '"status": "success"', '"status": "failed"', '"status": "running"', '"duration": ',
+    '"queued_duration": ', '"finished_at": ', '"stage": ', '"stages": [', '"builds": [',
+    '"noteable_type": "MergeRequest"', '"noteable_type": "Issue"', '"noteable_id": ', '"note": ',
+    '"merge_request": {', '"issue": {', '"commit": {', '"sha": ', '"tag": false', '"type": ',
+    'https://gitlab.', '.git"', '+00:00"', ' UTC"', 'null', 'true', 'false',
+]
+
+
+def build_dictionary(samples: Iterable[str] = (), seed: Iterable[str] = GITLAB_PAYLOAD_SEED,
+                     size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """Build a zlib preset dictionary from frequent fragments of sample payloads.
+
+    zlib finds matches cheapest near the end of the dictionary, so the most
+    frequent fragments are placed last.
+    """
+    seed = set(seed)
+    fragments = Counter({fragment: 1 for fragment in seed})
+    for sample in samples:
+        for fragment in re.findall(r'"[^"\\]{1,64}":\s?|"[^"\\]{1,48}"|\b(?:true|false|null)\b', sample):
+            fragments[fragment] += 1
+
+    chosen = []
+    total = 0
+    for fragment, count in fragments.most_common():
+        if count < 2 and fragment not in seed:
+            # Fragments seen once in the samples are noise
+            continue
+        encoded = fragment.encode()
+        if total + len(encoded) > size:
+            break
+        chosen.append(encoded)
+        total += len(encoded)
+    return b''.join(reversed(chosen))
+
+
+class PayloadCodec:
+    """Encodes webhook payloads for gitlab_events.payload_json and decodes any stored format.
+
+    loader(dictionary_id) fetches a dictionary this codec hasn't seen, e.g. one trained by
+    manage_db.py or the importer after the server started.
+    """
+
+    def __init__(self, dictionaries: Optional[Dict[int, bytes]] = None, level: int = 6,
+                 loader: Optional[Callable[[int], Optional[bytes]]] = None):
+        self.level = level
+        self.dictionaries = dict(dictionaries or {})
+        self._loader = loader
+        self._lock = threading.Lock()
+
+    @property
+    def current_dictionary_id(self) -> Optional[int]:
+        return max(self.dictionaries) if self.dictionaries else None
+
+    def add_dictionary(self, dictionary_id: int, dictionary: bytes):
+        self.dictionaries[dictionary_id] = dictionary
+
+    def dictionary(self, dictionary_id: int) -> Optional[bytes]:
+        """Dictionary by id, loaded on first use when another process added it"""
+        dictionary = self.dictionaries.get(dictionary_id)
+        if dictionary is None and self._loader is not None:
+            with self._lock:
+                dictionary = self.dictionaries.get(dictionary_id)
+                if dictionary is None:
+                    dictionary = self._loader(dictionary_id)
+                    if dictionary is not None:
+                        self.dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def encode(self, payload_json: str) -> Tuple[bytes, int]:
+        data = payload_json.encode()
+        dictionary_id = self.current_dictionary_id
+        if dictionary_id is None:
+            return zlib.compress(data, self.level), FORMAT_ZLIB
+        compressor = zlib.compressobj(self.level, zdict=self.dictionaries[dictionary_id])
+        return struct.pack('>H', dictionary_id) + compressor.compress(data) + compressor.flush(), FORMAT_ZLIB_DICT
+
+    def decode(self, stored, payload_format: Optional[int]) -> str:
+        """Return the payload as JSON text, whatever format it was stored in.
+        Raises ValueError for anything that can't be decoded (unknown dictionary, corrupt data)."""
+        if not payload_format:
+            return stored.decode() if isinstance(stored, bytes) else stored
+        try:
+            if payload_format == FORMAT_ZLIB:
+                return zlib.decompress(stored).decode()
+            if payload_format == FORMAT_ZLIB_DICT:
+                (dictionary_id,) = struct.unpack('>H', stored[:2])
+                dictionary = self.dictionary(dictionary_id)
+                if dictionary is None:
+                    raise ValueError(f"Unknown payload dictionary id {dictionary_id}")
+                decompressor = zlib.decompressobj(zdict=dictionary)
+                return (decompressor.decompress(stored[2:]) + decompressor.flush()).decode()
+        except (zlib.error, struct.error) as e:
+            raise ValueError(f"Corrupt payload ({e})") from e
+        raise ValueError(f"Unknown payload format {payload_format}")
+
+    def decode_json(self, stored, payload_format: Optional[int]) -> dict:
+        return json.loads(self.decode(stored, payload_format))
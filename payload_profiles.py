@@ -0,0 +1,98 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+# What is kept of each webhook kind before it is stored. Paths are dotted; "name[]"
+# applies the rest of the path to every item of a list; a path ending on an object
+# keeps that whole object. Kinds without a profile are stored as received.
+#
+# Keep everything the event_kinds.py extractors read (record fields, the acting user,
+# merged-MR follow-up data), plus ids/urls/timestamps for reporting. Dropped: repository
+# blobs, full commit file lists, MR changes/diffs, last_commit, builds, variables.
+COMMON_FIELDS = [
+    'object_kind', 'event_type', 'event_name',
+    'user.id', 'user.name', 'user.username',
+    'project.id', 'project.name', 'project.path_with_namespace', 'project.web_url',
+]
+
+PAYLOAD_PROFILES: Dict[str, List[str]] = {
+    'push': COMMON_FIELDS + [
+        'ref', 'before', 'after', 'checkout_sha', 'total_commits_count',
+        'user_id', 'user_name', 'user_username',
+        'commits[].id', 'commits[].message', 'commits[].timestamp', 'commits[].url', 'commits[].author.name',
+    ],
+    'merge_request': COMMON_FIELDS + [
+        'object_attributes.id', 'object_attributes.iid', 'object_attributes.title', 'object_attributes.state',
+        'object_attributes.action', 'object_attributes.source_branch', 'object_attributes.target_branch',
+        'object_attributes.url', 'object_attributes.created_at', 'object_attributes.updated_at',
+        'object_attributes.merge_status', 'object_attributes.author_id', 'object_attributes.draft',
+        'object_attributes.user',
+        'merge_request.iid', 'merge_request.title', 'merge_request.url', 'merge_request.author',
+        'labels[].title', 'assignees[].username', 'reviewers[].username',
+    ],
+    'issue': COMMON_FIELDS + [
+        'object_attributes.id', 'object_attributes.iid', 'object_attributes.title', 'object_attributes.state',
+        'object_attributes.action', 'object_attributes.url', 'object_attributes.created_at',
+        'object_attributes.updated_at', 'object_attributes.closed_at', 'object_attributes.user',
+        'labels[].title', 'assignees[].username',
+    ],
+    'note': COMMON_FIELDS + [
+        'object_attributes.id', 'object_attributes.note', 'object_attributes.noteable_type',
+        'object_attributes.url', 'object_attributes.created_at', 'object_attributes.user',
+        'merge_request.iid', 'merge_request.title', 'merge_request.url',
+        'issue.iid', 'issue.title', 'commit.id', 'commit.message',
+    ],
+    'pipeline': COMMON_FIELDS + [
+        'object_attributes.id', 'object_attributes.ref', 'object_attributes.tag', 'object_attributes.sha',
+        'object_attributes.status', 'object_attributes.source', 'object_attributes.created_at',
+        'object_attributes.finished_at', 'object_attributes.duration',
+        'commit.id', 'commit.message', 'commit.timestamp', 'commit.author',
+        'merge_request.iid', 'merge_request.title', 'merge_request.url',
+    ],
+}
+PAYLOAD_PROFILES['tag_push'] = PAYLOAD_PROFILES['push']
+
+
+def compile_profile(paths: List[str]) -> dict:
+    """Dotted paths -> nested dict of kept keys (an empty dict keeps the whole value)"""
+    tree = {}
+    for path in paths:
+        node = tree
+        for part in path.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+_COMPILED = {kind: compile_profile(paths) for kind, paths in PAYLOAD_PROFILES.items()}
+
+
+def _prune(value, tree: dict):
+    if not tree:
+        return value
+    if not isinstance(value, dict):
+        return value
+    kept = {}
+    for key, subtree in tree.items():
+        if key.endswith('[]'):
+            items = value.get(key[:-2])
+            if isinstance(items, list):
+                kept[key[:-2]] = [_prune(item, subtree) for item in items]
+        elif key in value:
+            kept[key] = _prune(value[key], subtree)
+    return kept
+
+
+def prune_payload(payload: dict) -> dict:
+    """The stored form of a webhook payload under its object_kind's profile"""
+    tree = _COMPILED.get(payload.get('object_kind'))
+    return _prune(payload, tree) if tree else payload
+
+
+def encode_stored_payload(payload: dict, codec, prune: bool = True,
+                          keep_raw: bool = False) -> Tuple[bytes, int, Optional[Tuple[bytes, int]]]:
+    """(blob, payload_format, raw) for gitlab_events; raw is the encoded original,
+    only when keep_raw is set and the profile changed something
+    """
+    stored = prune_payload(payload) if prune else payload
+    blob, payload_format = codec.encode(json.dumps(stored))
+    raw = codec.encode(json.dumps(payload)) if keep_raw and stored is not payload else None
+    return blob, payload_format, raw
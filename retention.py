@@ -0,0 +1,169 @@
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from search_index import SEARCH_TABLES
+
+# Tables moved into the monthly archives, with the timestamp column that decides the month
+ARCHIVED_TABLES = {
+    'gitlab_events': 'ts',
+    'messages': 'timestamp',
+}
+# Per-event child tables (keyed by event_id) that move together with their gitlab_events rows
+EVENT_CHILD_TABLES = ['gitlab_event_commits', 'gitlab_event_raw']
+ARCHIVE_FILE_RE = re.compile(r'^events_(\d{4})_(\d{2})\.db$')
+MAX_ATTACHED = 8  # SQLite allows 10 attached databases by default; keep headroom
+
+
+def month_bounds(month: str):
+    """'YYYY-MM' -> (first day, first day of next month) as ISO date strings"""
+    year, mon = map(int, month.split('-'))
+    start = datetime(year, mon, 1)
+    end = datetime(year + mon // 12, mon % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+class RetentionManager:
+    """Moves old rows out of the hot database into per-month archive files.
+
+    Archives are plain SQLite files (``events_YYYY_MM.db``) that are ATTACHed
+    only when a query range reaches back into their month.
+    """
+
+    def __init__(self, pool, archive_dir: str, retention_days: int, vacuum_pages: int = 2000):
+        self.pool = pool
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.vacuum_pages = vacuum_pages
+
+    def archive_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f"events_{month.replace('-', '_')}.db")
+
+    def list_archives(self) -> Dict[str, str]:
+        """'YYYY-MM' -> archive path, for every archive file on disk"""
+        if not os.path.isdir(self.archive_dir):
+            return {}
+        archives = {}
+        for name in sorted(os.listdir(self.archive_dir)):
+            match = ARCHIVE_FILE_RE.match(name)
+            if match:
+                archives[f"{match.group(1)}-{match.group(2)}"] = os.path.join(self.archive_dir, name)
+        return archives
+
+    def archives_for_range(self, since: str, until: Optional[str] = None) -> Dict[str, str]:
+        """Attach aliases -> paths of archives whose month overlaps [since, until)"""
+        selected = {}
+        for month, path in self.list_archives().items():
+            start, end = month_bounds(month)
+            if end > since and (until is None or start < until):
+                selected[f"archive_{month.replace('-', '_')}"] = path
+        return selected
+
+    def iter_partitions(self, since: str, until: Optional[str] = None):
+        """Yield (connection, schema) for the hot database and every archive overlapping the range.
+
+        Must be consumed completely: connections are borrowed from the pool.
+        """
+        with self.pool.reader() as conn:
+            yield conn, 'main'
+        archives = list(self.archives_for_range(since, until).items())
+        for i in range(0, len(archives), MAX_ATTACHED):
+            chunk = dict(archives[i:i + MAX_ATTACHED])
+            with self.pool.reader(attach=chunk) as conn:
+                for alias in chunk:
+                    yield conn, alias
+
+    def archive_old_rows(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Move rows older than the retention horizon into their month's archive file"""
+        cutoff = ((now or datetime.utcnow()) - timedelta(days=self.retention_days)).isoformat()
+        moved = {table: 0 for table in ARCHIVED_TABLES}
+
+        with self.pool.reader() as conn:
+            months = set()
+            for table, ts_column in ARCHIVED_TABLES.items():
+                rows = conn.execute(
+                    f"SELECT DISTINCT substr({ts_column}, 1, 7) FROM {table} WHERE {ts_column} < ?",
+                    (cutoff,)).fetchall()
+                months.update(row[0] for row in rows if row[0])
+
+        if months:
+            os.makedirs(self.archive_dir, exist_ok=True)
+        for month in sorted(months):
+            start, end = month_bounds(month)
+            end = min(end, cutoff)
+            with self.pool.writer(attach={'archive': self.archive_path(month)}) as conn:
+                for table in list(ARCHIVED_TABLES) + EVENT_CHILD_TABLES:
+                    self._sync_archive_table(conn, table)
+
+                # Commits and raw payloads follow their events, so copy them before the events are deleted
+                for table in EVENT_CHILD_TABLES:
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.{table} "
+                        f"SELECT c.* FROM main.{table} c JOIN main.gitlab_events e ON e.id = c.event_id "
+                        "WHERE e.ts >= ? AND e.ts < ?", (start, end))
+                    conn.execute(
+                        f"DELETE FROM main.{table} WHERE event_id IN "
+                        "(SELECT id FROM main.gitlab_events WHERE ts >= ? AND ts < ?)", (start, end))
+
+                for table, ts_column in ARCHIVED_TABLES.items():
+                    if table in SEARCH_TABLES:
+                        # Search covers the hot database only
+                        conn.execute(
+                            f"DELETE FROM main.{SEARCH_TABLES[table]} WHERE rowid IN "
+                            f"(SELECT id FROM main.{table} WHERE {ts_column} >= ? AND {ts_column} < ?)", (start, end))
+                    columns = ', '.join(self._columns(conn, 'main', table))
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.{table} ({columns}) "
+                        f"SELECT {columns} FROM main.{table} WHERE {ts_column} >= ? AND {ts_column} < ?",
+                        (start, end))
+                    cursor = conn.execute(
+                        f"DELETE FROM main.{table} WHERE {ts_column} >= ? AND {ts_column} < ?", (start, end))
+                    moved[table] += cursor.rowcount
+        return moved
+
+    @staticmethod
+    def _columns(conn, schema: str, table: str):
+        return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+    def _sync_archive_table(self, conn, table: str):
+        """Create the archive copy of a table, or add columns the hot table gained since"""
+        archive_columns = self._columns(conn, 'archive', table)
+        if not archive_columns:
+            create_sql = conn.execute(
+                "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+            conn.execute(re.sub(r'(?i)^\s*CREATE TABLE\s+(IF NOT EXISTS\s+)?\w+',
+                                f'CREATE TABLE archive.{table}', create_sql, count=1))
+            if table == 'gitlab_event_commits':
+                conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_commits_event ON gitlab_event_commits(event_id)")
+            elif table not in EVENT_CHILD_TABLES:
+                ts_column = ARCHIVED_TABLES[table]
+                conn.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_archive_{table}_ts ON {table}({ts_column})")
+                if table == 'gitlab_events':
+                    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_gitlab_dev_ts ON gitlab_events(dev, ts)")
+            return
+        for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+            name, column_type = row[1], row[2]
+            if name not in archive_columns:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {column_type}")
+
+    def upgrade_archives(self) -> int:
+        """Bring every archive's tables up to the hot schema (run after migrations)"""
+        archives = self.list_archives()
+        for path in archives.values():
+            with self.pool.writer(attach={'archive': path}) as conn:
+                for table in list(ARCHIVED_TABLES) + EVENT_CHILD_TABLES:
+                    self._sync_archive_table(conn, table)
+        return len(archives)
+
+    def incremental_vacuum(self) -> int:
+        """Release free pages back to the OS; switches the file to incremental auto-vacuum on first run"""
+        with self.pool.maintenance() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Changing auto_vacuum on an existing file needs one full VACUUM
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                return -1
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})").fetchall()
+            return min(free_pages, self.vacuum_pages)
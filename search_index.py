@@ -0,0 +1,68 @@
+import re
+from typing import List, Optional
+
+# FTS5 tables: rowid is the id of the source row
+SEARCH_TABLES = {
+    'messages': 'messages_fts',
+    'daily_reports': 'daily_reports_fts',
+}
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+SNIPPET_CHARS = 60
+
+
+def terms(text: Optional[str]) -> List[str]:
+    return [term.lower() for term in TERM_RE.findall(text or '')]
+
+
+def index_text(text: Optional[str], encryption=None) -> str:
+    """What goes into the FTS index: the text itself, or blind tokens when the database is encrypted"""
+    if encryption is None:
+        return text or ''
+    return ' '.join(encryption.blind_token(term) for term in terms(text))
+
+
+def match_query(query: str, encryption=None) -> Optional[str]:
+    """User input -> FTS5 MATCH expression (all terms must match; trailing * is a prefix search)"""
+    parts = []
+    for raw in query.split():
+        prefix = raw.endswith('*') and encryption is None
+        for term in terms(raw):
+            term = encryption.blind_token(term) if encryption else term
+            parts.append(f'"{term}"')
+        if prefix and parts:
+            parts[-1] += '*'
+    return ' '.join(parts) or None
+
+
+def make_snippet(text: str, query: str, width: int = SNIPPET_CHARS) -> str:
+    """Snippet around the first query term, for rows whose index holds no readable text"""
+    wanted = [term.rstrip('*') for term in terms(query)]
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in wanted if lowered.find(term) >= 0]
+    if not positions:
+        return text[:width * 2] + ('…' if len(text) > width * 2 else '')
+    start = max(min(positions) - width, 0)
+    end = min(min(positions) + width, len(text))
+    snippet = text[start:end]
+    for term in wanted:
+        snippet = re.sub(f'({re.escape(term)})', r'[\1]', snippet, flags=re.IGNORECASE)
+    return ('…' if start else '') + snippet + ('…' if end < len(text) else '')
+
+
+def merge_ranked(groups: List[List[dict]], limit: int) -> List[dict]:
+    """Merge per-source result lists (each best first) into one list.
+
+    bm25 scores from different FTS tables come from different corpora and aren't comparable,
+    so the sources are interleaved by rank. relative_score (score / best score of the same
+    source) breaks ties between equal ranks.
+    """
+    merged = []
+    for group in groups:
+        best = max((result['score'] for result in group), default=0)
+        for rank, result in enumerate(group, 1):
+            result['rank'] = rank
+            result['relative_score'] = round(result['score'] / best, 3) if best > 0 else 1.0
+            merged.append(result)
+    merged.sort(key=lambda result: (result['rank'], -result['relative_score']))
+    return merged[:limit]
@@ -1,8 +1,9 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 import sqlite3
+import hashlib
 import json
 import os
 import time
@@ -15,8 +16,31 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
 from config import HOST, PORT, DATABASE_FILE, TIMEZONE, DB_ENCRYPTION_KEY, DB_ENCRYPTION_PASSWORD, DB_SALT, DAILY_REMIND_TIME, DAILY_DEADLINE_TIME, N_CHANGED_FILES, GITLAB_TOKEN, GITLAB_URL
-from encryption import DatabaseEncryption
-from pytz import timezone
+from config import DB_READER_POOL_SIZE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, GITLAB_EVENT_BATCH_SIZE, GITLAB_EVENT_FLUSH_MS
+from config import WRITE_BEHIND_RETRIES, WRITE_BEHIND_RETRY_MS
+from config import GITLAB_PAYLOAD_PRUNING, GITLAB_RAW_PAYLOAD_ARCHIVE
+from config import RETENTION_DAYS, ARCHIVE_DIR, RETENTION_TIME, INCREMENTAL_VACUUM_PAGES
+from config import GITLAB_MAX_CONNECTIONS_PER_HOST, GITLAB_API_RETRIES, GITLAB_API_TIMEOUT, GITLAB_MR_CACHE_TTL
+from config import WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_INBOX_FLUSH_MS, WEBHOOK_INBOX_MAX_ATTEMPTS, WEBHOOK_DEDUP_CACHE_SIZE
+from config import WEBHOOK_INBOX_SWEEP_SECONDS
+from config import KEY_CACHE_FILE, DB_PREVIOUS_ENCRYPTION_KEY, DB_PREVIOUS_ENCRYPTION_PASSWORD, DB_PREVIOUS_SALT
+from config import FACTS_CACHE_SIZE, USER_MORNING_DIGEST, HTTP_COMPRESSION, HTTP_COMPRESSION_MIN_SIZE, HTTP_GZIP_LEVEL
+from encryption import DatabaseEncryption, field_aad, password_salt
+from key_cache import KeyCache
+from db_pool import ConnectionPool
+from async_db import AsyncDatabase
+from write_behind import WriteBehindQueue
+from webhook_worker import WebhookWorker
+from delivery_dedup import RecentKeys, delivery_key
+from facts_cache import FactsCache
+from http_cache import ROLLING_WINDOW_STEP, conditional_json, is_fresh, json_response, make_etag, not_modified
+from gitlab_client import GitLabClient
+from payload_codec import PayloadCodec, FORMAT_JSON, build_dictionary
+from payload_profiles import prune_payload, encode_stored_payload
+from event_kinds import get_kind, normalize_event
+from retention import RetentionManager
+from search_index import SEARCH_TABLES, index_text, match_query, make_snippet, merge_ranked
+from pytz import timezone, utc
 import logging
 from fastapi import Request
 import gspread
@@ -29,7 +53,6 @@ from config import (
     GOOGLE_CREDENTIALS_FILE, TIMESHEET_CHECK_TIME, DEVELOPER_SHEETS,
     TIMESHEET_REMINDER_ENABLED, TIMESHEET_CHECK_DAYS_BACK, MIN_HOURS_THRESHOLD
 )
-import aiohttp
 from pytz import timezone as pytz_timezone
 
 
@@ -37,6 +60,15 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Telegram Bot Server", version="1.0.0")
 
+# Negotiated response compression: brotli when brotli-asgi is installed (falls back to gzip), else gzip
+if HTTP_COMPRESSION:
+    try:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(BrotliMiddleware, minimum_size=HTTP_COMPRESSION_MIN_SIZE, gzip_fallback=True)
+    except ImportError:
+        from starlette.middleware.gzip import GZipMiddleware
+        app.add_middleware(GZipMiddleware, minimum_size=HTTP_COMPRESSION_MIN_SIZE, compresslevel=HTTP_GZIP_LEVEL)
+
 # --- Simple stats container ---
 class ServerStats:
     def __init__(self):
@@ -58,26 +90,220 @@ class MessageData(BaseModel):
     message_type: str
 
 
+def local_timezone():
+    return timezone(TIMEZONE) if TIMEZONE else utc
+
+
+# Developers with their own timezone in USER_MORNING_DIGEST; everyone else uses TIMEZONE
+DEV_TIMEZONES = {dev: config['timezone'] for dev, config in USER_MORNING_DIGEST.items() if config.get('timezone')}
+
+
+def dev_timezone(dev: Optional[str]):
+    """Timezone a developer's days are counted in"""
+    name = DEV_TIMEZONES.get(dev)
+    return timezone(name) if name else local_timezone()
+
+
+def local_dates_signature() -> str:
+    """Changes whenever a stored local_date could change (TIMEZONE or a developer's timezone)"""
+    settings = json.dumps([TIMEZONE, sorted(DEV_TIMEZONES.items())])
+    return hashlib.sha1(settings.encode()).hexdigest()[:12]
+
+
+def utc_to_local_date(ts: str, tz=None) -> str:
+    """Local calendar date (YYYY-MM-DD) of a naive UTC ISO timestamp, in tz (default: TIMEZONE)"""
+    moment = datetime.fromisoformat(ts)
+    if moment.tzinfo is None:
+        moment = utc.localize(moment)
+    return moment.astimezone(tz or local_timezone()).strftime("%Y-%m-%d")
+
+
+def to_epoch(value) -> int:
+    """Epoch seconds from an epoch number, a datetime or an ISO string (naive values are UTC)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = utc.localize(moment)
+    return int(moment.timestamp())
+
+
+def epoch_to_iso(epoch: int) -> str:
+    """Epoch seconds -> naive UTC ISO string, comparable with gitlab_events.ts"""
+    return datetime.utcfromtimestamp(epoch).isoformat()
+
+
+def parse_range_bound(value: Optional[str], end: bool = False, tz=None) -> Optional[int]:
+    """API range bound -> epoch seconds. A bare YYYY-MM-DD is a local day (in tz); as an end bound the day is included"""
+    if value is None:
+        return None
+    if len(value) == 10:
+        start, next_day = local_date_bounds_utc(value, tz)
+        return to_epoch(next_day if end else start)
+    return to_epoch(value)
+
+
+def resolve_range(since_hours: int, since=None, until=None) -> Tuple[int, Optional[int]]:
+    """(since, until) in epoch seconds; without an explicit since the range is the last since_hours before until/now"""
+    until = to_epoch(until) if until is not None else None
+    since = to_epoch(since) if since is not None else (until or to_epoch(datetime.utcnow())) - since_hours * 3600
+    return since, until
+
+
+def parse_facts_cursor(cursor: str) -> Tuple[int, int]:
+    """'<ts_epoch>.<id>' keyset cursor from a previous facts page"""
+    ts_epoch, event_id = cursor.split('.')
+    return int(ts_epoch), int(event_id)
+
+
+def local_date_bounds_utc(date: str, tz=None) -> Tuple[str, str]:
+    """[start, end) of a local calendar day (in tz, default TIMEZONE) as naive UTC ISO strings"""
+    tz = tz or local_timezone()
+    day = datetime.strptime(date, "%Y-%m-%d")
+    start = tz.localize(day).astimezone(utc).replace(tzinfo=None)
+    end = tz.localize(day + timedelta(days=1)).astimezone(utc).replace(tzinfo=None)
+    return start.isoformat(), end.isoformat()
+
+
+def is_daily_message(content: Optional[str]) -> bool:
+    """/daily command or a #daily tag, matched case-insensitively like the old LIKE filter"""
+    text = (content or '').lower()
+    return text.startswith('/daily') or '#daily' in text
+
+
+def message_local_date(ts: str) -> str:
+    try:
+        return utc_to_local_date(ts)
+    except ValueError:
+        return ts[:10]
+
+
+# Extracted gitlab_events columns (filled at ingest from the event_kinds.py record)
+GITLAB_EVENT_FIELD_COLUMNS = [
+    'project', 'branch', 'commit_count', 'object_iid', 'object_title',
+    'object_state', 'object_action', 'source_branch', 'target_branch', 'description'
+]
+
+
+FACT_EVENT_COLUMNS = ['id', 'dev', 'ts', 'ts_epoch', 'type'] + GITLAB_EVENT_FIELD_COLUMNS
+
+# Content columns sealed when encryption is on: (table, column, column whose value the sealed field is bound to)
+SEALED_CONTENT_COLUMNS = [
+    ('messages', 'content', 'id'),
+    ('daily_reports', 'content', 'id'),
+    ('daily_messages', 'content', 'message_row_id'),
+]
+
+# Columns sealed when encryption is on, each with a <column>_bidx blind index for equality lookups:
+# (table, column, column whose value the sealed field is bound to)
+BLIND_INDEX_COLUMNS = [
+    ('messages', 'username', 'id'),
+    ('daily_messages', 'username', 'message_row_id'),
+    ('user_mapping', 'gitlab_username', 'id'),
+]
+
+
 # --- Database manager (unchanged) ---
+# Password-derived keys survive restarts here (checked against the database on load), so PBKDF2 runs once rather than per process
+key_cache = KeyCache(KEY_CACHE_FILE) if KEY_CACHE_FILE else None
+
+
 class DatabaseManager:
 
     def __init__(self):
         self.encryption = None
-
+        self.payload_codec = PayloadCodec(loader=self._load_payload_dictionary)
+        self.prune_payloads = GITLAB_PAYLOAD_PRUNING
+        self.raw_payload_archive = GITLAB_RAW_PAYLOAD_ARCHIVE
+
+        self.pool = ConnectionPool(
+            DATABASE_FILE,
+            readers=DB_READER_POOL_SIZE,
+            cache_size_kb=DB_CACHE_SIZE_KB,
+            mmap_size=DB_MMAP_SIZE
+        )
+        self.retention = RetentionManager(
+            self.pool, ARCHIVE_DIR, RETENTION_DAYS, vacuum_pages=INCREMENTAL_VACUUM_PAGES
+        )
+        rotating = bool(DB_PREVIOUS_ENCRYPTION_KEY or DB_PREVIOUS_ENCRYPTION_PASSWORD)
         if DB_ENCRYPTION_KEY:
             print(f"{Fore.GREEN}🔐 Using direct encryption key")
             self.encryption = DatabaseEncryption(direct_key=DB_ENCRYPTION_KEY)
         elif DB_ENCRYPTION_PASSWORD:
             print(f"{Fore.GREEN}🔐 Using password-derived encryption")
-            self.encryption = DatabaseEncryption(password=DB_ENCRYPTION_PASSWORD)
+            # A cached key is only used if it opens this database's verifier; mid-rotation it's derived afresh
+            token = self._key_verifier()
+            self.encryption = DatabaseEncryption(
+                password=DB_ENCRYPTION_PASSWORD, key_cache=key_cache,
+                verify_key=lambda key: token is not None and
+                DatabaseEncryption(direct_key=key).check_verifier(token) is not None,
+                refresh_cache=rotating
+            )
         else:
             print(f"{Fore.YELLOW}⚠️ No encryption credentials found - running without encryption")
-
+        if self.encryption and rotating:
+            # Mid-rotation: data under the old key stays readable, new writes use the current one
+            if DB_PREVIOUS_ENCRYPTION_KEY:
+                self.encryption.add_key(DB_PREVIOUS_ENCRYPTION_KEY)
+            if DB_PREVIOUS_ENCRYPTION_PASSWORD:
+                salt = DB_PREVIOUS_SALT.encode() if DB_PREVIOUS_SALT else password_salt()
+                self.encryption.add_password(DB_PREVIOUS_ENCRYPTION_PASSWORD, salt)
+            print(f"{Fore.CYAN}🔑 Previous encryption key accepted for reads (run manage_db.py rotate-key)")
+        if self.encryption:
+            self._update_key_verifier()
+
+        # Redelivered webhooks dropped by the unique delivery_key index
+        self.duplicate_deliveries = 0
+        self.facts_cache = FactsCache(FACTS_CACHE_SIZE)
         self.init_database()
 
+    def _key_verifier(self) -> Optional[bytes]:
+        """The database's key verifier token (created before the schema: the key is needed first)"""
+        with self.pool.writer() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS key_verifier (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    token BLOB NOT NULL
+                )
+            """)
+            row = conn.execute("SELECT token FROM key_verifier WHERE id = 1").fetchone()
+        return row[0] if row else None
+
+    def _update_key_verifier(self):
+        """Seal the verifier under the current key: on first use, and once a rotation starts.
+        One no registered key opens is left alone - the configured key is probably the wrong one."""
+        token = self._key_verifier()
+        key_id = self.encryption.check_verifier(token) if token is not None else None
+        if token is not None and key_id is None:
+            print(f"{Fore.RED}⚠️ The encryption key doesn't open this database's key verifier "
+                  f"(wrong password or salt?) - data written earlier won't decrypt")
+            return
+        if key_id != self.encryption.key_id:
+            with self.pool.writer() as conn:
+                conn.execute("INSERT OR REPLACE INTO key_verifier (id, token) VALUES (1, ?)",
+                             (self.encryption.make_verifier(),))
+
     def init_database(self):
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
+        with self.pool.writer() as conn:
+            self._create_schema(conn.cursor())
+        self.retention.upgrade_archives()
+        # Archived events written before ts_epoch existed
+        for path in self.retention.list_archives().values():
+            with self.pool.writer(attach={'archive': path}) as conn:
+                self._backfill_event_epochs(conn.cursor(), 'archive')
+
+        # local_date follows each developer's timezone; restamp when the timezone settings change
+        migration = f"local_dates_{local_dates_signature()}"
+        with self.pool.reader() as conn:
+            applied = conn.execute("SELECT 1 FROM migrations WHERE name = ?", (migration,)).fetchone()
+        if not applied:
+            count = self.restamp_local_dates()
+            with self.pool.writer() as conn:
+                conn.execute("DELETE FROM migrations WHERE name LIKE 'local_dates_%'")
+                conn.execute("INSERT INTO migrations (name) VALUES (?)", (migration,))
+            print(f"{Fore.GREEN}✅ Restamped local dates of {count} GitLab events")
+
+    def _create_schema(self, cursor):
 
         # GitLab
         cursor.execute('''
@@ -90,6 +316,29 @@ class DatabaseManager:
             )
         ''')
 
+        # Durable inbox: raw webhook bodies from receipt until the worker has stored them.
+        # stored = 1 means the event row exists and only follow-up work (MR reminders) is left.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_inbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                received_at TEXT NOT NULL,
+                body BLOB NOT NULL,
+                delivery_key TEXT,
+                stored INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+        # import_events.py checkpoints: bytes of each export file already imported
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS import_progress (
+                source TEXT PRIMARY KEY,
+                byte_offset INTEGER NOT NULL,
+                rows INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT
+            )
+        ''')
+
         # отчёты
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS daily_reports (
@@ -126,6 +375,78 @@ class DatabaseManager:
     content TEXT,
     message_type TEXT)
     ''')
+        # Commits of push events, extracted at ingest
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gitlab_event_commits (
+                event_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                sha TEXT,
+                message TEXT,
+                ts TEXT,
+                PRIMARY KEY (event_id, position)
+            )
+        ''')
+
+        # Untouched webhook payloads, only written when GITLAB_RAW_PAYLOAD_ARCHIVE is on
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gitlab_event_raw (
+                event_id INTEGER PRIMARY KEY,
+                payload BLOB NOT NULL,
+                payload_format INTEGER NOT NULL
+            )
+        ''')
+
+        # /daily reports detected at save time, so check_daily is a point lookup
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_row_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                user_id INTEGER,
+                username TEXT,
+                local_date TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                content TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_messages_user_date ON daily_messages(user_id, local_date, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_messages_username_date ON daily_messages(username, local_date, timestamp)')
+
+        # Full-text search over chat messages and /daily reports (rowid = source row id).
+        # With encryption enabled the index holds blind tokens, see search_index.py
+        for fts_table in SEARCH_TABLES.values():
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} "
+                           f"USING fts5(body, tokenize='unicode61 remove_diacritics 2')")
+
+        # zlib preset dictionaries for compressed payloads (see payload_codec.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payload_dictionaries (
+                id INTEGER PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                dictionary BLOB NOT NULL
+            )
+        ''')
+        cursor.execute("SELECT id, dictionary FROM payload_dictionaries")
+        for dictionary_id, dictionary in cursor.fetchall():
+            self.payload_codec.add_dictionary(dictionary_id, dictionary)
+        if self.payload_codec.current_dictionary_id is None:
+            dictionary = build_dictionary()
+            cursor.execute("INSERT INTO payload_dictionaries (id, dictionary) VALUES (1, ?)", (dictionary,))
+            self.payload_codec.add_dictionary(1, dictionary)
+
+        # Per-day activity rollup, updated in the same transaction as each event insert
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gitlab_daily_activity (
+                dev TEXT NOT NULL,
+                local_date TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                first_ts TEXT,
+                last_ts TEXT,
+                PRIMARY KEY (dev, local_date, event_type)
+            ) WITHOUT ROWID
+        ''')
+
         # server.py → DatabaseManager.init_database
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_mapping (
@@ -135,82 +456,55 @@ class DatabaseManager:
             )
         ''')
 
-        def add_user_mapping(self, gitlab_username: str, telegram_id: int):
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO user_mapping (gitlab_username, telegram_id)
-                VALUES (?, ?)
-            """, (gitlab_username, telegram_id))
-            conn.commit()
-            conn.close()
-
-        def get_telegram_id(self, gitlab_username: str) -> Optional[int]:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute("SELECT telegram_id FROM user_mapping WHERE gitlab_username = ?", (gitlab_username,))
-            row = cursor.fetchone()
-            conn.close()
-            return row[0] if row else None
-
-        def get_gitlab_username(self, telegram_id: int) -> Optional[str]:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute("SELECT gitlab_username FROM user_mapping WHERE telegram_id = ?", (telegram_id,))
-            row = cursor.fetchone()
-            conn.close()
-            return row[0] if row else None
-
-        def list_user_mappings(self) -> list[dict]:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute("SELECT gitlab_username, telegram_id FROM user_mapping")
-            rows = cursor.fetchall()
-            conn.close()
-            return [{"gitlab_username": r[0], "telegram_id": r[1]} for r in rows]
-
         # Индексы для ускорения запросов
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_gitlab_dev_ts ON gitlab_events(dev, ts)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_dev_date ON daily_reports(dev, date)')
 
         self.apply_migrations(cursor)
 
-        conn.commit()
-        conn.close()
-
     def add_user_mapping(self, gitlab_username: str, telegram_id: int):
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO user_mapping (gitlab_username, telegram_id)
-            VALUES (?, ?)
-        """, (gitlab_username, telegram_id))
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            # A sealed name never collides with itself; the unique blind index replaces the old mapping instead
+            row_id = self._next_rowid(conn, 'user_mapping')
+            conn.execute("""
+                INSERT OR REPLACE INTO user_mapping (id, gitlab_username, gitlab_username_bidx, telegram_id)
+                VALUES (?, ?, ?, ?)
+            """, (row_id, self._seal(gitlab_username, 'user_mapping', row_id, 'gitlab_username'),
+                  self._blind(gitlab_username), telegram_id))
 
     def get_telegram_id(self, gitlab_username: str) -> Optional[int]:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT telegram_id FROM user_mapping WHERE gitlab_username = ?", (gitlab_username,))
-        row = cursor.fetchone()
-        conn.close()
+        column, value = self._lookup('gitlab_username', gitlab_username)
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                f"SELECT telegram_id FROM user_mapping WHERE {column} = ?", (value,)
+            ).fetchone()
         return row[0] if row else None
 
     def get_gitlab_username(self, telegram_id: int) -> Optional[str]:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT gitlab_username FROM user_mapping WHERE telegram_id = ?", (telegram_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return row[0] if row else None
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                "SELECT id, gitlab_username FROM user_mapping WHERE telegram_id = ?", (telegram_id,)
+            ).fetchone()
+        return self._readable(row[1], 'user_mapping', row[0], 'gitlab_username') if row else None
 
     def list_user_mappings(self) -> list[dict]:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT gitlab_username, telegram_id FROM user_mapping")
-        rows = cursor.fetchall()
-        conn.close()
-        return [{"gitlab_username": r[0], "telegram_id": r[1]} for r in rows]
+        with self.pool.reader() as conn:
+            rows = conn.execute("SELECT id, gitlab_username, telegram_id FROM user_mapping").fetchall()
+        return [{"gitlab_username": self._readable(r[1], 'user_mapping', r[0], 'gitlab_username'),
+                 "telegram_id": r[2]} for r in rows]
+
+    def find_telegram_id_in_messages(self, dev: str) -> Optional[int]:
+        """Fallback lookup of a Telegram user id by chat username, then by first name"""
+        column, value = self._lookup('username', dev)
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                f"SELECT user_id FROM messages WHERE {column} = ? ORDER BY timestamp DESC LIMIT 1",
+                (value,)).fetchone()
+            if not row:
+                row = conn.execute(
+                    "SELECT user_id FROM messages WHERE first_name LIKE ? ORDER BY timestamp DESC LIMIT 1",
+                    (f"%{dev}%",)).fetchone()
+        return row[0] if row else None
 
     def apply_migrations(self, cursor):
         """Enhanced migration method"""
@@ -235,210 +529,875 @@ class DatabaseManager:
             """)
             print(f"{Fore.GREEN}✅ Added content column to daily_reports")
 
-        print(f"{Fore.GREEN}✅ Database migrations applied")
+        # Extracted event columns, so reads never have to parse payload_json
+        cursor.execute("PRAGMA table_info(gitlab_events)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'payload_format' not in columns:
+            # 0 = plain JSON text; compressed formats are listed in payload_codec.py
+            cursor.execute('ALTER TABLE gitlab_events ADD COLUMN payload_format INTEGER NOT NULL DEFAULT 0')
+        for column in GITLAB_EVENT_FIELD_COLUMNS:
+            if column not in columns:
+                column_type = 'INTEGER' if column in ('commit_count', 'object_iid') else 'TEXT'
+                cursor.execute(f'ALTER TABLE gitlab_events ADD COLUMN {column} {column_type}')
+
+        # Integer epoch seconds and the local calendar date, so range reads never compare strings
+        if 'ts_epoch' not in columns:
+            cursor.execute('ALTER TABLE gitlab_events ADD COLUMN ts_epoch INTEGER')
+            cursor.execute('ALTER TABLE gitlab_events ADD COLUMN local_date TEXT')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_gitlab_dev_epoch ON gitlab_events(dev, ts_epoch)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_gitlab_epoch ON gitlab_events(ts_epoch)')
+        # One developer's local day (in their own timezone), newest first
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_gitlab_dev_local_date ON gitlab_events(dev, local_date, ts_epoch)')
+
+        # Idempotency key of the webhook delivery; redeliveries hit the unique index and are ignored
+        if 'delivery_key' not in columns:
+            cursor.execute('ALTER TABLE gitlab_events ADD COLUMN delivery_key TEXT')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_gitlab_delivery_key ON gitlab_events(delivery_key)')
+        cursor.execute("PRAGMA table_info(webhook_inbox)")
+        if 'delivery_key' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE webhook_inbox ADD COLUMN delivery_key TEXT')
+
+        # Blind indexes of sealed columns (see BLIND_INDEX_COLUMNS); NULL while encryption is off
+        for table, column, _ in BLIND_INDEX_COLUMNS:
+            cursor.execute(f"PRAGMA table_info({table})")
+            if f'{column}_bidx' not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column}_bidx TEXT')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_username ON messages(username, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_username_bidx ON messages(username_bidx, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_messages_username_bidx_date '
+                       'ON daily_messages(username_bidx, local_date, timestamp)')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_mapping_gitlab_bidx '
+                       'ON user_mapping(gitlab_username_bidx)')
+
+        if not self._migration_applied(cursor, 'epoch_gitlab_event_timestamps'):
+            count = self._backfill_event_epochs(cursor)
+            cursor.execute("""
+                INSERT INTO migrations (name) VALUES ('epoch_gitlab_event_timestamps')
+            """)
+            print(f"{Fore.GREEN}✅ Converted {count} GitLab event timestamps to epoch")
 
+        if not self._migration_applied(cursor, 'extract_gitlab_event_columns'):
+            count = self._backfill_event_columns(cursor)
+            cursor.execute("""
+                INSERT INTO migrations (name) VALUES ('extract_gitlab_event_columns')
+            """)
+            print(f"{Fore.GREEN}✅ Extracted columns for {count} existing GitLab events")
 
-    def add_gitlab_event(self, dev: str, event_type: str, payload: dict):
-        event_type = payload.get('object_kind', 'unknown')
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO gitlab_events (dev, ts, type, payload_json) VALUES (?, ?, ?, ?)",
-            (dev, datetime.utcnow().isoformat(), event_type, json.dumps(payload)))
-        conn.commit()
-        conn.close()
-    def get_gitlab_events(self, dev: str, period_hours: int = 24) -> list:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        since = (datetime.utcnow() - timedelta(hours=period_hours)).isoformat()
+        if not self._migration_applied(cursor, 'build_gitlab_daily_activity'):
+            count = self._rebuild_daily_activity(cursor)
+            cursor.execute("""
+                INSERT INTO migrations (name) VALUES ('build_gitlab_daily_activity')
+            """)
+            print(f"{Fore.GREEN}✅ Built daily activity rollup ({count} rows)")
+
+        if not self._migration_applied(cursor, 'index_daily_messages'):
+            cursor.execute(
+                "SELECT id, message_id, user_id, username, timestamp, content FROM messages "
+                "WHERE content LIKE '/daily%' OR content LIKE '%#daily%'")
+            rows = [row for row in cursor.fetchall() if is_daily_message(row[5])]
+            for row in rows:
+                self._insert_daily_message(cursor, *row)
+            cursor.execute("""
+                INSERT INTO migrations (name) VALUES ('index_daily_messages')
+            """)
+            print(f"{Fore.GREEN}✅ Indexed {len(rows)} existing /daily messages")
+
+        # The search index is rebuilt whenever encryption is switched on or off, or its key changes
+        search_migration = f"build_search_index_{f'blind_{self.encryption.index_key_id}' if self.encryption else 'plain'}"
+        if not self._migration_applied(cursor, search_migration):
+            count = self._rebuild_search_index(cursor)
+            cursor.execute("DELETE FROM migrations WHERE name LIKE 'build_search_index_%'")
+            cursor.execute("INSERT INTO migrations (name) VALUES (?)", (search_migration,))
+            print(f"{Fore.GREEN}✅ Built search index ({count} rows)")
+
+        # Blind indexes are recomputed for rows written before encryption was on, or under another key
+        if self.encryption:
+            blind_migration = f"blind_indexes_{self.encryption.index_key_id}"
+            if not self._migration_applied(cursor, blind_migration):
+                count = self._rebuild_blind_indexes(cursor)
+                cursor.execute("DELETE FROM migrations WHERE name LIKE 'blind_indexes_%'")
+                cursor.execute("INSERT INTO migrations (name) VALUES (?)", (blind_migration,))
+                print(f"{Fore.GREEN}✅ Built blind indexes ({count} values)")
 
+        print(f"{Fore.GREEN}✅ Database migrations applied")
+
+    @staticmethod
+    def _migration_applied(cursor, name: str) -> bool:
+        cursor.execute("SELECT 1 FROM migrations WHERE name = ?", (name,))
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def _backfill_event_epochs(cursor, schema: str = 'main') -> int:
+        cursor.execute(f"SELECT id, dev, ts FROM {schema}.gitlab_events WHERE ts_epoch IS NULL")
+        updates = [(to_epoch(ts), utc_to_local_date(ts, dev_timezone(dev)), event_id)
+                   for event_id, dev, ts in cursor.fetchall()]
+        cursor.executemany(f"UPDATE {schema}.gitlab_events SET ts_epoch = ?, local_date = ? WHERE id = ?", updates)
+        return len(updates)
+
+    def _backfill_event_columns(self, cursor) -> int:
+        """One-time extraction for rows stored before the columns existed"""
+        cursor.execute("SELECT id, type, payload_json, payload_format FROM gitlab_events WHERE description IS NULL")
+        count = 0
+        for event_id, event_type, payload_json, payload_format in cursor.fetchall():
+            try:
+                payload = self.payload_codec.decode_json(payload_json, payload_format)
+            except (TypeError, ValueError):
+                print(f"{Fore.YELLOW}⚠️ Could not parse payload for event {event_id}")
+                payload = {}
+            fields = normalize_event({**payload, 'object_kind': event_type})
+            self._write_event_fields(cursor, event_id, fields)
+            count += 1
+        return count
+
+    @staticmethod
+    def _write_event_fields(cursor, event_id: int, fields: dict):
+        assignments = ', '.join(f"{column} = ?" for column in GITLAB_EVENT_FIELD_COLUMNS)
         cursor.execute(
-            "SELECT * FROM gitlab_events WHERE dev = ? AND ts >= ?",
-            (dev, since))
-        events = [dict(zip(['id', 'dev', 'ts', 'type', 'payload'], row)) for row in cursor.fetchall()]
-        conn.close()
+            f"UPDATE gitlab_events SET {assignments} WHERE id = ?",
+            [fields[column] for column in GITLAB_EVENT_FIELD_COLUMNS] + [event_id])
+        DatabaseManager._insert_event_commits(cursor, event_id, fields['commits'])
+
+    @staticmethod
+    def _bump_daily_activity(cursor, rows: List[dict]):
+        cursor.executemany("""
+            INSERT INTO gitlab_daily_activity (dev, local_date, event_type, count, first_ts, last_ts)
+            VALUES (:dev, :local_date, :type, 1, :ts, :ts)
+            ON CONFLICT (dev, local_date, event_type) DO UPDATE SET
+                count = count + 1,
+                first_ts = min(first_ts, excluded.first_ts),
+                last_ts = max(last_ts, excluded.last_ts)
+        """, rows)
+
+    def _rebuild_daily_activity(self, cursor, archived_rows=()) -> int:
+        cursor.execute("DELETE FROM gitlab_daily_activity")
+        cursor.execute("SELECT dev, ts, type FROM gitlab_events")
+        rollup = {}
+        for dev, ts, event_type in list(archived_rows) + cursor.fetchall():
+            key = (dev, utc_to_local_date(ts, dev_timezone(dev)), event_type)
+            count, first_ts, last_ts = rollup.get(key, (0, ts, ts))
+            rollup[key] = (count + 1, min(first_ts, ts), max(last_ts, ts))
+        cursor.executemany(
+            "INSERT INTO gitlab_daily_activity (dev, local_date, event_type, count, first_ts, last_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [key + value for key, value in rollup.items()])
+        return len(rollup)
+
+    def _readable(self, value, table: str, row_key, column: str = 'content') -> Optional[str]:
+        """Plaintext of a stored field, whichever format it was written in"""
+        if self.encryption and self.encryption.is_encrypted(value):
+            return self.encryption.decrypt_field(value, field_aad(table, column, row_key))
+        return value
+
+    def _seal(self, text: Optional[str], table: str, row_key, column: str = 'content'):
+        """Value to store for a sensitive field: binary AEAD bound to its row and column when encryption is on"""
+        if self.encryption:
+            return self.encryption.encrypt_field(text, field_aad(table, column, row_key))
+        return text
+
+    def _blind(self, value: Optional[str]) -> Optional[str]:
+        """Blind index value of a sealed column (None while encryption is off)"""
+        if self.encryption and value is not None:
+            return self.encryption.blind_index(value)
+        return None
+
+    def _lookup(self, column: str, value: str) -> tuple:
+        """Column and parameter for an equality lookup: the blind index when encryption is on"""
+        if self.encryption:
+            return f"{column}_bidx", self.encryption.blind_index(value)
+        return column, value
+
+    def _rebuild_blind_indexes(self, cursor) -> int:
+        count = 0
+        for table, column, row_key in BLIND_INDEX_COLUMNS:
+            cursor.execute(f"SELECT id, {row_key}, {column} FROM {table} WHERE {column} IS NOT NULL")
+            updates = [(self._blind(self._readable(value, table, key, column)), row_id)
+                       for row_id, key, value in cursor.fetchall()]
+            cursor.executemany(f"UPDATE {table} SET {column}_bidx = ? WHERE id = ?", updates)
+            count += len(updates)
+        return count
+
+    def reseal_encrypted_fields(self) -> int:
+        """Re-encrypt, with the current key, every field sealed under a previous key or still in
+        the legacy Fernet text format. Values no registered key can read are left alone."""
+        if not self.encryption:
+            return 0
+        count = 0
+        with self.pool.writer() as conn:
+            for table, column, row_key in SEALED_CONTENT_COLUMNS + BLIND_INDEX_COLUMNS:
+                rows = conn.execute(
+                    f"SELECT id, {row_key}, {column} FROM {table} WHERE {column} IS NOT NULL").fetchall()
+                updates = []
+                for row_id, key, value in rows:
+                    if not self.encryption.needs_reseal(value):
+                        continue
+                    text = self._readable(value, table, key, column)
+                    if text is None or self.encryption.is_encrypted(text):
+                        continue
+                    updates.append((self._seal(text, table, key, column), row_id))
+                conn.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+                count += len(updates)
+        return count
+
+    @staticmethod
+    def _next_rowid(cursor, table: str) -> int:
+        """Id the next insert into an AUTOINCREMENT table gets (stable only inside a writer transaction),
+        so a field can be sealed to its row before the row exists"""
+        row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        return (row[0] if row else 0) + 1
+
+    def _index_search(self, cursor, table: str, rowid: int, text: Optional[str]):
+        if text:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLES[table]} (rowid, body) VALUES (?, ?)",
+                           (rowid, index_text(text, self.encryption)))
+
+    def _rebuild_search_index(self, cursor) -> int:
+        count = 0
+        for table, fts_table in SEARCH_TABLES.items():
+            cursor.execute(f"DELETE FROM {fts_table}")
+            cursor.execute(f"SELECT id, content FROM {table} WHERE content IS NOT NULL AND content != ''")
+            for rowid, content in cursor.fetchall():
+                self._index_search(cursor, table, rowid, self._readable(content, table, rowid))
+                count += 1
+        return count
+
+    def rebuild_search_index(self) -> int:
+        with self.pool.writer() as conn:
+            return self._rebuild_search_index(conn.cursor())
+
+    def search_text(self, query: str, user: str = None, date_from: str = None, date_to: str = None,
+                    source: str = None, limit: int = 20) -> List[dict]:
+        """Ranked full-text search over chat messages and daily reports"""
+        match = match_query(query, self.encryption)
+        if not match:
+            return []
+        # Blind tokens make FTS snippets meaningless; those are cut from the decrypted row instead
+        snippet_sql = "NULL" if self.encryption else "snippet({}, 0, '[', ']', '…', 12)"
+        messages, reports = [], []
+        with self.pool.reader() as conn:
+            if source in (None, 'messages'):
+                sql = (
+                    "SELECT m.id, m.message_id, m.timestamp, m.username, m.content, bm25(messages_fts), "
+                    f"{snippet_sql.format('messages_fts')} "
+                    "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid WHERE messages_fts MATCH ?")
+                params = [match]
+                if user:
+                    column, value = self._lookup('username', user)
+                    mapping_column, mapping_value = self._lookup('gitlab_username', user)
+                    sql += (f" AND (m.{column} = ? OR m.user_id = "
+                            f"(SELECT telegram_id FROM user_mapping WHERE {mapping_column} = ?))")
+                    params += [value, mapping_value]
+                if date_from:
+                    sql += " AND substr(m.timestamp, 1, 10) >= ?"
+                    params.append(date_from)
+                if date_to:
+                    sql += " AND substr(m.timestamp, 1, 10) <= ?"
+                    params.append(date_to)
+                for rowid, message_id, ts, username, content, score, snippet in conn.execute(
+                        sql + " ORDER BY bm25(messages_fts) LIMIT ?", params + [limit]).fetchall():
+                    messages.append({
+                        'source': 'message', 'id': rowid, 'message_id': message_id,
+                        'user': self._readable(username, 'messages', rowid, 'username'),
+                        'date': ts, 'score': round(-score, 3),
+                        'snippet': snippet or make_snippet(self._readable(content, 'messages', rowid) or '', query)
+                    })
+            if source in (None, 'daily_reports'):
+                sql = (
+                    "SELECT d.id, d.message_id, d.date, d.dev, d.content, bm25(daily_reports_fts), "
+                    f"{snippet_sql.format('daily_reports_fts')} "
+                    "FROM daily_reports_fts JOIN daily_reports d ON d.id = daily_reports_fts.rowid "
+                    "WHERE daily_reports_fts MATCH ?")
+                params = [match]
+                if user:
+                    sql += " AND d.dev = ?"
+                    params.append(user)
+                if date_from:
+                    sql += " AND d.date >= ?"
+                    params.append(date_from)
+                if date_to:
+                    sql += " AND d.date <= ?"
+                    params.append(date_to)
+                for rowid, message_id, date, dev, content, score, snippet in conn.execute(
+                        sql + " ORDER BY bm25(daily_reports_fts) LIMIT ?", params + [limit]).fetchall():
+                    reports.append({
+                        'source': 'daily_report', 'id': rowid, 'message_id': message_id, 'user': dev,
+                        'date': date, 'score': round(-score, 3),
+                        'snippet': snippet or make_snippet(self._readable(content, 'daily_reports', rowid) or '', query)
+                    })
+        return merge_ranked([messages, reports], limit)
+
+    def rebuild_daily_activity(self) -> int:
+        """Recompute gitlab_daily_activity from gitlab_events (e.g. after a TIMEZONE change)"""
+        # Archived months still count; they are read first because ATTACH can't happen mid-transaction
+        archived_rows = []
+        for conn, schema in self.retention.iter_partitions(''):
+            if schema != 'main':
+                archived_rows.extend(conn.execute(f"SELECT dev, ts, type FROM {schema}.gitlab_events").fetchall())
+        with self.pool.writer() as conn:
+            return self._rebuild_daily_activity(conn.cursor(), archived_rows)
+
+    def restamp_local_dates(self) -> int:
+        """Recompute gitlab_events.local_date (hot and archived) and the rollup in each developer's timezone"""
+        changed = 0
+        with self.pool.writer() as conn:
+            changed += self._restamp_local_dates(conn.cursor())
+        for path in self.retention.list_archives().values():
+            with self.pool.writer(attach={'archive': path}) as conn:
+                changed += self._restamp_local_dates(conn.cursor(), 'archive')
+        self.rebuild_daily_activity()
+        return changed
+
+    @staticmethod
+    def _restamp_local_dates(cursor, schema: str = 'main') -> int:
+        cursor.execute(f"SELECT id, dev, ts, local_date FROM {schema}.gitlab_events WHERE ts_epoch IS NOT NULL")
+        updates = []
+        for event_id, dev, ts, local_date in cursor.fetchall():
+            new_date = utc_to_local_date(ts, dev_timezone(dev))
+            if new_date != local_date:
+                updates.append((new_date, event_id))
+        cursor.executemany(f"UPDATE {schema}.gitlab_events SET local_date = ? WHERE id = ?", updates)
+        return len(updates)
+
+    @staticmethod
+    def _insert_event_commits(cursor, event_id: int, commits: List[dict]):
+        if commits:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO gitlab_event_commits (event_id, position, sha, message, ts) VALUES (?, ?, ?, ?, ?)",
+                [(event_id, position, c['sha'], c['message'], c['ts']) for position, c in enumerate(commits)])
+
+
+    def gitlab_event_row(self, dev: str, payload: Optional[dict], ts: str = None, delivery_key: str = None,
+                         record: dict = None, encoded: tuple = None) -> dict:
+        """Build the gitlab_events row for a webhook payload (ts defaults to now).
+
+        record is the payload's normalize_event() result and encoded its encode_stored_payload()
+        result, when the caller already has them (then payload itself is not needed).
+        """
+        record = record or normalize_event(payload)
+        payload_blob, payload_format, raw_payload = encoded or encode_stored_payload(
+            payload, self.payload_codec, self.prune_payloads, self.raw_payload_archive)
+        row = {
+            'dev': dev,
+            'ts': ts or datetime.utcnow().isoformat(),
+            'type': record['type'],
+            'payload_json': payload_blob,
+            'payload_format': payload_format,
+            'delivery_key': delivery_key,
+        }
+        row['ts_epoch'] = to_epoch(row['ts'])
+        row['local_date'] = utc_to_local_date(row['ts'], dev_timezone(dev))
+        row.update({column: record[column] for column in GITLAB_EVENT_FIELD_COLUMNS})
+        row['commits'] = record['commits']
+        if raw_payload is not None:
+            row['raw_payload'] = raw_payload
+        return row
+
+    def insert_gitlab_event_rows(self, rows: List[dict]) -> List[bool]:
+        """Insert prepared gitlab_events rows in a single transaction.
+
+        Returns one flag per row: False when its delivery_key was already stored (a redelivery).
+        """
+        if not rows:
+            return []
+        columns = ['dev', 'ts', 'ts_epoch', 'local_date', 'type', 'payload_json', 'payload_format',
+                   'delivery_key'] + GITLAB_EVENT_FIELD_COLUMNS
+        sql = (f"INSERT OR IGNORE INTO gitlab_events ({', '.join(columns)}) "
+               f"VALUES ({', '.join(':' + column for column in columns)})")
+        inserted = []
+        with self.pool.writer() as conn:
+            cursor = conn.cursor()
+            for row in rows:
+                row.setdefault('delivery_key', None)
+                cursor.execute(sql, row)
+                inserted.append(cursor.rowcount == 1)
+                if inserted[-1]:
+                    event_id = cursor.lastrowid
+                    self._insert_event_commits(cursor, event_id, row['commits'])
+                    if row.get('raw_payload'):
+                        cursor.execute("INSERT INTO gitlab_event_raw (event_id, payload, payload_format) VALUES (?, ?, ?)",
+                                       (event_id,) + tuple(row['raw_payload']))
+            self._bump_daily_activity(cursor, [row for row, new in zip(rows, inserted) if new])
+            self._checkpoint_webhook_inbox(cursor, rows, inserted)
+        self.duplicate_deliveries += inserted.count(False)
+        return inserted
+
+    @staticmethod
+    def _checkpoint_webhook_inbox(cursor, rows: List[dict], inserted: List[bool]):
+        """Advance inbox entries in the same transaction that stored their events (duplicates are done)"""
+        done = [(row['inbox_id'],) for row, new in zip(rows, inserted)
+                if row.get('inbox_id') and (row.get('inbox_done') or not new)]
+        stored = [(row['inbox_id'],) for row, new in zip(rows, inserted)
+                  if row.get('inbox_id') and new and not row.get('inbox_done')]
+        if done:
+            cursor.executemany("DELETE FROM webhook_inbox WHERE id = ?", done)
+        if stored:
+            cursor.executemany("UPDATE webhook_inbox SET stored = 1 WHERE id = ?", stored)
+
+    def append_webhook_inbox(self, rows: List[Tuple[str, bytes, str]]) -> List[int]:
+        """Append (received_at, raw body, delivery key) rows with one fsync for the batch; returns their inbox ids"""
+        ids = []
+        with self.pool.writer(durable=True) as conn:
+            cursor = conn.cursor()
+            for received_at, body, key in rows:
+                cursor.execute("INSERT INTO webhook_inbox (received_at, body, delivery_key) VALUES (?, ?, ?)",
+                               (received_at, body, key))
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def webhook_inbox_high_water(self) -> int:
+        with self.pool.reader() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM webhook_inbox").fetchone()[0]
+
+    def claim_webhook_inbox(self, after_id: int, up_to_id: int, limit: int = 500,
+                            max_attempts: int = WEBHOOK_INBOX_MAX_ATTEMPTS, skip=frozenset(),
+                            received_before: str = None) -> List[tuple]:
+        """Next inbox rows to replay (oldest first), counting the attempt.
+
+        Rows that already failed max_attempts replays are left in place for inspection.
+        Ids in skip (still with the worker) and rows received since received_before are passed over.
+        """
+        query = "SELECT id, received_at, body, delivery_key, stored FROM webhook_inbox WHERE id > ? AND id <= ? AND attempts < ?"
+        params = [after_id, up_to_id, max_attempts]
+        if received_before:
+            query += " AND received_at < ?"
+            params.append(received_before)
+        # At most len(skip) of the rows read are passed over, so up to limit are left
+        params.append(limit + len(skip))
+        with self.pool.writer() as conn:
+            rows = conn.execute(query + " ORDER BY id LIMIT ?", params).fetchall()
+            rows = [row for row in rows if row[0] not in skip][:limit]
+            conn.executemany("UPDATE webhook_inbox SET attempts = attempts + 1 WHERE id = ?",
+                             [(row[0],) for row in rows])
+        return rows
+
+    def finish_webhook_inbox(self, inbox_ids: List[int]):
+        with self.pool.writer() as conn:
+            conn.executemany("DELETE FROM webhook_inbox WHERE id = ?", [(inbox_id,) for inbox_id in inbox_ids])
+
+    def add_gitlab_event(self, dev: str, event_type: str, payload: dict):
+        self.insert_gitlab_event_rows([self.gitlab_event_row(dev, payload)])
+
+    @staticmethod
+    def _range_filter(dev=None, since: int = None, until: int = None, types=None,
+                      before: Tuple[int, int] = None) -> Tuple[str, list]:
+        """WHERE clause over gitlab_events for [since, until) in epoch seconds; dev is one name or a list"""
+        clauses, params = [], []
+        if isinstance(dev, (list, tuple)):
+            clauses.append(f"dev IN ({', '.join('?' * len(dev))})")
+            params.extend(dev)
+        elif dev is not None:
+            clauses.append("dev = ?")
+            params.append(dev)
+        if since is not None:
+            clauses.append("ts_epoch >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts_epoch < ?")
+            params.append(until)
+        if types:
+            clauses.append(f"type IN ({', '.join('?' * len(types))})")
+            params.extend(types)
+        if before is not None:
+            # Keyset position: strictly older than (ts_epoch, id)
+            clauses.append("(ts_epoch < ? OR (ts_epoch = ? AND id < ?))")
+            params.extend([before[0], before[0], before[1]])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _query_events(self, columns: List[str], dev: str = None, since: int = None, until: int = None,
+                      types=None, with_commits: bool = False, before: Tuple[int, int] = None, limit: int = None):
+        """gitlab_events rows in range, newest first (ts_epoch, id), from the hot database and overlapping archives.
+
+        before/limit page through the range by keyset instead of reading all of it.
+        """
+        where, params = self._range_filter(dev, since, until, types, before)
+        order_limit = " ORDER BY ts_epoch DESC, id DESC LIMIT ?"
+        params = params + [limit if limit is not None else -1]
+        events, commits = [], []
+        for conn, schema in self.retention.iter_partitions(
+                epoch_to_iso(since) if since is not None else '',
+                epoch_to_iso(until) if until is not None else None):
+            events.extend(dict(zip(columns, row)) for row in conn.execute(
+                f"SELECT {', '.join(columns)} FROM {schema}.gitlab_events{where}{order_limit}", params).fetchall())
+            if with_commits:
+                commits.extend(conn.execute(
+                    f"SELECT c.event_id, c.sha, c.message, c.ts FROM {schema}.gitlab_event_commits c "
+                    f"JOIN (SELECT id FROM {schema}.gitlab_events{where}{order_limit}) e ON e.id = c.event_id "
+                    "ORDER BY c.event_id, c.position", params).fetchall())
+        events.sort(key=lambda event: (event['ts_epoch'] or 0, event['id']), reverse=True)
+        if limit is not None:
+            events = events[:limit]
+        return (events, commits) if with_commits else events
+
+    def _max_event_id(self) -> int:
+        with self.pool.reader() as conn:
+            return conn.execute("SELECT MAX(id) FROM gitlab_events").fetchone()[0] or 0
+
+    def _query_events_after(self, columns: List[str], dev: str, since: int, until: int, after_id: int):
+        """(events, commits) of dev in [since, until) with id > after_id, for refreshing cached facts.
+
+        Driven by the rowid range (unary + keeps the planner off the dev/epoch indexes),
+        so the cost is the number of rows written since after_id, not the size of the window.
+        """
+        clauses, params = ["id > ?", "+dev = ?", "+ts_epoch >= ?"], [after_id, dev, since]
+        if until is not None:
+            clauses.append("+ts_epoch < ?")
+            params.append(until)
+        where = " WHERE " + " AND ".join(clauses)
+        events, commits = [], []
+        for conn, schema in self.retention.iter_partitions(
+                epoch_to_iso(since), epoch_to_iso(until) if until is not None else None):
+            events.extend(dict(zip(columns, row)) for row in conn.execute(
+                f"SELECT {', '.join(columns)} FROM {schema}.gitlab_events{where}", params).fetchall())
+            commits.extend(conn.execute(
+                f"SELECT event_id, sha, message, ts FROM {schema}.gitlab_event_commits "
+                f"WHERE event_id IN (SELECT id FROM {schema}.gitlab_events{where}) "
+                "ORDER BY event_id, position", params).fetchall())
+        return events, commits
+
+    def get_gitlab_events(self, dev: str = None, since=None, until=None, types: List[str] = None) -> list:
+        """Events in [since, until) (epoch seconds, datetime or ISO), optionally for one dev / some types"""
+        events = self._query_events(
+            ['id', 'dev', 'ts', 'ts_epoch', 'local_date', 'type', 'payload_json', 'payload_format'],
+            dev=dev,
+            since=to_epoch(since) if since is not None else None,
+            until=to_epoch(until) if until is not None else None,
+            types=types)
+        for event in events:
+            try:
+                event['payload'] = self.payload_codec.decode(event.pop('payload_json'), event.pop('payload_format'))
+            except ValueError as e:
+                print(f"{Fore.YELLOW}⚠️ Could not decode payload of event {event['id']}: {e}")
+                event['payload'] = None
         return events
 
-    def save_daily_report(self, dev: str, date: str, content: str, message_id: int = None):
-        """Save or update a daily report"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
+    def _load_payload_dictionary(self, dictionary_id: int) -> Optional[bytes]:
+        """A dictionary added after start-up by another process (manage_db.py, the importer)"""
+        with self.pool.reader() as conn:
+            row = conn.execute("SELECT dictionary FROM payload_dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+        return row[0] if row else None
 
-        cursor.execute("""
-            INSERT OR REPLACE INTO daily_reports 
-            (dev, date, submitted, message_id, content) 
-            VALUES (?, ?, 1, ?, ?)
-        """, (dev, date, message_id, content))
+    def train_payload_dictionary(self, sample_size: int = 500) -> Tuple[int, int]:
+        """Train a new preset dictionary on recent payloads; new writes use it, old ids stay readable"""
+        with self.pool.reader() as conn:
+            rows = conn.execute(
+                "SELECT payload_json, payload_format FROM gitlab_events ORDER BY id DESC LIMIT ?",
+                (sample_size,)).fetchall()
+        samples = []
+        for blob, payload_format in rows:
+            try:
+                samples.append(self.payload_codec.decode(blob, payload_format))
+            except ValueError:
+                continue
+        dictionary = build_dictionary(samples)
+        with self.pool.writer() as conn:
+            cursor = conn.execute("INSERT INTO payload_dictionaries (dictionary) VALUES (?)", (dictionary,))
+            dictionary_id = cursor.lastrowid
+        self.payload_codec.add_dictionary(dictionary_id, dictionary)
+        return dictionary_id, len(dictionary)
+
+    def compress_stored_payloads(self, batch_size: int = 500) -> int:
+        """Re-encode plain JSON payloads (payload_format 0) with the current codec"""
+        total = 0
+        while True:
+            with self.pool.writer() as conn:
+                rows = conn.execute(
+                    "SELECT id, payload_json FROM gitlab_events WHERE payload_format = ? LIMIT ?",
+                    (FORMAT_JSON, batch_size)).fetchall()
+                if not rows:
+                    return total
+                updates = []
+                for event_id, payload_json in rows:
+                    blob, payload_format = self.payload_codec.encode(self.payload_codec.decode(payload_json, FORMAT_JSON))
+                    updates.append((blob, payload_format, event_id))
+                conn.executemany("UPDATE gitlab_events SET payload_json = ?, payload_format = ? WHERE id = ?", updates)
+            total += len(rows)
+
+    def prune_stored_payloads(self, batch_size: int = 500) -> Tuple[int, int]:
+        """Apply the payload profiles to events stored before pruning; returns (rows pruned, bytes saved)"""
+        pruned = saved = 0
+        last_id = 0
+        while True:
+            with self.pool.writer() as conn:
+                rows = conn.execute(
+                    "SELECT id, payload_json, payload_format FROM gitlab_events WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)).fetchall()
+                if not rows:
+                    return pruned, saved
+                updates, raw = [], []
+                for event_id, blob, payload_format in rows:
+                    try:
+                        payload = self.payload_codec.decode_json(blob, payload_format)
+                    except (TypeError, ValueError):
+                        continue
+                    if not isinstance(payload, dict):
+                        continue
+                    stored = prune_payload(payload)
+                    if stored is payload:
+                        continue
+                    new_blob, new_format = self.payload_codec.encode(json.dumps(stored))
+                    if len(new_blob) >= len(blob):
+                        continue
+                    updates.append((new_blob, new_format, event_id))
+                    if self.raw_payload_archive:
+                        raw.append((event_id, blob, payload_format))
+                    saved += len(blob) - len(new_blob)
+                conn.executemany("UPDATE gitlab_events SET payload_json = ?, payload_format = ? WHERE id = ?", updates)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO gitlab_event_raw (event_id, payload, payload_format) VALUES (?, ?, ?)", raw)
+                pruned += len(updates)
+                last_id = rows[-1][0]
+
+    def get_daily_activity(self, dev: str, days_back: int = 7) -> List[dict]:
+        """Rollup rows (one per local date and event type) for the last days_back days"""
+        return self.get_daily_activity_for_users([dev], days_back)[dev]
+
+    def get_daily_activity_for_users(self, devs: List[str], days_back: int = 7) -> Dict[str, List[dict]]:
+        """get_daily_activity for many developers in one rollup query (each in their own timezone)"""
+        since_dates = {dev: (datetime.now(dev_timezone(dev)) - timedelta(days=days_back)).strftime("%Y-%m-%d")
+                       for dev in devs}
+        activity = {dev: [] for dev in devs}
+        if not devs:
+            return activity
+        with self.pool.reader() as conn:
+            rows = conn.execute(f"""
+                SELECT dev, local_date, event_type, count, first_ts, last_ts
+                FROM gitlab_daily_activity
+                WHERE dev IN ({', '.join('?' * len(since_dates))}) AND local_date >= ?
+                ORDER BY dev, local_date, event_type
+            """, list(since_dates) + [min(since_dates.values())]).fetchall()
+        for dev, *row in rows:
+            if row[0] >= since_dates[dev]:
+                activity[dev].append(dict(zip(['local_date', 'type', 'count', 'first_ts', 'last_ts'], row)))
+        return activity
+
+    def get_daily_digest_data(self, dev: str, date: str, highlights: int = 3) -> dict:
+        """Event counts for one local day (the developer's timezone) from the rollup,
+        plus the latest few activity descriptions; both read exactly that day by local_date
+        """
+        with self.pool.reader() as conn:
+            summary = conn.execute(
+                "SELECT event_type, count FROM gitlab_daily_activity WHERE dev = ? AND local_date = ?",
+                (dev, date)).fetchall()
+            recent = conn.execute(
+                "SELECT ts, type, description FROM gitlab_events "
+                "WHERE dev = ? AND local_date = ? ORDER BY ts_epoch DESC LIMIT ?",
+                (dev, date, highlights)).fetchall()
+        event_summary = dict(summary)
+        return {
+            'total_events': sum(event_summary.values()),
+            'activities': [
+                {'timestamp': ts, 'type': event_type, 'description': description}
+                for ts, event_type, description in recent
+            ],
+            'event_summary': event_summary
+        }
 
-        conn.commit()
-        conn.close()
+    def save_daily_report(self, dev: str, date: str, content: str, message_id: int = None):
+        """Save or update a daily report"""
+        with self.pool.writer() as conn:
+            row_id = self._next_rowid(conn, 'daily_reports')
+            conn.execute("""
+                INSERT OR REPLACE INTO daily_reports 
+                (id, dev, date, submitted, message_id, content) 
+                VALUES (?, ?, ?, 1, ?, ?)
+            """, (row_id, dev, date, message_id, self._seal(content, 'daily_reports', row_id)))
+            self._index_search(conn, 'daily_reports', row_id, content)
 
     def get_daily_report(self, dev: str, date: str) -> dict:
         """Get daily report for a user on a specific date"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT * FROM daily_reports 
-            WHERE dev = ? AND date = ?
-        """, (dev, date))
-
-        result = cursor.fetchone()
-        conn.close()
+        with self.pool.reader() as conn:
+            result = conn.execute("""
+                SELECT * FROM daily_reports 
+                WHERE dev = ? AND date = ?
+            """, (dev, date)).fetchone()
 
         if result:
-            return dict(zip(['id', 'dev', 'date', 'submitted', 'message_id', 'content'], result))
+            report = dict(zip(['id', 'dev', 'date', 'submitted', 'message_id', 'content'], result))
+            report['content'] = self._readable(report['content'], 'daily_reports', report['id'])
+            return report
         return None
 
-    def save_message(self, message: MessageData):
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO messages (
-                message_id, timestamp, chat_id, chat_title, user_id, username, first_name, content, message_type
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            message.message_id,
-            message.timestamp,
-            message.chat.get("id"),
-            message.chat.get("title"),
-            message.user.get("id"),
-            message.user.get("username"),
-            message.user.get("first_name"),
-            message.content,
-            message.message_type
-        ))
-        conn.commit()
-        conn.close()
-
+    @staticmethod
+    def _insert_daily_message(cursor, message_row_id, message_id, user_id, username, timestamp, content,
+                              username_bidx=None):
+        cursor.execute(
+            "INSERT INTO daily_messages (message_row_id, message_id, user_id, username, username_bidx, "
+            "local_date, timestamp, content) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (message_row_id, message_id, user_id, username, username_bidx, message_local_date(timestamp),
+             timestamp, content))
 
+    def save_message(self, message: MessageData):
+        username = message.user.get("username")
+        with self.pool.writer() as conn:
+            row_id = self._next_rowid(conn, 'messages')
+            conn.execute("""
+                INSERT INTO messages (
+                    id, message_id, timestamp, chat_id, chat_title, user_id, username, username_bidx, first_name,
+                    content, message_type
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                row_id,
+                message.message_id,
+                message.timestamp,
+                message.chat.get("id"),
+                message.chat.get("title"),
+                message.user.get("id"),
+                self._seal(username, 'messages', row_id, 'username'),
+                self._blind(username),
+                message.user.get("first_name"),
+                self._seal(message.content, 'messages', row_id),
+                message.message_type
+            ))
+            # Indexed and classified from the plaintext, before it is sealed
+            self._index_search(conn, 'messages', row_id, message.content)
+            if is_daily_message(message.content):
+                self._insert_daily_message(
+                    conn, row_id, message.message_id, message.user.get("id"),
+                    self._seal(username, 'daily_messages', row_id, 'username'), message.timestamp,
+                    self._seal(message.content, 'daily_messages', row_id), self._blind(username))
 
     def mark_daily_submitted(self, dev: str, date: str, message_id: int):
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT OR REPLACE INTO daily_reports (dev, date, submitted, message_id) VALUES (?, ?, 1, ?)",
-            (dev, date, message_id))
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO daily_reports (dev, date, submitted, message_id) VALUES (?, ?, 1, ?)",
+                (dev, date, message_id))
 
     def check_daily_submitted(self, dev: str, date: str) -> bool:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT submitted FROM daily_reports WHERE dev = ? AND date = ?",
-            (dev, date))
-        result = cursor.fetchone()
-        conn.close()
+        with self.pool.reader() as conn:
+            result = conn.execute(
+                "SELECT submitted FROM daily_reports WHERE dev = ? AND date = ?",
+                (dev, date)).fetchone()
         return result[0] == 1 if result else False
 
     def add_loom_reminder(self, dev: str, mr_id: int, title: str, url: str = None):
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO loom_reminders (dev, mr_id, title, url) VALUES (?, ?, ?, ?)",
-            (dev, mr_id, title, url))
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            conn.execute(
+                "INSERT INTO loom_reminders (dev, mr_id, title, url) VALUES (?, ?, ?, ?)",
+                (dev, mr_id, title, url))
 
     def get_pending_loom_reminders(self, dev: str) -> list:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT * FROM loom_reminders WHERE dev = ? AND status = 'pending'",
-            (dev,))
-        reminders = [dict(zip(['id', 'dev', 'mr_id', 'title', 'status', 'url'], row)) for row in cursor.fetchall()]
-        conn.close()
-        return reminders
-
-    def _generate_activity_description(event_type: str, payload: dict) -> str:
-        """Generate human-readable description of GitLab event"""
-        try:
-            if event_type == 'push':
-                commits_count = len(payload.get('commits', []))
-                branch = payload.get('ref', '').replace('refs/heads/', '')
-                repo = payload.get('project', {}).get('name', 'repository')
-                return f"Pushed {commits_count} commit(s) to {branch} in {repo}"
-
-            elif event_type == 'merge_request':
-                mr = payload.get('object_attributes', {})
-                action = mr.get('action', 'updated')
-                title = mr.get('title', 'MR')[:50]
-                return f"Merge request {action}: {title}"
-
-            elif event_type == 'issue':
-                issue = payload.get('object_attributes', {})
-                action = issue.get('action', 'updated')
-                title = issue.get('title', 'Issue')[:50]
-                return f"Issue {action}: {title}"
-
-            elif event_type == 'note':
-                note = payload.get('object_attributes', {})
-                noteable_type = note.get('noteable_type', 'object')
-                return f"Commented on {noteable_type.lower()}"
-
-            else:
-                return f"{event_type.replace('_', ' ').title()} activity"
-
-        except Exception:
-            return f"{event_type} activity"
+        with self.pool.reader() as conn:
+            rows = conn.execute(
+                "SELECT * FROM loom_reminders WHERE dev = ? AND status = 'pending'",
+                (dev,)).fetchall()
+        return [dict(zip(['id', 'dev', 'mr_id', 'title', 'status', 'url'], row)) for row in rows]
 
     def get_users_for_daily_check(self):
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT dev FROM gitlab_events")  # или из конфигурации
-        users = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return users
+        with self.pool.reader() as conn:
+            rows = conn.execute("SELECT DISTINCT dev FROM gitlab_events").fetchall()  # или из конфигурации
+        return [row[0] for row in rows]
 
     def get_last_daily_message(self, dev: str, date: str):
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT message_id, content, timestamp 
-            FROM messages 
-            WHERE (username = ? OR first_name LIKE ?)
-              AND date(timestamp) = ? 
-              AND (content LIKE '/daily%' OR content LIKE '%#daily%')
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """, (dev, f"%{dev}%", date))
-        row = cursor.fetchone()
-        conn.close()
+        """Latest /daily message of a developer for a local date: by mapped Telegram id, then by chat username"""
+        mapping_column, mapping_value = self._lookup('gitlab_username', dev)
+        column, value = self._lookup('username', dev)
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                "SELECT message_id, content, timestamp, message_row_id FROM daily_messages "
+                f"WHERE user_id = (SELECT telegram_id FROM user_mapping WHERE {mapping_column} = ?) "
+                "AND local_date = ? ORDER BY timestamp DESC LIMIT 1",
+                (mapping_value, date)).fetchone()
+            if not row:
+                row = conn.execute(
+                    "SELECT message_id, content, timestamp, message_row_id FROM daily_messages "
+                    f"WHERE {column} = ? AND local_date = ? ORDER BY timestamp DESC LIMIT 1",
+                    (value, date)).fetchone()
         if row:
-            return {"message_id": row[0], "content": row[1], "timestamp": row[2]}
+            return {"message_id": row[0], "content": self._readable(row[1], 'daily_messages', row[3]),
+                    "timestamp": row[2]}
         return None
 
-    def get_facts_for_user(self, username: str, since_hours: int = 24) -> dict:
+    def get_facts_for_user(self, username: str, since_hours: int = 24, since=None, until=None) -> dict:
         """
-        Get recent GitLab activity facts for a specific user
+        Get GitLab activity facts for a specific user
 
         Args:
             username: GitLab username
-            since_hours: How many hours back to look (default 24)
+            since_hours: How many hours back to look (default 24), used when since is not given
+            since, until: Explicit range [since, until) as epoch seconds, datetime or ISO string
 
         Returns:
             Dict containing user facts and activity summary
         """
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-
-        since_timestamp = (datetime.utcnow() - timedelta(hours=since_hours)).isoformat()
-
-        # Get all events for the user in the time period
-        cursor.execute(
-            "SELECT * FROM gitlab_events WHERE dev = ? AND ts >= ? ORDER BY ts DESC",
-            (username, since_timestamp)
-        )
-
-        raw_events = cursor.fetchall()
-        events = [dict(zip(['id', 'dev', 'ts', 'type', 'payload'], row)) for row in raw_events]
-
-        # Parse events and extract meaningful facts
-        facts = {
+        rolling = since is None and until is None
+        since, until = resolve_range(since_hours, since, until)
+        if self.facts_cache.enabled:
+            key = (username, 'hours', since_hours) if rolling else (username, since, until)
+            return self._cached_facts(key, username, since, until)
+
+        # Only the extracted columns are read; payload_json is never parsed here.
+        # Long windows transparently include the monthly archives.
+        events, raw_commits = self._query_events(FACT_EVENT_COLUMNS, dev=username, since=since, until=until,
+                                                 with_commits=True)
+        commits_by_event = self._group_commits(raw_commits)
+
+        facts = self._new_facts(username, since, until)
+        for event in events:
+            self._add_event_to_facts(facts, event, commits_by_event.get(event['id'], []))
+
+        return self._finish_facts(facts)
+
+    def _cached_facts(self, key: tuple, username: str, since: int, until: Optional[int]) -> dict:
+        """Facts from the (user, window) cache entry: expire what left the window, fold in rows above its watermark"""
+        entry = self.facts_cache.entry(key, since)
+        with entry.lock:
+            expired = entry.expire(since)
+            # Read before the events: every row up to it is visible to the query below
+            high_water = self._max_event_id()
+            if entry.loaded:
+                events, raw_commits = self._query_events_after(FACT_EVENT_COLUMNS, username, since, until,
+                                                               entry.watermark)
+            else:
+                events, raw_commits = self._query_events(FACT_EVENT_COLUMNS, dev=username, since=since, until=until,
+                                                         with_commits=True)
+            commits_by_event = self._group_commits(raw_commits)
+            for event in events:
+                branch = event['branch'] if get_kind(event['type']).tracks_branch else None
+                entry.add(event, self._fact_items(event, commits_by_event.get(event['id'], [])), branch)
+            # Rows of other developers were read too; an idle user must not rescan them next time
+            entry.watermark = max(entry.watermark, high_water)
+            entry.loaded = True
+            self.facts_cache.record(len(events), expired)
+            facts = entry.fill(self._new_facts(username, since, until))
+        return self._finish_facts(facts)
+
+    def get_facts_for_users(self, usernames: Optional[List[str]] = None, since_hours: int = 24,
+                            since=None, until=None) -> Dict[str, dict]:
+        """Facts for many users (everyone with events when usernames is None) from one ordered scan of the range.
+
+        Cost grows with the events in the range, not with the number of users.
+        """
+        since, until = resolve_range(since_hours, since, until)
+        if usernames is not None and not usernames:
+            return {}
+        events, raw_commits = self._query_events(
+            FACT_EVENT_COLUMNS, dev=list(dict.fromkeys(usernames)) if usernames is not None else None,
+            since=since, until=until, with_commits=True)
+        commits_by_event = self._group_commits(raw_commits)
+
+        facts_by_user = {username: self._new_facts(username, since, until) for username in usernames or []}
+        for event in events:
+            facts = facts_by_user.get(event['dev'])
+            if facts is None:
+                facts = facts_by_user[event['dev']] = self._new_facts(event['dev'], since, until)
+            self._add_event_to_facts(facts, event, commits_by_event.get(event['id'], []))
+
+        return {username: self._finish_facts(facts) for username, facts in facts_by_user.items()}
+
+    @staticmethod
+    def _group_commits(raw_commits) -> Dict[int, List[dict]]:
+        commits_by_event = {}
+        for event_id, sha, message, ts in raw_commits:
+            commits_by_event.setdefault(event_id, []).append({'sha': sha, 'message': message, 'ts': ts})
+        return commits_by_event
+
+    @staticmethod
+    def _new_facts(username: str, since: int, until: int = None) -> dict:
+        return {
             'username': username,
-            'period_hours': since_hours,
-            'total_events': len(events),
+            'period_hours': round(((until or to_epoch(datetime.utcnow())) - since) / 3600),
+            'since': epoch_to_iso(since),
+            'until': epoch_to_iso(until) if until is not None else None,
+            'total_events': 0,
             'event_summary': {},
             'activities': [],
             'repositories': set(),
@@ -449,77 +1408,99 @@ class DatabaseManager:
             'last_activity': None
         }
 
+    @staticmethod
+    def _fact_items(event: dict, commits: List[dict]) -> dict:
+        """List entries one gitlab_events row contributes to facts: activity, commits, merge_requests, issues"""
+        event_type = event['type']
+        timestamp = event['ts']
+        repo_name = event['project'] or 'unknown'
+        items = {'activities': [], 'commits': [], 'merge_requests': [], 'issues': []}
+
+        kind = get_kind(event_type)
+        if kind.facts_list:
+            items[kind.facts_list].extend(kind.fact_entries(event, commits, repo_name))
+
+        # Add to activities timeline
+        items['activities'].append({
+            'timestamp': timestamp,
+            'type': event_type,
+            'description': event['description']
+        })
+        return items
+
+    @classmethod
+    def _add_event_to_facts(cls, facts: dict, event: dict, commits: List[dict]):
+        """Fold one gitlab_events row (extracted columns) into a facts dict"""
+        event_type = event['type']
+        timestamp = event['ts']
+
+        facts['total_events'] += 1
+
+        # Update last activity
+        if not facts['last_activity'] or timestamp > facts['last_activity']:
+            facts['last_activity'] = timestamp
+
+        # Count event types
+        facts['event_summary'][event_type] = facts['event_summary'].get(event_type, 0) + 1
+
+        if event['project'] is not None:
+            facts['repositories'].add(event['project'])
+        if get_kind(event_type).tracks_branch and event['branch'] is not None:
+            facts['branches'].add(event['branch'])
+
+        for key, entries in cls._fact_items(event, commits).items():
+            facts[key].extend(entries)
+
+    def get_facts_summary(self, username: str, since_hours: int = 24, since=None, until=None) -> dict:
+        """Counts-only header for a facts range: one grouped query per partition, no rows materialized"""
+        since, until = resolve_range(since_hours, since, until)
+        where, params = self._range_filter(username, since, until)
+        summary = self._new_facts(username, since, until)
+        for key in ('activities', 'repositories', 'branches', 'merge_requests', 'issues', 'commits'):
+            del summary[key]
+        for conn, schema in self.retention.iter_partitions(
+                epoch_to_iso(since), epoch_to_iso(until) if until is not None else None):
+            for event_type, count, last_ts in conn.execute(
+                    f"SELECT type, COUNT(*), MAX(ts) FROM {schema}.gitlab_events{where} GROUP BY type",
+                    params).fetchall():
+                summary['event_summary'][event_type] = summary['event_summary'].get(event_type, 0) + count
+                summary['total_events'] += count
+                if not summary['last_activity'] or last_ts > summary['last_activity']:
+                    summary['last_activity'] = last_ts
+        return summary
+
+    def get_facts_page(self, username: str, since_hours: int = 24, since=None, until=None,
+                       cursor: str = None, limit: int = 200) -> dict:
+        """One keyset page of facts list entries, newest first; pass next_cursor back to continue"""
+        since, until = resolve_range(since_hours, since, until)
+        before = parse_facts_cursor(cursor) if cursor else None
+        events, raw_commits = self._query_events(FACT_EVENT_COLUMNS, dev=username, since=since, until=until,
+                                                 with_commits=True, before=before, limit=limit + 1)
+        has_more = len(events) > limit
+        events = events[:limit]
+        commits_by_event = self._group_commits(raw_commits)
+
+        page = {'activities': [], 'commits': [], 'merge_requests': [], 'issues': []}
         for event in events:
-            try:
-                payload = json.loads(event['payload'])
-                event_type = event['type']
-                timestamp = event['ts']
-
-                # Update last activity
-                if not facts['last_activity'] or timestamp > facts['last_activity']:
-                    facts['last_activity'] = timestamp
-
-                # Count event types
-                facts['event_summary'][event_type] = facts['event_summary'].get(event_type, 0) + 1
-
-                # Extract repository info
-                if 'project' in payload:
-                    repo_name = payload['project'].get('name', 'unknown')
-                    facts['repositories'].add(repo_name)
-
-                # Process different event types
-                if event_type == 'push':
-                    # Extract commit info
-                    commits = payload.get('commits', [])
-                    for commit in commits:
-                        facts['commits'].append({
-                            'id': commit.get('id', '')[:8],
-                            'message': commit.get('message', '').split('\n')[0][:100],
-                            'timestamp': commit.get('timestamp', timestamp),
-                            'repository': repo_name if 'repo_name' in locals() else 'unknown'
-                        })
-
-                    # Extract branch info
-                    if 'ref' in payload:
-                        branch = payload['ref'].replace('refs/heads/', '')
-                        facts['branches'].add(branch)
-
-                elif event_type == 'merge_request':
-                    mr = payload.get('object_attributes', {})
-                    facts['merge_requests'].append({
-                        'iid': mr.get('iid'),
-                        'title': mr.get('title', '')[:100],
-                        'state': mr.get('state'),
-                        'action': mr.get('action'),
-                        'source_branch': mr.get('source_branch'),
-                        'target_branch': mr.get('target_branch'),
-                        'repository': repo_name if 'repo_name' in locals() else 'unknown'
-                    })
-
-                elif event_type == 'issue':
-                    issue = payload.get('object_attributes', {})
-                    facts['issues'].append({
-                        'iid': issue.get('iid'),
-                        'title': issue.get('title', '')[:100],
-                        'state': issue.get('state'),
-                        'action': issue.get('action'),
-                        'repository': repo_name if 'repo_name' in locals() else 'unknown'
-                    })
-
-                # Add to activities timeline
-                facts['activities'].append({
-                    'timestamp': timestamp,
-                    'type': event_type,
-                    'description': DatabaseManager._generate_activity_description(event_type, payload)
-                })
-
-            except json.JSONDecodeError:
-                print(f"{Fore.YELLOW}⚠️ Could not parse payload for event {event['id']}")
-                continue
-            except Exception as e:
-                print(f"{Fore.YELLOW}⚠️ Error processing event {event['id']}: {e}")
-                continue
+            for key, entries in self._fact_items(event, commits_by_event.get(event['id'], [])).items():
+                page[key].extend(entries)
+        last = events[-1] if events else None
+        page['next_cursor'] = f"{last['ts_epoch']}.{last['id']}" if has_more else None
+        return page
+
+    def iter_facts_pages(self, username: str, since_hours: int = 24, since=None, until=None, page_size: int = 500):
+        """Generator over facts pages; the pool connection is released between pages"""
+        since, until = resolve_range(since_hours, since, until)
+        cursor = None
+        while True:
+            page = self.get_facts_page(username, since=since, until=until, cursor=cursor, limit=page_size)
+            yield page
+            cursor = page['next_cursor']
+            if cursor is None:
+                return
 
+    @staticmethod
+    def _finish_facts(facts: dict) -> dict:
         # Convert sets to lists for JSON serialization
         facts['repositories'] = list(facts['repositories'])
         facts['branches'] = list(facts['branches'])
@@ -527,11 +1508,63 @@ class DatabaseManager:
         # Sort activities by timestamp (most recent first)
         facts['activities'].sort(key=lambda x: x['timestamp'], reverse=True)
 
-        conn.close()
         return facts
 
+    def data_version(self) -> dict:
+        """Change markers for conditional responses: newest gitlab_events and daily_reports ids.
+
+        Read from the database, so writes by other processes (importer, manage_db.py, other workers)
+        count too. There is deliberately no timestamp: event times can be back-dated by imports,
+        so they can't back a Last-Modified.
+        """
+        with self.pool.reader() as conn:
+            events = conn.execute("SELECT MAX(id) FROM gitlab_events").fetchone()[0]
+            reports = conn.execute("SELECT MAX(id) FROM daily_reports").fetchone()[0]
+        return {'events': events or 0, 'reports': reports or 0}
+
+    def checkpoint(self):
+        """Fold the WAL back into the main file and fsync it"""
+        self.pool.checkpoint()
+
+    def ping(self) -> bool:
+        with self.pool.reader() as conn:
+            conn.execute("SELECT 1")
+        return True
+
+    def close(self):
+        self.pool.close()
+
 
 db_manager = DatabaseManager()
+async_db = AsyncDatabase(db_manager, readers=DB_READER_POOL_SIZE)
+# Group-commit buffer for webhook events: one transaction per batch instead of per hook
+gitlab_event_writer = WriteBehindQueue(
+    db_manager.insert_gitlab_event_rows,
+    max_batch=GITLAB_EVENT_BATCH_SIZE,
+    max_delay_ms=GITLAB_EVENT_FLUSH_MS,
+    name='gitlab-event-writer',
+    retries=WRITE_BEHIND_RETRIES,
+    retry_backoff_ms=WRITE_BEHIND_RETRY_MS
+)
+# Durable webhook inbox: raw bodies are fsynced in small batches before the hook is acked
+webhook_inbox_writer = WriteBehindQueue(
+    db_manager.append_webhook_inbox,
+    max_batch=GITLAB_EVENT_BATCH_SIZE,
+    max_delay_ms=WEBHOOK_INBOX_FLUSH_MS,
+    name='webhook-inbox-writer',
+    retries=WRITE_BEHIND_RETRIES,
+    retry_backoff_ms=WRITE_BEHIND_RETRY_MS
+)
+recent_deliveries = RecentKeys(WEBHOOK_DEDUP_CACHE_SIZE)
+# One pooled session for all GitLab API calls
+gitlab_client = GitLabClient(
+    GITLAB_URL,
+    GITLAB_TOKEN,
+    per_host=GITLAB_MAX_CONNECTIONS_PER_HOST,
+    retries=GITLAB_API_RETRIES,
+    timeout=GITLAB_API_TIMEOUT,
+    cache_ttl=GITLAB_MR_CACHE_TTL
+)
 
 
 @app.middleware("http")
@@ -550,8 +1583,7 @@ async def log_requests(request, call_next):
 @app.get("/health")
 async def health_check():
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        conn.close()
+        await async_db.ping()
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
@@ -564,11 +1596,26 @@ async def health_check():
     }
 
 
+@app.get("/ingest/stats")
+async def ingest_stats():
+    """Write-behind queue depth and flush latency"""
+    return {
+        "gitlab_events": gitlab_event_writer.stats(),
+        "webhook_worker": webhook_worker.stats(),
+        "webhook_inbox": webhook_inbox_writer.stats(),
+        "gitlab_api": gitlab_client.stats(),
+        "webhook_dedup": {**recent_deliveries.stats(), "index_hits": db_manager.duplicate_deliveries},
+        "facts_cache": db_manager.facts_cache.stats(),
+        "db_write_queue_depth": async_db.write_queue_depth,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 @app.get("/scheduler/status")
-async def scheduler_status():
+async def scheduler_status(request: Request):
     jobs = []
     if scheduler is None:
-        return {"running": False, "jobs": [], "timezone": TIMEZONE}
+        return conditional_json(request, {"running": False, "jobs": [], "timezone": TIMEZONE})
 
     for job in scheduler.get_jobs():
         jobs.append({
@@ -576,11 +1623,11 @@ async def scheduler_status():
             "next_run": str(job.next_run_time),
             "function": getattr(job.func, "__name__", str(job.func))
         })
-    return {
+    return conditional_json(request, {
         "running": scheduler.running,
         "jobs": jobs,
         "timezone": str(scheduler.timezone)
-    }
+    })
 
 
 
@@ -612,7 +1659,7 @@ BOT_USERNAME = os.getenv('BOT_USERNAME', '')  # Get bot username from environmen
 async def save_message(message_data: MessageData):
     try:
         # First save the message normally
-        db_manager.save_message(message_data)
+        await async_db.save_message(message_data)
         print(message_data)
 
         # Check if message starts with /daily command
@@ -628,7 +1675,7 @@ async def save_message(message_data: MessageData):
         if command in valid_commands:
             # Get GitLab username from Telegram user
             telegram_id = message_data.user.id
-            dev = db_manager.get_gitlab_username(telegram_id)
+            dev = await async_db.get_gitlab_username(telegram_id)
 
             if not dev:
                 raise HTTPException(
@@ -660,7 +1707,7 @@ async def save_message(message_data: MessageData):
             content = ' '.join(content_tokens)
 
             # Save daily report
-            db_manager.save_daily_report(
+            await async_db.save_daily_report(
                 dev=dev,
                 date=date_str,
                 content=content,
@@ -773,25 +1820,15 @@ async def send_daily_reminder(dev: str, date: str):
     """Send private reminder to user about missing daily report"""
     try:
         # First try to get Telegram ID from user_mapping table
-        telegram_id = db_manager.get_telegram_id(dev)
+        telegram_id = await async_db.get_telegram_id(dev)
 
         if telegram_id:
             print(f"{Fore.CYAN}📨 Found Telegram ID for {dev}: {telegram_id}")
         else:
             # Fallback: try to find user ID from messages table
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT DISTINCT user_id FROM messages 
-                WHERE (username = ? OR first_name LIKE ?)
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            """, (dev, f"%{dev}%"))
-            result = cursor.fetchone()
-            conn.close()
-
-            if result:
-                telegram_id = result[0]
+            telegram_id = await async_db.find_telegram_id_in_messages(dev)
+
+            if telegram_id:
                 print(f"{Fore.CYAN}📨 Found Telegram ID for {dev} in messages: {telegram_id}")
             else:
                 print(f"{Fore.YELLOW}⚠️ Could not find Telegram ID for {dev}")
@@ -838,11 +1875,10 @@ async def send_daily_reminder(dev: str, date: str):
 async def send_user_morning_digest(self, username: str, config: Dict[str, Any]):
     """Enhanced version that includes daily reports"""
     try:
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        yesterday = (datetime.now(dev_timezone(username)) - timedelta(days=1)).strftime("%Y-%m-%d")
 
-        # GitLab: Use existing get_facts_for_user, filter to yesterday
-        facts = self.db_manager.get_facts_for_user(username)
-        gitlab_data = self._filter_facts_to_date(facts, yesterday)
+        # GitLab: counts for yesterday straight from the daily rollup
+        gitlab_data = await self.async_db.get_daily_digest_data(username, yesterday)
 
         # Timesheet: Use the real checker
         timesheet_data = await self.get_timesheet_for_date(username, yesterday)
@@ -879,26 +1915,26 @@ async def check_daily():
         print(f"{Fore.CYAN}📅 Checking reports for: {yesterday}")
 
         # Get list of users who should submit reports
-        users_to_check = db_manager.get_users_for_daily_check()
+        users_to_check = await async_db.get_users_for_daily_check()
 
         for dev in users_to_check:
             print(f"{Fore.CYAN}👤 Checking daily report for: {dev}")
 
             # Check if report already exists in database
-            existing_report = db_manager.get_daily_report(dev, yesterday)
+            existing_report = await async_db.get_daily_report(dev, yesterday)
 
             if existing_report and existing_report.get('submitted'):
                 print(f"{Fore.GREEN}✅ {dev} already has submitted report for {yesterday}")
                 continue
-            telegram_id = db_manager.get_telegram_id(dev)
+            telegram_id = await async_db.get_telegram_id(dev)
             print(f"{Fore.CYAN}   Mapped Telegram ID: {telegram_id}")
 
             # Check if report already exists in database
-            existing_report = db_manager.get_daily_report(dev, yesterday)
+            existing_report = await async_db.get_daily_report(dev, yesterday)
             print(f"{Fore.CYAN}   Existing report: {existing_report is not None}")
 
             # Look for /daily message
-            daily_message = db_manager.get_last_daily_message(dev, yesterday)
+            daily_message = await async_db.get_last_daily_message(dev, yesterday)
 
             if daily_message:
                 print(f"{Fore.GREEN}📝 Found /daily message from {dev}")
@@ -911,7 +1947,7 @@ async def check_daily():
                     report_content = content.strip()
 
                 # Save to daily_reports table
-                db_manager.save_daily_report(
+                await async_db.save_daily_report(
                     dev=dev,
                     date=yesterday,
                     content=report_content,
@@ -933,6 +1969,18 @@ async def check_daily():
         print(f"{Fore.RED}❌ [check_daily] Error: {e}")
         logger.error(f"[check_daily] Error: {e}")
 
+async def run_retention():
+    """Archive rows past the retention horizon, then give free pages back"""
+    try:
+        print(f"\n{Fore.BLUE}🗄 [RETENTION] Archiving rows older than {RETENTION_DAYS} days")
+        moved = await async_db.write(db_manager.retention.archive_old_rows)
+        freed = await async_db.write(db_manager.retention.incremental_vacuum)
+        print(f"{Fore.GREEN}✅ Archived {moved}, vacuum: {'full (first run)' if freed < 0 else f'{freed} pages'}")
+    except Exception as e:
+        print(f"{Fore.RED}❌ [retention] Error: {e}")
+        logger.error(f"[retention] Error: {e}")
+
+
 def job_listener(event):
     if event.exception:
         print(f"❌ Job {event.job_id} crashed: {event.exception}")
@@ -950,14 +1998,21 @@ async def startup_event():
     print(f"{Fore.YELLOW}🔗 Available at: http://{HOST}:{PORT}")
     print(f"{Fore.YELLOW}📋 API docs: http://{HOST}:{PORT}/docs")
 
+    async_db.start()
+    webhook_worker.start()
+    # Hooks acked by a previous run but not fully processed, then periodic sweeps for ones stranded since;
+    # newer ids arrive through the endpoint.
+    # Kept on app.state so it isn't garbage-collected mid-run and can be cancelled at shutdown.
+    app.state.inbox_replay = asyncio.create_task(watch_webhook_inbox(await async_db.webhook_inbox_high_water()))
+    app.state.inbox_replay.add_done_callback(report_task_failure)
+
     tz = timezone(TIMEZONE)
     scheduler = AsyncIOScheduler(timezone=tz)
 
     # Clear any existing jobs
     scheduler.remove_all_jobs()
 
-    from config import USER_MORNING_DIGEST
-    digest_scheduler = UserDigestScheduler(db_manager)
+    digest_scheduler = UserDigestScheduler(async_db)
 
     # Schedule individual user digests
     digest_scheduler.schedule_user_digests(scheduler, USER_MORNING_DIGEST)
@@ -980,6 +2035,14 @@ async def startup_event():
         replace_existing=True
     )
 
+    retention_hour, retention_minute = map(int, RETENTION_TIME.split(":"))
+    scheduler.add_job(
+        run_retention,
+        CronTrigger(hour=retention_hour, minute=retention_minute, timezone=tz),
+        id='retention_archive',
+        replace_existing=True
+    )
+
     # Add listener and start scheduler
     scheduler.add_listener(job_listener, mask=EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
     scheduler.start()
@@ -994,157 +2057,342 @@ async def shutdown_event():
     if scheduler:
         scheduler.shutdown(wait=False)
         print(f"{Fore.RED}❌ Scheduler stopped")
+    # Finish acked webhooks, then flush buffered events before the writer goes away.
+    # Anything cut short (including an unfinished replay or sweep) stays in webhook_inbox for the next start.
+    inbox_replay = getattr(app.state, 'inbox_replay', None)
+    if inbox_replay is not None and not inbox_replay.done():
+        inbox_replay.cancel()
+        await asyncio.gather(inbox_replay, return_exceptions=True)
+    webhook_inbox_writer.close()
+    await webhook_worker.stop()
+    gitlab_event_writer.close()
+    await gitlab_client.close()
+    async_db.stop()
+    db_manager.checkpoint()
+    db_manager.close()
+
+
+def stream_facts_ndjson(username: str, since: int, until: Optional[int]):
+    """NDJSON lines: the summary header first, then activity/commit/merge_request/issue entries page by page"""
+    summary = db_manager.get_facts_summary(username, since=since, until=until)
+    yield json.dumps({'kind': 'summary', **summary}, ensure_ascii=False) + '\n'
+    for page in db_manager.iter_facts_pages(username, since=since, until=until):
+        for key, kind in (('activities', 'activity'), ('commits', 'commit'),
+                          ('merge_requests', 'merge_request'), ('issues', 'issue')):
+            for entry in page[key]:
+                yield json.dumps({'kind': kind, **entry}, ensure_ascii=False) + '\n'
 
 
 @app.get("/facts/{username}")
-async def get_user_facts(username: str, hours: int = 24):
-    """Get recent GitLab activity facts for a user"""
+async def get_user_facts(request: Request, username: str, hours: int = 24, since: Optional[str] = None,
+                         until: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None,
+                         format: str = "json", date: Optional[str] = None):
+    """Get GitLab activity facts for a user: the last `hours`, or an explicit since/until range
+    (ISO datetimes, or YYYY-MM-DD local dates with `until` inclusive), or one local `date`.
+    Local dates are days in the developer's timezone (USER_MORNING_DIGEST, else TIMEZONE).
+
+    limit/cursor return one page of the lists (summary counts on the first page);
+    format=ndjson (or Accept: application/x-ndjson) streams the whole range line by line.
+    """
+    if date is not None:
+        since = until = date
     try:
-        facts = db_manager.get_facts_for_user(username, hours)
+        tz = dev_timezone(username)
+        since_epoch, until_epoch = resolve_range(
+            hours, parse_range_bound(since, tz=tz), parse_range_bound(until, end=True, tz=tz))
+        if cursor:
+            parse_facts_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date range or cursor: {e}")
+
+    if format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", ""):
+        print(f"{Fore.CYAN}📊 Streaming facts for user: {username}")
+        return StreamingResponse(stream_facts_ndjson(username, since_epoch, until_epoch),
+                                 media_type="application/x-ndjson")
+
+    # Unchanged data -> 304 before anything is computed. The ETag comes from the newest event id
+    # (no Last-Modified: If-Modified-Since alone always gets a full response); a rolling window
+    # also changes as it slides, so it is revalidated once per step.
+    version = await async_db.data_version()
+    window = (since_epoch, until_epoch)
+    if since is None and until is None:
+        window = ('hours', hours, since_epoch // ROLLING_WINDOW_STEP)
+    etag = make_etag('facts', username, window, limit, cursor, version['events'])
+    if is_fresh(request, etag):
+        return not_modified(etag)
+
+    if limit is not None or cursor:
+        page = await async_db.get_facts_page(username, since=since_epoch, until=until_epoch,
+                                             cursor=cursor, limit=max(1, min(limit or 200, 1000)))
+        response = {"status": "success", "page": page, "next_cursor": page.pop('next_cursor')}
+        if not cursor:
+            response["summary"] = await async_db.get_facts_summary(username, since=since_epoch, until=until_epoch)
+        return conditional_json(request, response, etag)
+
+    try:
+        facts = await async_db.get_facts_for_user(username, since=since_epoch, until=until_epoch)
 
         print(f"{Fore.CYAN}📊 Facts requested for user: {username}")
-        print(f"{Fore.CYAN}🕐 Period: {hours} hours")
+        print(f"{Fore.CYAN}🕐 Period: {facts['since']} → {facts['until'] or 'now'}")
         print(f"{Fore.CYAN}📈 Total events: {facts['total_events']}")
 
-        return {
+        return conditional_json(request, {
             "status": "success",
             "facts": facts,
             "generated_at": datetime.now().isoformat()
-        }
+        }, etag)
 
     except Exception as e:
         print(f"{Fore.RED}❌ Error getting facts for {username}: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving user facts: {str(e)}")
 
+
+class FactsBatchRequest(BaseModel):
+    usernames: Optional[List[str]] = None  # None: everyone with events in the range
+    hours: int = 24
+    since: Optional[str] = None
+    until: Optional[str] = None
+
+
+@app.post("/facts/batch")
+async def get_facts_batch(request: FactsBatchRequest):
+    """Facts for a list of users (or the whole team) in one pass over the range; same range rules as /facts"""
+    try:
+        since_epoch, until_epoch = resolve_range(
+            request.hours, parse_range_bound(request.since), parse_range_bound(request.until, end=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date range: {e}")
+
+    try:
+        facts = await async_db.get_facts_for_users(request.usernames, since=since_epoch, until=until_epoch)
+        print(f"{Fore.CYAN}📊 Batch facts: {len(facts)} users, "
+              f"{sum(user_facts['total_events'] for user_facts in facts.values())} events")
+        return json_response({
+            "status": "success",
+            "total_users": len(facts),
+            "facts": facts,
+            "generated_at": datetime.now().isoformat()
+        })
+    except Exception as e:
+        print(f"{Fore.RED}❌ Error getting batch facts: {e}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving facts: {str(e)}")
+
+
+@app.get("/search")
+async def search(q: str, user: Optional[str] = None, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None, source: Optional[str] = None, limit: int = 20):
+    """Full-text search over chat messages and daily reports (source: messages | daily_reports)"""
+    if source not in (None, 'messages', 'daily_reports'):
+        raise HTTPException(status_code=400, detail="source must be 'messages' or 'daily_reports'")
+    try:
+        results = await async_db.search_text(q, user, date_from, date_to, source, min(limit, 100))
+        print(f"{Fore.CYAN}🔎 Search '{q}': {len(results)} results")
+        return {"status": "success", "query": q, "results": results}
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e}")
+
+
 @app.post("/daily/submit")
 async def submit_daily_report(report: Dict):
     username = report['username']
     date = report['date']
     content = report['content']
     message_id = report['message_id']
-    db_manager.save_daily_report(username, date, content, message_id)
+    await async_db.save_daily_report(username, date, content, message_id)
     return {"status": "success"}
 
 
-@app.post("/gitlab/webhook")
-async def gitlab_webhook(request: Request, background_tasks: BackgroundTasks):
-    """Endpoint for GitLab webhooks. Now with Loom reminder crap for merged MRs."""
+@app.post("/gitlab/webhook", status_code=202)
+async def gitlab_webhook(request: Request):
+    """Endpoint for GitLab webhooks: validate, append to the durable inbox, ack. Everything else runs in webhook_worker."""
+    body = await request.body()
     try:
-        payload = await request.json()
-        event_type = payload.get('object_kind', 'unknown')
-        headers = dict(request.headers)
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    if not isinstance(payload, dict) or not payload.get('object_kind'):
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
 
-        print(f"{Fore.CYAN}📨 Received GitLab webhook:")
-        print(f"{Fore.CYAN}🔧 Event Type: {event_type}")
+    # GitLab retries failed hooks, so shedding load here loses nothing
+    busy = JSONResponse(status_code=503, content={"status": "busy"}, headers={"Retry-After": "5"})
+    if webhook_worker.full:
+        return busy
 
-        user_info = extract_user_from_gitlab_payload(payload)
-        dev_username = user_info.get('username', 'unknown')
+    # Redeliveries seen recently are acked without another write; older ones hit the unique index
+    key = delivery_key(request.headers, body)
+    if recent_deliveries.seen(key):
+        return {"status": "duplicate", "event_type": payload['object_kind']}
+    recent_deliveries.add(key)
 
-        background_tasks.add_task(
-            save_gitlab_webhook,
-            dev_username,
-            event_type,
-            payload
-        )
+    # Receive time, not processing time, is the event timestamp
+    received_at = datetime.utcnow().isoformat()
+    try:
+        inbox_id = await asyncio.wrap_future(webhook_inbox_writer.put((received_at, body, key)))
+    except Exception as e:
+        recent_deliveries.discard(key)
+        print(f"{Fore.RED}❌ Could not persist GitLab webhook: {e}")
+        return busy
 
-        # Your new BS: Handle merged MRs with conditions.
-        if event_type == 'merge_request':
-            mr_attrs = payload.get('object_attributes', {})
-            if mr_attrs.get('action') == 'merge':
-                # Grab labels.
-                label_titles = [l.get('title', '') for l in payload.get('labels', [])]
-                has_feature_label = 'feature' in label_titles
-
-                # Grab project and MR deets.
-                project = payload.get('project', {})
-                project_id = project.get('id')
-                project_path = project.get('path_with_namespace', 'unknown/project')
-                mr = payload.get('merge_request', {})
-                mr_iid = mr.get('iid')
-                mr_title = mr.get('title', 'Untitled MR')
-                mr_url = mr.get('url', '')
-
-                # Fetch changed files count (async, baby).
-                changed_files = await get_changed_files_count(project_id, mr_iid)
-
-                # Condition check.
-                if has_feature_label or changed_files > N_CHANGED_FILES:
-                    # Add to loom_reminders.
-                    db_manager.add_loom_reminder(
-                        dev=dev_username,
-                        mr_id=mr_iid,  # Using iid, change to id if you want global.
-                        title=mr_title,
-                        url=mr_url
-                    )
-                    print(f"{Fore.GREEN}✅ Loom reminder added for {dev_username} on MR !{mr_iid}")
-
-                    # Build the DM text.
-                    mr_ref = f"{project_path}!{mr_iid}"
-                    dm_text = (
-                        f"Feature closed: MR#{mr_ref} “{mr_title}” (automatic). "
-                        "Need Loom-note: • what, why, what QA and design should be looking for"
-                    )
-
-                    # Send DM if we can find Telegram ID.
-                    telegram_id = db_manager.get_telegram_id(dev_username)
-                    if telegram_id and bot_manager and bot_manager.bot_instance:
-                        await bot_manager.send_message_to_chat(telegram_id, dm_text)
-                        print(f"{Fore.GREEN}✅ DM fired to {dev_username} ({telegram_id})")
-                    else:
-                        print(f"{Fore.YELLOW}⚠️ No Telegram ID or bot for {dev_username}. Skipped DM.")
-
-        return {"status": "processed", "user": dev_username, "event_type": event_type}
+    # Once in the inbox the hook is safe; if the queue filled up meanwhile, wait for room rather than strand it
+    job = (inbox_id, payload, received_at, key, False)
+    inbox_in_flight.add(inbox_id)
+    if not webhook_worker.submit(job):
+        await webhook_worker.submit_wait(job)
+    return {"status": "accepted", "event_type": payload['object_kind']}
 
-    except Exception as e:
-        print(f"{Fore.RED}❌ Error processing GitLab webhook: {e}")
-        raise HTTPException(status_code=400, detail="Invalid webhook payload")
 
+async def process_gitlab_webhook(job):
+    """Worker stage for one acked webhook: store the event, then merged-MR Loom reminder logic.
+    Once it returns or fails, an entry still in the inbox is up to sweep_webhook_inbox."""
+    try:
+        await _process_gitlab_webhook(*job)
+    finally:
+        inbox_in_flight.discard(job[0])
+
+
+async def _process_gitlab_webhook(inbox_id, payload, received_at, key, stored):
+    record = normalize_event(payload)
+    event_type = record['type']
+    dev_username = record['username']
+    follow_up = record['follow_up']
+
+    print(f"{Fore.CYAN}📨 Processing GitLab webhook: {event_type} from {dev_username}")
+    if not stored:
+        # Without follow-up work the inbox entry is deleted together with the event insert
+        saved = await save_gitlab_webhook(dev_username, event_type, payload, received_at, key,
+                                          inbox_id=inbox_id, inbox_done=not follow_up, record=record)
+        if follow_up and saved is not None and not await asyncio.wrap_future(saved):
+            # A redelivery of a merge that was already handled: no second reminder
+            print(f"{Fore.YELLOW}⚠️ Duplicate delivery of MR merge from {dev_username}, skipped")
+            return
+
+    if follow_up:
+        await handle_merged_merge_request(dev_username, record)
+        if inbox_id is not None:
+            await async_db.finish_webhook_inbox([inbox_id])
+
+
+def report_task_failure(task: asyncio.Task):
+    """Done callback for background tasks: their exceptions are printed instead of being lost"""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"{Fore.RED}❌ Background task {task.get_coro().__name__} failed: {task.exception()!r}")
+
+
+async def replay_webhook_inbox(up_to_id: int, batch: int = 500) -> int:
+    """Run inbox entries left by a previous run (ids up to up_to_id) through the worker again"""
+    start = time.monotonic()
+    replayed, after_id = 0, 0
+    while True:
+        rows = await async_db.claim_webhook_inbox(after_id, up_to_id, batch)
+        if not rows:
+            break
+        await submit_inbox_rows(rows)
+        after_id = rows[-1][0]
+        replayed += len(rows)
+    if replayed:
+        await webhook_worker.join()
+        elapsed = time.monotonic() - start
+        print(f"{Fore.GREEN}✅ Replayed {replayed} webhooks from the inbox in {elapsed:.2f}s "
+              f"({replayed / max(elapsed, 1e-6):.0f}/s)")
+    return replayed
+
+
+async def submit_inbox_rows(rows: List[tuple]):
+    for inbox_id, received_at, body, key, stored in rows:
+        inbox_in_flight.add(inbox_id)
+        await webhook_worker.submit_wait((inbox_id, json.loads(body), received_at, key, bool(stored)))
+
+
+async def sweep_webhook_inbox(batch: int = 500) -> int:
+    """Resubmit inbox entries acked while running that nothing is working on any more (a failed attempt).
+    Entries younger than a sweep interval are left alone: their event may still be in gitlab_event_writer."""
+    received_before = (datetime.utcnow() - timedelta(seconds=WEBHOOK_INBOX_SWEEP_SECONDS)).isoformat()
+    rows = await async_db.claim_webhook_inbox(0, await async_db.webhook_inbox_high_water(), batch,
+                                              skip=frozenset(inbox_in_flight), received_before=received_before)
+    await submit_inbox_rows(rows)
+    if rows:
+        print(f"{Fore.YELLOW}🔁 Resubmitted {len(rows)} stranded webhooks from the inbox")
+    return len(rows)
+
+
+async def watch_webhook_inbox(up_to_id: int):
+    """Replay what the previous run left, then sweep every WEBHOOK_INBOX_SWEEP_SECONDS until cancelled"""
+    await replay_webhook_inbox(up_to_id)
+    while True:
+        await asyncio.sleep(WEBHOOK_INBOX_SWEEP_SECONDS)
+        try:
+            await sweep_webhook_inbox()
+        except Exception as e:
+            print(f"{Fore.RED}❌ Webhook inbox sweep failed: {e}")
+
+
+async def handle_merged_merge_request(dev_username: str, record: dict):
+    """Loom reminder + DM for merged MRs with the feature label or many changed files"""
+    has_feature_label = 'feature' in record['labels']
+
+    # Grab project and MR deets.
+    project_id = record['project_id']
+    project_path = record['project_path'] or 'unknown/project'
+    mr_iid = record['object_iid']
+    mr_title = record['object_title'] or 'Untitled MR'
+    mr_url = record['url'] or ''
+
+    # Only hit the GitLab API when the label alone doesn't decide it
+    if not has_feature_label and await get_changed_files_count(project_id, mr_iid) <= N_CHANGED_FILES:
+        return
+
+    # Add to loom_reminders.
+    await async_db.add_loom_reminder(
+        dev=dev_username,
+        mr_id=mr_iid,  # Using iid, change to id if you want global.
+        title=mr_title,
+        url=mr_url
+    )
+    print(f"{Fore.GREEN}✅ Loom reminder added for {dev_username} on MR !{mr_iid}")
 
-def extract_user_from_gitlab_payload(payload: dict) -> dict:
-    """Grab user info. For MRs, prefer the author if it's a merge."""
-    user = {}
-    event_type = payload.get('object_kind', 'unknown')
+    # Build the DM text.
+    mr_ref = f"{project_path}!{mr_iid}"
+    dm_text = (
+        f"Feature closed: MR#{mr_ref} “{mr_title}” (automatic). "
+        "Need Loom-note: • what, why, what QA and design should be looking for"
+    )
 
-    if event_type == 'merge_request' and 'merge_request' in payload:
-        # Use MR author for reminders, not the merger.
-        user = payload['merge_request'].get('author', {})
+    # Send DM if we can find Telegram ID.
+    telegram_id = await async_db.get_telegram_id(dev_username)
+    if telegram_id and bot_manager and bot_manager.bot_instance:
+        await bot_manager.send_message_to_chat(telegram_id, dm_text)
+        print(f"{Fore.GREEN}✅ DM fired to {dev_username} ({telegram_id})")
     else:
-        # Fallback to original logic.
-        if 'user' in payload:
-            user = payload['user']
-        elif 'user' in payload.get('object_attributes', {}):
-            user = payload['object_attributes']['user']
-        elif 'user' in payload.get('commit', {}):
-            user = payload['commit']['user']
-        elif 'author' in payload.get('commit', {}):
-            user = payload['commit']['author']
+        print(f"{Fore.YELLOW}⚠️ No Telegram ID or bot for {dev_username}. Skipped DM.")
+
 
-    return user
+webhook_worker = WebhookWorker(
+    process_gitlab_webhook,
+    workers=WEBHOOK_WORKERS,
+    max_queue=WEBHOOK_QUEUE_SIZE,
+    name='gitlab-webhook-worker'
+)
+# Inbox ids queued on or being handled by webhook_worker: the sweep leaves them alone
+inbox_in_flight = set()
 
 
 async def get_changed_files_count(project_id: int, mr_iid: int) -> int:
-    """Hit GitLab API for changed files count. If it flops, assume 0."""
-    try:
-        async with aiohttp.ClientSession() as session:
-            headers = {"Private-Token": GITLAB_TOKEN}
-            url = f"{GITLAB_URL}/projects/{project_id}/merge_requests/{mr_iid}/changes"
-            async with session.get(url, headers=headers) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return len(data.get('changes', []))
-                print(f"{Fore.RED}❌ GitLab API barfed: {resp.status}")
-                return 0
-    except Exception as e:
-        print(f"{Fore.RED}❌ API call exploded: {e}")
-        return 0
+    """Changed files count from the GitLab API (cached per MR). If it flops, assume 0."""
+    count = await gitlab_client.merge_request_changes_count(project_id, mr_iid)
+    return count if count is not None else 0
 
-def save_gitlab_webhook(dev: str, event_type: str, payload: dict):
-    """Save GitLab webhook to database"""
+async def save_gitlab_webhook(dev: str, event_type: str, payload: dict, received_at: str = None,
+                              key: str = None, inbox_id: int = None, inbox_done: bool = True, record: dict = None):
+    """Queue GitLab webhook for the next group commit; the returned Future is False for a redelivery"""
     try:
         event_type = payload.get('object_kind', 'unknown')
 
-        db_manager.add_gitlab_event(dev, event_type, payload)
-        print(f"{Fore.GREEN}✅ GitLab event saved for user: {dev}, type: {event_type}")
+        row = db_manager.gitlab_event_row(dev, payload, received_at, delivery_key=key, record=record)
+        row['inbox_id'] = inbox_id
+        row['inbox_done'] = inbox_done
+        future = gitlab_event_writer.put(row)
+        print(f"{Fore.GREEN}✅ GitLab event queued for user: {dev}, type: {event_type}")
+        return future
     except Exception as e:
         print(f"{Fore.RED}❌ Error saving GitLab event: {e}")
 
@@ -1323,32 +2571,32 @@ class GoogleSheetsTimeTracker:
 
 
 class TimeTrackingIntegration:
-    def __init__(self, db_manager: DatabaseManager, sheets_tracker: GoogleSheetsTimeTracker):
-        self.db_manager = db_manager
+    def __init__(self, async_db: AsyncDatabase, sheets_tracker: GoogleSheetsTimeTracker):
+        self.async_db = async_db
         self.sheets_tracker = sheets_tracker
 
-    async def check_missing_time_entries(self, dev_username: str, days_back: int = 7) -> List[Dict]:
+    async def check_missing_time_entries(self, dev_username: str, days_back: int = 7,
+                                         daily_activity: List[dict] = None) -> List[Dict]:
         """
         Check for GitLab activity without corresponding time entries
 
+        daily_activity: the developer's rollup rows, when the caller fetched them for the whole team
+
         Returns list of dates with missing time entries
         """
         missing_entries = []
 
-        # Get GitLab events for the period
-        gitlab_events = self.db_manager.get_gitlab_events(dev_username, days_back * 24)
+        # Per-day event counts for the period, from the daily rollup
+        if daily_activity is None:
+            daily_activity = await self.async_db.get_daily_activity(dev_username, days_back)
 
-        if not gitlab_events:
+        if not daily_activity:
             return missing_entries
 
-        # Extract unique dates from GitLab events
-        event_dates = set()
-        for event in gitlab_events:
-            try:
-                event_date = datetime.fromisoformat(event['ts']).strftime("%Y-%m-%d")
-                event_dates.add(event_date)
-            except (ValueError, KeyError):
-                continue
+        activity_by_date = {}
+        for row in daily_activity:
+            activity_by_date.setdefault(row['local_date'], []).append(row)
+        event_dates = set(activity_by_date)
 
         # Check time entries for all dates at once
         time_entries_status = self.sheets_tracker.check_multiple_dates(
@@ -1360,15 +2608,12 @@ class TimeTrackingIntegration:
             has_entry, time_entry = time_entries_status.get(date, (False, None))
 
             if not has_entry:
-                # Get GitLab events for this specific date
-                date_events = [
-                    event for event in gitlab_events
-                    if datetime.fromisoformat(event['ts']).strftime("%Y-%m-%d") == date
-                ]
+                # Event type counts for this specific date
+                date_events = activity_by_date[date]
 
                 missing_entries.append({
                     'date': date,
-                    'gitlab_events_count': len(date_events),
+                    'gitlab_events_count': sum(event['count'] for event in date_events),
                     'gitlab_events': date_events,
                     'time_entry': time_entry,
                     'severity': 'missing' if not time_entry else 'incomplete'
@@ -1401,9 +2646,9 @@ class TimeTrackingIntegration:
             message_parts.append(f"📅 {formatted_date} - {events_count} GitLab event(s)")
 
             # Show some activity details
-            for event in entry['gitlab_events'][:2]:  # Show max 2 events per day
+            for event in entry['gitlab_events'][:2]:  # Show max 2 event types per day
                 event_type = event.get('type', 'activity')
-                message_parts.append(f"   • {event_type.replace('_', ' ').title()}")
+                message_parts.append(f"   • {event_type.replace('_', ' ').title()} × {event.get('count', 1)}")
 
             if len(entry['gitlab_events']) > 2:
                 message_parts.append(f"   • ... and {len(entry['gitlab_events']) - 2} more")
@@ -1433,7 +2678,7 @@ async def check_timesheet_compliance():
             developers_config=developers_config
         )
 
-        integration = TimeTrackingIntegration(db_manager, sheets_tracker)
+        integration = TimeTrackingIntegration(async_db, sheets_tracker)
 
         # Check each developer
         for dev_username in developers_config.keys():
@@ -1522,7 +2767,7 @@ async def check_user_timesheet(request: TimesheetCheckRequest):
             developers_config=developers_config
         )
 
-        integration = TimeTrackingIntegration(db_manager, sheets_tracker)
+        integration = TimeTrackingIntegration(async_db, sheets_tracker)
 
         # Check for missing entries
         missing_entries = await integration.check_missing_time_entries(
@@ -1563,16 +2808,19 @@ async def check_user_timesheet(request: TimesheetCheckRequest):
 
 
 @app.get("/timesheet/check/{username}")
-async def check_user_timesheet_simple(username: str, days_back: int = 7):
+async def check_user_timesheet_simple(request: Request, username: str, days_back: int = 7):
     """
     Simple GET endpoint for timesheet check (for easier testing)
     """
-    request = TimesheetCheckRequest(
+    check = TimesheetCheckRequest(
         username=username,
         days_back=days_back,
         send_reminder=False
     )
-    return await check_user_timesheet(request)
+    result = (await check_user_timesheet(check)).model_dump()
+    # Sheets data isn't versioned here: validate on the result, minus its timestamp
+    etag = make_etag('timesheet', {key: value for key, value in result.items() if key != 'checked_at'})
+    return conditional_json(request, result, etag)
 
 
 @app.post("/timesheet/check-all")
@@ -1590,13 +2838,16 @@ async def check_all_timesheets(days_back: int = 7):
             developers_config=developers_config
         )
 
-        integration = TimeTrackingIntegration(db_manager, sheets_tracker)
+        integration = TimeTrackingIntegration(async_db, sheets_tracker)
+        # GitLab activity of the whole team in one query; only the Sheets lookups stay per developer
+        team_activity = await async_db.get_daily_activity_for_users(list(developers_config), days_back)
 
         for username in developers_config.keys():
             try:
                 print(f"{Fore.MAGENTA}📊 Проверка для: {username}")
 
-                missing_entries = await integration.check_missing_time_entries(username, days_back)
+                missing_entries = await integration.check_missing_time_entries(
+                    username, days_back, daily_activity=team_activity[username])
 
                 reminder_message = ""
                 if missing_entries:
@@ -1675,8 +2926,8 @@ async def get_timesheet_entry(username: str, date: str):
 
 
 class UserDigestScheduler:
-    def __init__(self, db_manager, bot_manager=None, sheets_tracker=None):
-        self.db_manager = db_manager
+    def __init__(self, async_db: AsyncDatabase, bot_manager=None, sheets_tracker=None):
+        self.async_db = async_db
         self.bot_manager = bot_manager or globals().get('bot_manager')
         self.sheets_tracker = sheets_tracker or GoogleSheetsTimeTracker(
             credentials_file=GOOGLE_CREDENTIALS_FILE,
@@ -1717,11 +2968,10 @@ class UserDigestScheduler:
     async def send_user_morning_digest(self, username: str, config: Dict[str, Any]):
         """Send the damn digest. Uses existing functions, no reinvention."""
         try:
-            yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+            yesterday = (datetime.now(dev_timezone(username)) - timedelta(days=1)).strftime("%Y-%m-%d")
 
-            # GitLab: Use existing get_facts_for_user, filter to yesterday
-            facts = self.db_manager.get_facts_for_user(username)  # Buffer for timezone BS
-            gitlab_data = self._filter_facts_to_date(facts, yesterday)
+            # GitLab: counts for yesterday straight from the daily rollup
+            gitlab_data = await self.async_db.get_daily_digest_data(username, yesterday)
 
             # Timesheet: Use the real checker now, you lazy bastard
             timesheet_data = await self.get_timesheet_for_date(username, yesterday)
@@ -1741,21 +2991,6 @@ class UserDigestScheduler:
         except Exception as e:
             print(f"{Fore.RED}❌ Digest for {username} exploded: {e}")
 
-    def _filter_facts_to_date(self, facts: dict, date: str) -> dict:
-        """Filter existing facts to one date. Simple, unlike your original mess."""
-        if not facts:
-            return {'total_events': 0, 'activities': [], 'event_summary': {}}
-
-        daily_activities = [
-            act for act in facts.get('activities', [])
-            if act['timestamp'].startswith(date)
-        ]
-        return {
-            'total_events': len(daily_activities),
-            'activities': daily_activities,
-            'event_summary': Counter(act['type'] for act in daily_activities)
-        }
-
     async def get_timesheet_for_date(self, username: str, date: str) -> dict:
         """Actual implementation using sheets_tracker. No more fake data, princess."""
         try:
@@ -1805,15 +3040,15 @@ class UserDigestScheduler:
 
 
 @app.get("/digest/generate/{username}")
-async def generate_user_digest(username: str):
+async def generate_user_digest(request: Request, username: str):
     """Generate digest without the old bloat. If it breaks again, it's on you."""
     try:
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        facts = db_manager.get_facts_for_user(username)  # Grab extra for timezone fuckery
-        gitlab_data = UserDigestScheduler(db_manager)._filter_facts_to_date(facts, yesterday)
-        timesheet_data = await UserDigestScheduler(db_manager).get_timesheet_for_date(username, yesterday)
-        message = UserDigestScheduler(db_manager).format_user_morning_digest(username, yesterday, gitlab_data, timesheet_data)
-        return {"status": "success", "username": username, "date": yesterday, "message": message}
+        yesterday = (datetime.now(dev_timezone(username)) - timedelta(days=1)).strftime("%Y-%m-%d")
+        gitlab_data = await async_db.get_daily_digest_data(username, yesterday)
+        timesheet_data = await UserDigestScheduler(async_db).get_timesheet_for_date(username, yesterday)
+        message = UserDigestScheduler(async_db).format_user_morning_digest(username, yesterday, gitlab_data, timesheet_data)
+        return conditional_json(request, {"status": "success", "username": username, "date": yesterday,
+                                          "message": message})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Digest blew up again: {str(e)}. Maybe sacrifice a goat?")
 
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+
+class WebhookWorker:
+    """Runs ``handler(job)`` for queued webhook jobs on a few asyncio worker tasks.
+
+    The endpoint only validates and calls ``submit``; slow work (GitLab API
+    lookups, DB writes, Telegram DMs) happens here, after the hook was acked.
+    ``submit`` returns False when the queue is full so the caller can shed load.
+    """
+
+    def __init__(self, handler, workers: int = 4, max_queue: int = 10000, name: str = 'webhook-worker'):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.name = name
+
+        # Monitoring counters
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_wait_ms = 0.0
+        self.max_handle_ms = 0.0
+        self._total_wait_ms = 0.0
+        self._total_handle_ms = 0.0
+
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        """Create the queue and worker tasks on the running event loop"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._run(), name=f"{self.name}-{i}") for i in range(self.workers)]
+
+    def submit(self, job) -> bool:
+        if self._queue is None:
+            self.start()
+        try:
+            self._queue.put_nowait((time.monotonic(), job))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    async def submit_wait(self, job):
+        """Like submit, but waits for queue space instead of rejecting (used for replay)"""
+        if self._queue is None:
+            self.start()
+        await self._queue.put((time.monotonic(), job))
+        self.submitted += 1
+
+    @property
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self):
+        while True:
+            enqueued_at, job = await self._queue.get()
+            start = time.monotonic()
+            try:
+                await self.handler(job)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ [{self.name}] job failed: {e}")
+            finally:
+                wait_ms = (start - enqueued_at) * 1000
+                handle_ms = (time.monotonic() - start) * 1000
+                self._total_wait_ms += wait_ms
+                self._total_handle_ms += handle_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+                self.max_handle_ms = max(self.max_handle_ms, handle_ms)
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until every queued job has been handled"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish queued jobs (up to timeout), then cancel the workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ [{self.name}] stopped with {self.depth} jobs still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        done = self.processed + self.failed
+        return {
+            'queue_depth': self.depth,
+            'submitted': self.submitted,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self._total_wait_ms / done, 3) if done else 0,
+            'max_wait_ms': round(self.max_wait_ms, 3),
+            'avg_handle_ms': round(self._total_handle_ms / done, 3) if done else 0,
+            'max_handle_ms': round(self.max_handle_ms, 3),
+        }
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from colorama import Fore
+
+
+class WriteBehindQueue:
+    """Collects rows in memory and hands them to ``flush_func`` in batches.
+
+    A batch is flushed when ``max_batch`` rows are waiting or when the oldest
+    row has waited ``max_delay_ms``, whichever comes first. ``flush_func``
+    receives a list of rows and is expected to write them in one transaction.
+    ``put`` returns a Future that resolves once the row's batch is committed;
+    if ``flush_func`` returns one result per row, the Future carries that result.
+
+    A failed flush is retried ``retries`` times with exponential backoff (a locked
+    or busy database usually clears up). If it still fails, the rows are written one
+    by one, so only the rows that really can't be stored get the exception.
+    """
+
+    def __init__(self, flush_func, max_batch: int = 200, max_delay_ms: float = 20, name: str = 'write-behind',
+                 retries: int = 3, retry_backoff_ms: float = 100):
+        self.flush_func = flush_func
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay_ms / 1000.0
+        self.name = name
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff_ms / 1000.0
+
+        # Monitoring counters
+        self.rows_flushed = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.flush_retries = 0
+        self.rows_failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, row) -> Future:
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            self._items.append((time.monotonic(), row, future))
+            if len(self._items) >= self.max_batch or len(self._items) == 1:
+                self._cond.notify()
+        return future
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if not self._items and self._closed:
+                    return
+                # Wait for a full batch or until the oldest row is due
+                while not self._closed and len(self._items) < self.max_batch:
+                    remaining = self._items[0][0] + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._items.popleft() for _ in range(min(self.max_batch, len(self._items)))]
+            self._flush(batch)
+
+    def _write(self, batch, retries: int):
+        """flush_func with retries; raises the last error once they are used up"""
+        for attempt in range(retries + 1):
+            try:
+                return self.flush_func([row for _, row, _ in batch])
+            except Exception:
+                self.flush_errors += 1
+                if attempt == retries:
+                    raise
+                self.flush_retries += 1
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _flush(self, batch, retries: int = None):
+        start = time.perf_counter()
+        try:
+            results = self._write(batch, self.retries if retries is None else retries)
+        except Exception as e:
+            if len(batch) > 1:
+                # Isolate the rows that can't be written (one attempt each); the rest still go in
+                for item in batch:
+                    self._flush([item], retries=0)
+                return
+            self.rows_failed += 1
+            print(f"{Fore.RED}❌ {self.name}: row not written: {e}")
+            batch[0][2].set_exception(e)
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.rows_flushed += len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        if not isinstance(results, list) or len(results) != len(batch):
+            results = [True] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self, timeout: float = None):
+        """Flush everything still queued and stop the flusher thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.depth,
+            'rows_flushed': self.rows_flushed,
+            'flushes': self.flushes,
+            'flush_errors': self.flush_errors,
+            'flush_retries': self.flush_retries,
+            'rows_failed': self.rows_failed,
+            'avg_batch_size': round(self.rows_flushed / self.flushes, 2) if self.flushes else 0,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'avg_flush_ms': round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0,
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }